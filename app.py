@@ -1,15 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
-import gspread
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, g, has_request_context, copy_current_request_context
 from google.oauth2.service_account import Credentials
 import os
 from dotenv import load_dotenv
 import json
+import time
+import uuid
 from datetime import datetime
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 import sys
 from google_auth_oauthlib.flow import InstalledAppFlow
 from gas_integration import set_purchase_protection
+from sheets_client import SCOPES, get_sheets_pool, get_spreadsheet_id
+from sheet_cache import get_sheet_cache, read_sheet_values
+from sheet_writer import CellWriteBuffer
+from sheet_schema import get_column_resolver, require_columns, ensure_schema
+from purchase_no import get_purchase_no_allocator
+from file_lock import LOCK_DIR
+from user_directory import get_user_directory
+from system_log import get_system_log_writer, LogEvent, rotate_system_log, RETENTION_DAYS as SYSTEM_LOG_RETENTION_DAYS
+from system_log_index import query_system_log, get_log_names
+from master_data import get_master_data, MASTER_DATA_SHEETS
+from concurrent_fetch import fetch_concurrently
+from purchase_import import import_purchase_requests, ImportFileError
+from quota import get_quota_governor, execute_with_quota, QuotaExceededError
+from cache_refresher import get_cache_refresher
+from sheet_mirror import get_sheet_mirror
 import io
 import pandas as pd
 from googleapiclient.http import MediaIoBaseDownload
@@ -28,52 +44,28 @@ app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
 if os.getenv('RAILWAY_ENVIRONMENT'):
     app.config['PREFERRED_URL_SCHEME'] = 'https'
 
-# Google Sheets API 設定
-SCOPES = [
-    'https://www.googleapis.com/auth/spreadsheets',
-    'https://www.googleapis.com/auth/drive'
-]
-
 def get_google_sheets_client():
-    """建立Google Sheets客戶端"""
+    """取得Google Sheets客戶端（由連線池共用憑證與連線）"""
     try:
-        # 從環境變數或服務帳戶金鑰檔案讀取憑證
-        service_account_info = os.getenv('GOOGLE_SERVICE_ACCOUNT_INFO')
-        if service_account_info:
-            creds_dict = json.loads(service_account_info)
-        else:
-            # 如果沒有環境變數，嘗試從檔案讀取
-            creds_dict = json.load(open('service-account-key.json'))
-        
-        creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-        client = gspread.authorize(creds)
-        return client
+        return get_sheets_pool().get_client()
     except Exception as e:
         print(f"Google Sheets 客戶端建立失敗: {e}")
         return None
 
+def get_spreadsheet():
+    """取得快取的試算表物件"""
+    return get_sheets_pool().get_spreadsheet(get_spreadsheet_id())
+
+def get_worksheet(sheet_name):
+    """取得快取的工作表物件"""
+    return get_sheets_pool().get_worksheet(sheet_name, get_spreadsheet_id())
+
 def verify_credentials(username, password):
     """驗證使用者帳號密碼"""
     try:
-        client = get_google_sheets_client()
-        if not client:
-            return False, "無法連接到Google Sheets"
-        
-        # 開啟試算表（需要設定試算表ID）
-        spreadsheet_id = os.getenv('SPREADSHEET_ID', '1ZB6ri0fzqTRk_ciHibcGXEuViNmW1Ag9kkazE8A5iKc')
-        if not spreadsheet_id:
-            return False, "未設定試算表ID"
-        
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('使用者帳號')  # 工作表名稱
-        
-        # 取得所有資料
-        all_records = worksheet.get_all_records()
-        
-        # 檢查帳號密碼
-        for record in all_records:
-            if record.get('帳號') == username and record.get('密碼') == password:
-                return True, "登入成功"
+        # 由快取的使用者目錄驗證（快照有效期間內不讀取工作表）
+        if get_user_directory().authenticate(username, password):
+            return True, "登入成功"
         
         return False, "帳號或密碼錯誤"
         
@@ -82,16 +74,11 @@ def verify_credentials(username, password):
         return False, "系統錯誤，請稍後再試"
 
 def get_dropdown_list(sheet_name, col_name):
-    """從Google Sheets取得下拉選單資料"""
+    """從Google Sheets取得下拉選單資料（主檔工作表由主檔快取提供）"""
     try:
-        client = get_google_sheets_client()
-        if not client:
-            return []
-        spreadsheet_id = os.getenv('SPREADSHEET_ID', '1ZB6ri0fzqTRk_ciHibcGXEuViNmW1Ag9kkazE8A5iKc')
-        if not spreadsheet_id:
-            return []
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet(sheet_name)
+        if sheet_name in MASTER_DATA_SHEETS:
+            return get_master_data().get_list(sheet_name, col_name)
+        worksheet = get_worksheet(sheet_name)
         records = worksheet.get_all_records()
         return [r[col_name] for r in records if col_name in r and r[col_name]]
     except Exception as e:
@@ -100,87 +87,100 @@ def get_dropdown_list(sheet_name, col_name):
 
 def get_safe_records(worksheet):
     """安全地從工作表取得記錄，處理重複標題問題"""
+    headers, records, numericised = read_sheet_values(worksheet)
+    return records
+
+def get_purchase_records():
+    """取得請購單記錄（由快照快取提供，過期才重新讀取）"""
+    return get_sheet_cache('請購單').get_records()
+
+# 使用者資料異動戳記檔（所有 worker 共用），修改時間晚於 session 載入時間即重新讀取
+USER_PROFILE_STAMP_FILE = os.path.join(LOCK_DIR, 'hrsystem_user_profile.stamp')
+
+def invalidate_user_profiles():
+    """使所有 session 內快取的使用者資料失效（使用者資料被修改或刪除時呼叫）"""
     try:
-        return worksheet.get_all_records()
-    except Exception as e:
-        if "duplicates" in str(e):
-            print("DEBUG: 檢測到重複標題，使用手動標題設定")
-            # 取得第一行作為標題
-            headers = worksheet.row_values(1)
-            # 清理重複和空標題
-            cleaned_headers = []
-            for i, header in enumerate(headers):
-                if header:
-                    cleaned_headers.append(header)
-                else:
-                    cleaned_headers.append(f'Column_{i+1}')
-            
-            # 取得所有資料行
-            all_values = worksheet.get_all_values()
-            if len(all_values) > 1:
-                data_rows = all_values[1:]  # 跳過標題行
-                all_records = []
-                for row in data_rows:
-                    record = {}
-                    for i, value in enumerate(row):
-                        if i < len(cleaned_headers):
-                            record[cleaned_headers[i]] = value
-                    all_records.append(record)
-                return all_records
-            else:
-                return []
-        else:
-            raise e
+        with open(USER_PROFILE_STAMP_FILE, 'a'):
+            pass
+        os.utime(USER_PROFILE_STAMP_FILE, None)
+    except OSError as e:
+        print(f"更新使用者資料戳記失敗: {e}")
+
+def user_profiles_changed_at():
+    """取得使用者資料最後異動時間，尚未異動過時為 0"""
+    try:
+        return os.path.getmtime(USER_PROFILE_STAMP_FILE)
+    except OSError:
+        return 0
+
+def store_session_profile(profile, loaded_at):
+    """將登入者的姓名、mail與role存入 session（loaded_at 為開始讀取的時間）"""
+    session['user_profile'] = dict(profile)
+    session['user_profile_loaded_at'] = loaded_at
+    session['role'] = profile.get('role', '')
+
+def load_user_info(username):
+    """自使用者目錄取得姓名、mail與role，找不到時回傳 None"""
+    return get_user_directory().get_profile(username)
 
 def get_user_info(username):
-    """依帳號取得姓名、mail與role"""
+    """依帳號取得姓名、mail與role
+
+    登入者的資料優先取自 session（登入時載入），其他帳號在同一個請求內只讀取一次
+    """
+    empty_info = {'name': '', 'mail': '', 'role': ''}
     try:
-        client = get_google_sheets_client()
-        if not client:
-            return {'name': '', 'mail': '', 'role': ''}
-        spreadsheet_id = os.getenv('SPREADSHEET_ID', '1ZB6ri0fzqTRk_ciHibcGXEuViNmW1Ag9kkazE8A5iKc')
-        if not spreadsheet_id:
-            return {'name': '', 'mail': '', 'role': ''}
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('使用者帳號')
-        records = get_safe_records(worksheet)
-        for r in records:
-            if r.get('帳號') == username:
-                return {
-                    'name': r.get('姓名', ''),
-                    'mail': r.get('mail', ''),
-                    'role': r.get('角色', '')
-                }
-        return {'name': '', 'mail': '', 'role': ''}
+        is_session_user = has_request_context() and session.get('username') == username
+        if is_session_user and 'user_profile' in session:
+            if session.get('user_profile_loaded_at', 0) >= user_profiles_changed_at():
+                return dict(session['user_profile'])
+        
+        # 請求範圍內的備援快取
+        memo = g.setdefault('user_info_memo', {}) if has_request_context() else {}
+        if username not in memo:
+            # 以開始讀取的時間為準，讀取期間若有異動下次仍會重新載入
+            loaded_at = time.time()
+            profile = load_user_info(username)
+            if profile is None:
+                return empty_info
+            memo[username] = profile
+            if is_session_user:
+                store_session_profile(profile, loaded_at)
+        return dict(memo[username])
     except Exception as e:
         print(f"取得user info失敗: {e}")
-        return {'name': '', 'mail': '', 'role': ''}
+        return empty_info
 
 def generate_purchase_no():
-    """產生請購單號 (YYYYmmdd-流水號)，確保在請購單唯一且連號"""
+    """產生請購單號 (YYYYmmdd-流水號)，由跨行程配號器配發，確保在請購單唯一且連號"""
+    return get_purchase_no_allocator().allocate_one()
+
+# 請購單每個品項的表單欄位
+LINE_ITEM_FIELDS = ['item_name', 'spec', 'quantity', 'unit', 'need_date', 'purpose', 'note']
+
+def parse_line_items(form):
+    """由表單取出多個品項（各欄位以相同名稱重複送出），略過未填品名的列"""
+    columns = {field: form.getlist(field) for field in LINE_ITEM_FIELDS}
+    count = max(len(values) for values in columns.values())
+    items = []
+    for i in range(count):
+        item = {field: (values[i] if i < len(values) else '') for field, values in columns.items()}
+        if str(item['item_name']).strip():
+            items.append(item)
+    return items
+
+def format_purchase_no_range(purchase_nos):
+    """連續請購單號以「起~迄」表示"""
+    if len(purchase_nos) == 1:
+        return purchase_nos[0]
+    return f'{purchase_nos[0]}~{purchase_nos[-1]}'
+
+def preview_purchase_no():
+    """預覽下一個請購單號（新增頁面顯示用，實際單號於送出時配發）"""
     try:
-        client = get_google_sheets_client()
-        if not client:
-            return datetime.now().strftime('%Y%m%d-001')
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        today = datetime.now().strftime('%Y%m%d')
-        records = worksheet.get_all_records()
-        # 收集今天所有已用過的流水號
-        seqs = []
-        for r in records:
-            no = str(r.get('請購單號', ''))
-            if no.startswith(today):
-                try:
-                    seq = int(no.split('-')[1])
-                    seqs.append(seq)
-                except:
-                    continue
-        next_seq = max(seqs) + 1 if seqs else 1
-        return f"{today}-{next_seq:03d}"
+        return get_purchase_no_allocator().peek()
     except Exception as e:
-        print(f"產生請購單號失敗: {e}")
+        print(f"預覽請購單號失敗: {e}")
         return datetime.now().strftime('%Y%m%d-001')
 
 def upload_to_drive(file_storage, folder_id):
@@ -212,7 +212,6 @@ def upload_to_drive(file_storage, folder_id):
         
         filename = file_storage.filename
         # 使用更安全的臨時檔案名稱，避免中文檔名問題
-        import uuid
         temp_filename = f"tmp_{uuid.uuid4().hex}_{filename}"
         temp_path = temp_filename
         file_storage.save(temp_path)
@@ -221,7 +220,7 @@ def upload_to_drive(file_storage, folder_id):
             'parents': [folder_id]
         }
         media = MediaFileUpload(temp_path, resumable=True)
-        file = service.files().create(body=file_metadata, media_body=media, fields='id,webViewLink,webContentLink').execute()
+        file = execute_with_quota(service.files().create(body=file_metadata, media_body=media, fields='id,webViewLink,webContentLink'), idempotent=False)
         
         print('建立成功:', file)
         print('檔案ID:', file.get('id'))
@@ -235,11 +234,11 @@ def upload_to_drive(file_storage, folder_id):
                 'type': 'anyone',
                 'role': 'reader'
             }
-            service.permissions().create(
+            execute_with_quota(service.permissions().create(
                 fileId=file.get('id'),
                 body=permission,
                 fields='id'
-            ).execute()
+            ))
             print('檔案權限設定成功')
         except Exception as perm_error:
             print(f'設定檔案權限失敗: {perm_error}')
@@ -284,23 +283,133 @@ def login():
             flash('請輸入帳號和密碼', 'error')
             return render_template('login.html')
         
-        success, message = verify_credentials(username, password)
+        # 帳號驗證與使用者資料取自同一份使用者目錄，快取有效時不需任何 API 呼叫
+        try:
+            loaded_at = time.time()
+            user_info = get_user_directory().authenticate(username, password)
+        except Exception as e:
+            print(f"驗證過程發生錯誤: {e}")
+            flash('系統錯誤，請稍後再試', 'error')
+            return render_template('login.html')
         
-        if success:
+        if user_info:
             session['logged_in'] = True
             session['username'] = username
-            user_info = get_user_info(username)
-            session['role'] = user_info.get('role', '')
+            # 登入時將使用者資料存入 session，之後的請求不再讀取使用者帳號工作表
+            store_session_profile(user_info, loaded_at)
             now = datetime.now().strftime('%Y%m%d %H:%M')
-            write_system_log(user_info.get('name', username), login_time=now)
-            flash(message, 'success')
+            # 登入日誌由背景寫入器寫入，不延遲轉址；列號寫入後再存入 session
+            session.pop('log_row', None)
+            session.pop('log_epoch', None)
+            session['log_id'] = write_system_log(user_info.get('name', username), login_time=now)
+            flash('登入成功', 'success')
             return redirect(url_for('dashboard'))
         else:
-            flash(message, 'error')
+            flash('帳號或密碼錯誤', 'error')
             return render_template('login.html')
     
     return render_template('login.html')
 
+# 視為已核准的簽核狀態值
+APPROVED_STATUSES = ['核准', 'approved', 'APPROVED', 'Approved', '已核准', '已批准']
+
+# 待簽核筆數的鏡像查詢條件（與逐筆計算的規則相同）
+MANUFACTURING_PENDING_SQL = "department != '研發部' AND sign_status = '待簽核'"
+RD_PENDING_SQL = "department = '研發部' AND sign_status IN ('待簽核', '')"
+
+def search_date_key(value):
+    """搜尋條件的日期 (YYYY-mm-dd) 轉為 YYYYMMDD，無法解析時為 None"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y%m%d')
+    except (TypeError, ValueError):
+        return None
+
+def purchase_search_filter(search_type, data):
+    """
+    將請購單搜尋條件轉為鏡像查詢條件（規則與逐筆比對相同）
+    
+    Args:
+        search_type: 搜尋類型
+        data: 搜尋條件
+    
+    Returns:
+        (SQL 條件, 參數)；無法以 SQL 表示的搜尋類型（簽核狀態）為 None
+    """
+    if search_type == 'purchase_no':
+        purchase_no = data.get('purchase_no', '').strip()
+        if not purchase_no:
+            return '0', ()
+        return 'instr(purchase_no, ?) > 0', (purchase_no,)
+    
+    if search_type == 'purchase_no_range':
+        start = data.get('start_purchase_no', '').strip()
+        end = data.get('end_purchase_no', '').strip()
+        if not start and not end:
+            return "purchase_no != ''", ()
+        if start and not end:
+            return "purchase_no != '' AND purchase_no >= ?", (start,)
+        if end and not start:
+            return "purchase_no != '' AND purchase_no <= ?", (end,)
+        try:
+            start_num = int(start.replace('-', ''))
+            end_num = int(end.replace('-', ''))
+        except ValueError:
+            return "purchase_no != '' AND purchase_no BETWEEN ? AND ?", (start, end)
+        # 請購單號非數字的記錄改用字串比較
+        return ("purchase_no != '' AND (purchase_no_num BETWEEN ? AND ? "
+                "OR (purchase_no_num IS NULL AND purchase_no BETWEEN ? AND ?))"), (start_num, end_num, start, end)
+    
+    if search_type == 'create_date':
+        start_key = search_date_key(data.get('start_date', ''))
+        end_key = search_date_key(data.get('end_date', ''))
+        if not start_key or not end_key:
+            return '0', ()
+        return 'purchase_date BETWEEN ? AND ?', (start_key, end_key)
+    
+    if search_type == 'department':
+        department = data.get('department', '').strip()
+        if not department:
+            return '0', ()
+        return 'department = ?', (department,)
+    
+    if search_type == 'applicant':
+        applicant = data.get('applicant', '').strip()
+        if not applicant:
+            return '0', ()
+        return 'instr(applicant, ?) > 0', (applicant,)
+    
+    if search_type == 'custom':
+        conditions, params = [], []
+        custom_purchase_no = data.get('custom_purchase_no', '').strip()
+        if custom_purchase_no:
+            conditions.append('instr(purchase_no, ?) > 0')
+            params.append(custom_purchase_no)
+        custom_department = data.get('custom_department', '').strip()
+        if custom_department:
+            conditions.append('department = ?')
+            params.append(custom_department)
+        custom_applicant = data.get('custom_applicant', '').strip()
+        if custom_applicant:
+            conditions.append('instr(applicant, ?) > 0')
+            params.append(custom_applicant)
+        custom_approval_status = data.get('custom_approval_status', '').strip()
+        if custom_approval_status:
+            conditions.append('sign_status = ?')
+            params.append(custom_approval_status)
+        if data.get('custom_start_date', '') and data.get('custom_end_date', ''):
+            start_key = search_date_key(data.get('custom_start_date'))
+            end_key = search_date_key(data.get('custom_end_date'))
+            if not start_key or not end_key:
+                return '0', ()
+            # 沒有請購日期的記錄不受日期條件限制
+            conditions.append("(purchase_date_raw = '' OR purchase_date BETWEEN ? AND ?)")
+            params.extend([start_key, end_key])
+        return ' AND '.join(conditions) or '1', tuple(params)
+    
+    if search_type in ['approval_status']:
+        return None
+    return '0', ()
+
 @app.route('/dashboard')
 def dashboard():
     """儀表板頁面"""
@@ -308,14 +417,16 @@ def dashboard():
         return redirect(url_for('index'))
     
     try:
-        # 計算製造部門待簽核筆數
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        mirror = get_sheet_mirror()
+        if mirror is not None:
+            # 由本機鏡像以索引計算筆數
+            return render_template('dashboard.html', 
+                                 username=session.get('username'),
+                                 manufacturing_pending_count=mirror.count('請購單', MANUFACTURING_PENDING_SQL),
+                                 rd_pending_count=mirror.count('請購單', RD_PENDING_SQL))
         
-        # 取得所有資料
-        all_records = get_safe_records(worksheet)
+        # 計算製造部門待簽核筆數
+        all_records = get_purchase_records()
         
         # 篩選製造部門的請購單（申請部門不等於研發部門）
         manufacturing_records = []
@@ -341,6 +452,8 @@ def dashboard():
                              username=session.get('username'),
                              manufacturing_pending_count=pending_count,
                              rd_pending_count=rd_pending_count)
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"取得待簽核筆數失敗: {e}")
         return render_template('dashboard.html', 
@@ -375,14 +488,18 @@ def purchase_approval(dept):
     dept_name = dept_names.get(dept, '未知部門')
     
     try:
-        # 從 Google Sheets 取得該部門的請購單資料
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 取得所有資料
-        all_records = get_safe_records(worksheet)
+        mirror = get_sheet_mirror()
+        if mirror is not None and dept in ['manufacturing', 'rd']:
+            # 由本機鏡像以索引查詢：狀態為「待簽核」或空，製造部門為研發部以外的部門
+            department_op = '!=' if dept == 'manufacturing' else '='
+            filtered_records = mirror.select('請購單', f"sign_status IN ('待簽核', '') AND department {department_op} '研發部'")
+            return render_template('purchase_approval.html', 
+                                 records=filtered_records, 
+                                 dept_name=dept_name,
+                                 dept_code=dept)
+        
+        # 從 Google Sheets 取得該部門的請購單資料（快照快取）
+        all_records = get_purchase_records()
         
         # 篩選請購單
         filtered_records = []
@@ -406,6 +523,8 @@ def purchase_approval(dept):
                              dept_name=dept_name,
                              dept_code=dept)
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"取得請購單資料失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -417,13 +536,12 @@ def get_manufacturing_pending_count():
         return jsonify({'success': False, 'message': '未登入'})
     
     try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        mirror = get_sheet_mirror()
+        if mirror is not None:
+            return jsonify({'success': True, 'count': mirror.count('請購單', MANUFACTURING_PENDING_SQL)})
         
         # 取得所有資料
-        all_records = get_safe_records(worksheet)
+        all_records = get_purchase_records()
         
         # 篩選製造部門的請購單（申請部門不等於研發部門）
         manufacturing_records = []
@@ -441,6 +559,8 @@ def get_manufacturing_pending_count():
         
         return jsonify({'success': True, 'count': pending_count})
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"取得待簽核筆數失敗: {e}")
         return jsonify({'success': False, 'message': f'取得失敗: {str(e)}'})
@@ -452,13 +572,12 @@ def get_rd_pending_count():
         return jsonify({'success': False, 'message': '未登入'})
     
     try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        mirror = get_sheet_mirror()
+        if mirror is not None:
+            return jsonify({'success': True, 'count': mirror.count('請購單', RD_PENDING_SQL)})
         
         # 取得所有資料
-        all_records = get_safe_records(worksheet)
+        all_records = get_purchase_records()
         
         # 篩選研發部門的請購單（申請部門等於研發部門）
         rd_records = [r for r in all_records if r.get('請購部門') == '研發部']
@@ -471,6 +590,8 @@ def get_rd_pending_count():
         
         return jsonify({'success': True, 'count': pending_count})
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"取得研發部門待簽核筆數失敗: {e}")
         return jsonify({'success': False, 'message': f'取得失敗: {str(e)}'})
@@ -482,26 +603,16 @@ def purchase_detail(purchase_no):
         return jsonify({'success': False, 'message': '未登入'})
     
     try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 取得所有資料
-        all_records = get_safe_records(worksheet)
-        
-        # 找到對應的請購單
-        purchase_record = None
-        for record in all_records:
-            if str(record.get('請購單號', '')).replace('-', '') == purchase_no:
-                purchase_record = record
-                break
+        # 依請購單號索引找到對應的請購單
+        row_index, purchase_record = get_sheet_cache('請購單').find(purchase_no)
         
         if not purchase_record:
             return jsonify({'success': False, 'message': '找不到請購單'})
         
         return jsonify({'success': True, 'data': purchase_record})
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"取得請購單詳細資料失敗: {e}")
         return jsonify({'success': False, 'message': f'取得失敗: {str(e)}'})
@@ -518,15 +629,18 @@ def receipt_management():
         if not client:
             raise Exception("無法建立 Google Sheets 客戶端")
         
-        spreadsheet_id = os.getenv('SPREADSHEET_ID', '1ZB6ri0fzqTRk_ciHibcGXEuViNmW1Ag9kkazE8A5iKc')
-        if not spreadsheet_id:
-            raise Exception("未設定試算表 ID")
-        
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 取得所有資料
-        all_records = get_safe_records(worksheet)
+        mirror = get_sheet_mirror()
+        if mirror is not None:
+            # 由本機鏡像預先篩選已核准（或簽核欄為空、需檢查其他欄位）且未設為唯讀的請購單，
+            # 以下逐筆處理只針對這些記錄
+            all_records = mirror.select(
+                '請購單',
+                f"sign_status IN ('', {', '.join('?' * len(APPROVED_STATUSES))}) AND edit_status != '唯讀'",
+                APPROVED_STATUSES
+            )
+        else:
+            # 取得所有資料
+            all_records = get_purchase_records()
         
         # 篩選已核准的請購單
         approved_records = []
@@ -551,7 +665,7 @@ def receipt_management():
             print(f"DEBUG: 請購單號 {record.get('請購單號', 'N/A')} 的簽核狀態: '{approval_status}'")
             
             # 檢查多種可能的核准狀態值
-            if approval_status in ['核准', 'approved', 'APPROVED', 'Approved', '已核准', '已批准']:
+            if approval_status in APPROVED_STATUSES:
                 # 為每個已核准的請購單設定預設驗收狀態（嘗試多個可能的欄位名稱）
                 receipt_status = (
                     record.get('驗收單狀態') or 
@@ -595,6 +709,8 @@ def receipt_management():
                              applicants=applicants,
                              current_user_name=user_info.get('name', username))
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"取得驗收單資料失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -611,21 +727,19 @@ def purchase_summary():
         if not client:
             raise Exception("無法建立 Google Sheets 客戶端")
         
-        spreadsheet_id = os.getenv('SPREADSHEET_ID', '1ZB6ri0fzqTRk_ciHibcGXEuViNmW1Ag9kkazE8A5iKc')
-        if not spreadsheet_id:
-            raise Exception("未設定試算表 ID")
-        
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 取得所有資料
-        all_records = get_safe_records(worksheet)
-        
-        # 篩選已核准的請購單
-        approved_records = []
-        for record in all_records:
-            if record.get('請購單簽核') == '核准':
-                approved_records.append(record)
+        mirror = get_sheet_mirror()
+        if mirror is not None:
+            # 由本機鏡像以索引查詢已核准的請購單
+            approved_records = mirror.select('請購單', "sign_status = '核准'")
+        else:
+            # 取得所有資料
+            all_records = get_purchase_records()
+            
+            # 篩選已核准的請購單
+            approved_records = []
+            for record in all_records:
+                if record.get('請購單簽核') == '核准':
+                    approved_records.append(record)
         
         # 按品名分組彙總
         summary_data = {}
@@ -678,10 +792,46 @@ def purchase_summary():
                              total_items=len(summary_list),
                              total_orders=len(approved_records))
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"取得採購清單失敗: {e}")
         return jsonify({'error': str(e)}), 500
 
+def queue_approval_cells(write_buffer, columns, row_index, status, reason, approver, approval_date):
+    """
+    將單筆請購單的簽核欄位加入寫入緩衝區
+    
+    Args:
+        write_buffer: CellWriteBuffer
+        columns: 請購單的 ColumnResolver
+        row_index: 工作表列號
+        status: 簽核狀態（待簽核/核准/駁回）
+        reason: 駁回原因
+        approver: 簽核人員
+        approval_date: 簽核日期 (YYYYMMDD)
+    """
+    approval_status_col = columns.col('請購單簽核')
+    approval_person_col = columns.col('請購單簽核人員')
+    approval_date_col = columns.col('請購單簽核日期')
+    reject_reason_col = columns.col('駁回原因說明')
+    
+    # 更新簽核狀態
+    if approval_status_col:
+        write_buffer.set(row_index, approval_status_col, status)
+    
+    # 更新簽核人員（只有當狀態為核准或駁回時才更新）
+    if approval_person_col and status in ['核准', '駁回']:
+        write_buffer.set(row_index, approval_person_col, approver)
+    
+    # 更新簽核日期（只有當狀態為核准或駁回時才更新）
+    if approval_date_col and status in ['核准', '駁回']:
+        write_buffer.set(row_index, approval_date_col, approval_date)
+    
+    # 更新請購單駁回原因（只有當狀態為駁回時才更新）
+    if reject_reason_col and status == '駁回':
+        write_buffer.set(row_index, reject_reason_col, reason)
+
 @app.route('/update-approval-status', methods=['POST'])
 def update_approval_status():
     """更新請購單簽核狀態"""
@@ -704,75 +854,39 @@ def update_approval_status():
         print(f"DEBUG: 當前登入者: {current_user_name}")
         
         # 更新 Google Sheets 中的簽核狀態
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        worksheet = get_worksheet('請購單')
         
-        # 取得欄位標題
-        headers = worksheet.row_values(1)
-        print(f"DEBUG: 欄位標題: {headers}")
-        
-        # 找到對應的請購單號
-        all_records = get_safe_records(worksheet)
-        row_index = None
-        
-        for i, record in enumerate(all_records, start=2):  # start=2 因為第1行是標題
-            if record.get('請購單號') == purchase_no:
-                row_index = i
-                break
+        # 依請購單號索引找到對應的列號（寫入前確認該列仍是這張請購單）
+        row_index, purchase_record = get_sheet_cache('請購單').locate(purchase_no, worksheet)
         
         if row_index is None:
             return jsonify({'success': False, 'message': '找不到請購單'})
         
-        # 找到相關欄位的索引
-        approval_status_col = None
-        approval_person_col = None
-        approval_date_col = None
-        reject_reason_col = None
-        
-        for i, header in enumerate(headers):
-            if header == '請購單簽核':
-                approval_status_col = i + 1  # gspread 使用 1-based 索引
-            elif header == '請購單簽核人員':
-                approval_person_col = i + 1
-            elif header == '請購單簽核日期':
-                approval_date_col = i + 1
-            elif header == '駁回原因說明':
-                reject_reason_col = i + 1
-        
-        print(f"DEBUG: 找到簽核狀態欄位 '{headers[approval_status_col-1] if approval_status_col else 'None'}' 在第 {approval_status_col} 欄")
-        print(f"DEBUG: 找到請購單簽核人員欄位 '{headers[approval_person_col-1] if approval_person_col else 'None'}' 在第 {approval_person_col} 欄")
-        print(f"DEBUG: 找到請購單簽核日期欄位 '{headers[approval_date_col-1] if approval_date_col else 'None'}' 在第 {approval_date_col} 欄")
-        print(f"DEBUG: 找到請購單駁回原因欄位 '{headers[reject_reason_col-1] if reject_reason_col else 'None'}' 在第 {reject_reason_col} 欄")
-        
-        # 準備更新的資料
-        updates = []
-        
-        # 更新簽核狀態
-        if approval_status_col:
-            updates.append((row_index, approval_status_col, status))
-        
-        # 更新簽核人員（只有當狀態為核准或駁回時才更新）
-        if approval_person_col and status in ['核准', '駁回']:
-            updates.append((row_index, approval_person_col, current_user_name))
+        # 由快取的欄位對照表取得相關欄位（gspread 使用 1-based 索引）
+        columns = get_column_resolver('請購單')
+        approval_status_col = columns.col('請購單簽核')
+        approval_person_col = columns.col('請購單簽核人員')
+        approval_date_col = columns.col('請購單簽核日期')
+        reject_reason_col = columns.col('駁回原因說明')
         
-        # 更新簽核日期（只有當狀態為核准或駁回時才更新）
-        if approval_date_col and status in ['核准', '駁回']:
-            current_date = datetime.now().strftime('%Y%m%d')
-            updates.append((row_index, approval_date_col, current_date))
+        print(f"DEBUG: 簽核狀態欄位: {approval_status_col}, 簽核人員欄位: {approval_person_col}, 簽核日期欄位: {approval_date_col}, 駁回原因欄位: {reject_reason_col}")
         
-        # 更新請購單駁回原因（只有當狀態為駁回時才更新）
-        if reject_reason_col and status == '駁回':
-            updates.append((row_index, reject_reason_col, reason))
+        # 準備更新的資料
+        write_buffer = CellWriteBuffer(worksheet)
+        current_date = datetime.now().strftime('%Y%m%d')
+        queue_approval_cells(write_buffer, columns, row_index, status, reason,
+                             current_user_name, current_date)
         
-        print(f"DEBUG: 準備更新 {len(updates)} 個欄位")
+        print(f"DEBUG: 準備更新 {len(write_buffer)} 個欄位")
         
-        # 執行更新
+        # 執行更新（單次 batch_update）
+        updates = write_buffer.flush()
         for row, col, value in updates:
-            worksheet.update_cell(row, col, value)
             print(f"DEBUG: 已更新第 {row} 行第 {col} 欄為: {value}")
         
+        # 同步修補請購單快照
+        get_sheet_cache('請購單').apply_cell_updates(updates)
+        
         return jsonify({
             'success': True, 
             'message': '簽核狀態已更新',
@@ -781,10 +895,85 @@ def update_approval_status():
             'approval_note': reason if status == '駁回' else ''
         })
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"更新簽核狀態失敗: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/update-approval-status/bulk', methods=['POST'])
+def update_approval_status_bulk():
+    """批次更新多筆請購單簽核狀態（單一快照定位並批次確認列號、單次 batch_update 寫入）
+    
+    請求格式（擇一）：
+        {"purchase_nos": ["20250718-001", ...], "status": "核准", "reason": ""}
+        {"items": [{"purchase_no": "...", "status": "駁回", "reason": "..."}, ...]}
+    """
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'success': False, 'message': '未登入'})
+    
+    try:
+        data = request.get_json() or {}
+        items = data.get('items')
+        if items is None:
+            status = data.get('status')
+            reason = data.get('reason', '')
+            items = [{'purchase_no': purchase_no, 'status': status, 'reason': reason}
+                     for purchase_no in data.get('purchase_nos') or []]
+        
+        items = [item for item in items if item.get('purchase_no') and item.get('status')]
+        if not items:
+            return jsonify({'success': False, 'message': '缺少必要參數'})
+        
+        # 取得當前登入者資訊
+        username = session.get('username', '')
+        user_info = get_user_info(username)
+        current_user_name = user_info.get('name', username)
+        print(f"DEBUG: 當前登入者: {current_user_name}，批次簽核 {len(items)} 筆")
+        
+        worksheet = get_worksheet('請購單')
+        cache = get_sheet_cache('請購單')
+        
+        # 所有請購單號從快照定位列號，並以一次 batch_get 確認請購單號儲存格
+        rows = cache.locate_many([item['purchase_no'] for item in items], worksheet)
+        columns = get_column_resolver('請購單')
+        current_date = datetime.now().strftime('%Y%m%d')
+        
+        write_buffer = CellWriteBuffer(worksheet)
+        updated = []
+        not_found = []
+        for item in items:
+            purchase_no = item['purchase_no']
+            row = rows.get(purchase_no)
+            if row is None:
+                not_found.append(purchase_no)
+                continue
+            queue_approval_cells(write_buffer, columns, row,
+                                 item['status'], item.get('reason', ''),
+                                 current_user_name, current_date)
+            updated.append(purchase_no)
+        
+        print(f"DEBUG: 準備更新 {len(write_buffer)} 個欄位，找不到的請購單: {not_found}")
+        
+        # 執行更新（單次 batch_update）並同步修補請購單快照
+        updates = write_buffer.flush()
+        cache.apply_cell_updates(updates)
+        
+        return jsonify({
+            'success': bool(updated),
+            'message': f'已更新 {len(updated)} 筆請購單' if updated else '找不到請購單',
+            'updated': updated,
+            'not_found': not_found,
+            'approver': current_user_name,
+            'approval_date': current_date
+        })
+        
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        print(f"批次更新簽核狀態失敗: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/update-receipt-approval', methods=['POST'])
 def update_receipt_approval():
     """更新驗收簽核狀態"""
@@ -811,66 +1000,40 @@ def update_receipt_approval():
         print(f"DEBUG: 當前登入者: {current_user_name}")
         
         # 更新 Google Sheets
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        worksheet = get_worksheet('請購單')
         
-        # 取得所有資料
-        all_records = get_safe_records(worksheet)
-        
-        # 找到對應的請購單
-        target_row = None
-        for i, record in enumerate(all_records, start=2):  # 從第2行開始（跳過標題行）
-            if str(record.get('請購單號', '')).replace('-', '') == purchase_no:
-                target_row = i
-                break
+        # 依請購單號索引找到對應的列號（寫入前確認該列仍是這張請購單）
+        target_row, purchase_record = get_sheet_cache('請購單').locate(purchase_no, worksheet)
         
         if not target_row:
             return jsonify({'success': False, 'message': '找不到指定的請購單'})
         
-        # 取得欄位標題
-        headers = worksheet.row_values(1)
-        print(f"DEBUG: 欄位標題: {headers}")
-        
-        # 找到驗收簽核相關欄位的索引
-        approval_person_col = None
-        approval_date_col = None
-        approval_status_col = None
-        approval_note_col = None
-        
-        for i, header in enumerate(headers):
-            if header == '驗收簽核人員':
-                approval_person_col = i + 1  # gspread 使用 1-based 索引
-            elif header == '驗收簽核日期':
-                approval_date_col = i + 1
-            elif header == '驗收簽核狀態':
-                approval_status_col = i + 1
-            elif header == '驗收簽核備註':
-                approval_note_col = i + 1
-        
-        print(f"DEBUG: 找到驗收簽核人員欄位 '{headers[approval_person_col-1] if approval_person_col else 'None'}' 在第 {approval_person_col} 欄")
-        print(f"DEBUG: 找到驗收簽核日期欄位 '{headers[approval_date_col-1] if approval_date_col else 'None'}' 在第 {approval_date_col} 欄")
-        print(f"DEBUG: 找到驗收簽核狀態欄位 '{headers[approval_status_col-1] if approval_status_col else 'None'}' 在第 {approval_status_col} 欄")
-        print(f"DEBUG: 找到驗收簽核備註欄位 '{headers[approval_note_col-1] if approval_note_col else 'None'}' 在第 {approval_note_col} 欄")
+        # 由快取的欄位對照表取得驗收簽核相關欄位（gspread 使用 1-based 索引）
+        columns = get_column_resolver('請購單')
+        approval_person_col = columns.col('驗收簽核人員')
+        approval_date_col = columns.col('驗收簽核日期')
+        approval_status_col = columns.col('驗收簽核狀態')
+        approval_note_col = columns.col('驗收簽核備註')
         
         # 準備更新的資料
-        updates = []
+        write_buffer = CellWriteBuffer(worksheet)
         
         if approval_person_col:
-            updates.append((target_row, approval_person_col, current_user_name))
+            write_buffer.set(target_row, approval_person_col, current_user_name)
         if approval_date_col:
-            updates.append((target_row, approval_date_col, approval_date))
+            write_buffer.set(target_row, approval_date_col, approval_date)
         if approval_status_col:
-            updates.append((target_row, approval_status_col, approval_status))
+            write_buffer.set(target_row, approval_status_col, approval_status)
         if approval_note_col:
-            updates.append((target_row, approval_note_col, approval_note))
+            write_buffer.set(target_row, approval_note_col, approval_note)
         
         print(f"DEBUG: 更新欄位 - 簽核狀態: {approval_status_col}, 簽核日期: {approval_date_col}, 簽核人員: {approval_person_col}, 簽核備註: {approval_note_col}")
         
-        # 執行更新
-        for row, col, value in updates:
-            worksheet.update_cell(row, col, value)
+        # 執行更新（單次 batch_update）
+        updates = write_buffer.flush()
+        
+        # 同步修補請購單快照
+        get_sheet_cache('請購單').apply_cell_updates(updates)
         
         print(f"DEBUG: 已更新 - 簽核狀態: {approval_status}, 簽核日期: {approval_date}, 簽核人員: {current_user_name}")
         
@@ -894,10 +1057,66 @@ def update_receipt_approval():
             'is_readonly': approval_status in ['核准', '駁回']
         })
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"更新驗收簽核狀態失敗: {e}")
         return jsonify({'error': str(e)}), 500
 
+# 保護範圍描述中的請購單號（例如 20250718-001）
+PROTECTED_PURCHASE_NO_PATTERN = re.compile(r'\d{8}-\d{3,}')
+
+def remove_protected_ranges(purchase_no=None):
+    """
+    解除請購單工作表中請購單的 Google Sheets 保護範圍（一次讀取 metadata、一次 batchUpdate）
+    
+    只處理請購單工作表、描述中含有請購單號的保護範圍；
+    其他工作表（使用者帳號、系統日誌等）與其他用途的保護不會被解除
+    
+    Args:
+        purchase_no: 只解除描述中包含此請購單號的保護；None 表示解除所有請購單的保護
+        
+    Returns:
+        解除的保護範圍數量；失敗時回傳 0（改由應用程式層面控制編輯）
+    """
+    try:
+        spreadsheet = get_spreadsheet()
+        # 只取回工作表名稱與保護範圍相關欄位，不讀取格線資料
+        metadata = spreadsheet.fetch_sheet_metadata(
+            params={'fields': 'sheets(properties(title),protectedRanges(protectedRangeId,description))'}
+        )
+        
+        requests = []
+        for sheet in metadata.get('sheets', []):
+            if sheet.get('properties', {}).get('title') != '請購單':
+                continue
+            for protected_range in sheet.get('protectedRanges', []):
+                description = protected_range.get('description', '')
+                if purchase_no:
+                    # 指定請購單號時，只刪除描述包含該單號的保護範圍
+                    if str(purchase_no) not in description:
+                        continue
+                elif not PROTECTED_PURCHASE_NO_PATTERN.search(description):
+                    continue
+                requests.append({
+                    'deleteProtectedRange': {
+                        'protectedRangeId': protected_range['protectedRangeId']
+                    }
+                })
+        
+        if not requests:
+            print(f"DEBUG: 沒有找到需要解除的保護範圍")
+            return 0
+        
+        spreadsheet.batch_update({'requests': requests})
+        print(f"DEBUG: 已成功解除 {len(requests)} 個 Google Sheets 保護範圍")
+        return len(requests)
+        
+    except Exception as e:
+        print(f"DEBUG: 解除保護失敗: {e}")
+        print(f"DEBUG: 將使用應用程式層面的編輯控制")
+        return 0
+
 @app.route('/verify-admin-password', methods=['POST'])
 def verify_admin_password():
     """驗證 admin 密碼並重新啟用編輯功能"""
@@ -914,118 +1133,34 @@ def verify_admin_password():
         
         # 驗證 admin 密碼
         admin_username = 'admin'
-        if verify_credentials(admin_username, password):
+        password_ok, _ = verify_credentials(admin_username, password)
+        if password_ok:
             # 密碼正確，重新啟用編輯功能
-            client = get_google_sheets_client()
-            spreadsheet_id = os.getenv('SPREADSHEET_ID')
-            spreadsheet = client.open_by_key(spreadsheet_id)
-            worksheet = spreadsheet.worksheet('請購單')
+            worksheet = get_worksheet('請購單')
             
-            # 取得欄位標題
-            headers = worksheet.row_values(1)
-            
-            # 找到編輯狀態欄位的索引（使用現有的最後一欄）
-            edit_status_col = None
-            for i, header in enumerate(headers):
-                if header == '編輯狀態':
-                    edit_status_col = i + 1
-                    break
-            
-            if not edit_status_col:
-                # 檢查是否有空欄位可以使用
-                empty_col = None
-                for i, header in enumerate(headers):
-                    if not header or header.strip() == '':
-                        empty_col = i + 1
-                        break
-                
-                if empty_col:
-                    # 使用空欄位
-                    edit_status_col = empty_col
-                    worksheet.update_cell(1, edit_status_col, '編輯狀態')
-                    print(f"DEBUG: 使用空欄位第 {edit_status_col} 欄作為編輯狀態欄位")
-                else:
-                    # 檢查是否可以在現有範圍內添加新欄位
-                    current_cols = len(headers)
-                    if current_cols < 24:  # Google Sheets 最大欄位數
-                        edit_status_col = current_cols + 1
-                        worksheet.update_cell(1, edit_status_col, '編輯狀態')
-                        print(f"DEBUG: 新增編輯狀態欄位在第 {edit_status_col} 欄")
-                    else:
-                        # 如果無法添加新欄位，使用最後一欄覆蓋
-                        edit_status_col = 24
-                        worksheet.update_cell(1, edit_status_col, '編輯狀態')
-                        print(f"DEBUG: 使用最後一欄第 {edit_status_col} 欄作為編輯狀態欄位")
+            # 編輯狀態欄位已於啟動時建立，直接由欄位對照表取得
+            edit_status_col, = require_columns('請購單', ['編輯狀態'])
             
             if purchase_no == 'ALL':
                 # 重新啟用所有記錄的編輯功能
-                all_records = get_safe_records(worksheet)
-                updated_count = 0
+                # 編輯狀態欄只讀取一次，在記憶體中找出需要變更的列
+                edit_status_values = worksheet.col_values(edit_status_col)
+                write_buffer = CellWriteBuffer(worksheet)
                 
-                for i, record in enumerate(all_records, start=2):
-                    # 檢查當前編輯狀態
-                    current_status = worksheet.cell(i, edit_status_col).value
+                for i, current_status in enumerate(edit_status_values[1:], start=2):
                     if current_status == '唯讀':
-                        worksheet.update_cell(i, edit_status_col, '可編輯')
-                        updated_count += 1
+                        write_buffer.set(i, edit_status_col, '可編輯')
                 
-                # 嘗試解除所有 Google Sheets 保護
-                try:
-                    # 使用 Google Sheets API 解除保護
-                    from googleapiclient.discovery import build
-                    from googleapiclient.errors import HttpError
-                    
-                    # 取得認證憑證
-                    creds = None
-                    if os.path.exists('token.json'):
-                        from google.auth.transport.requests import Request
-                        from google.oauth2.credentials import Credentials
-                        creds = Credentials.from_authorized_user_file('token.json', ['https://www.googleapis.com/auth/spreadsheets'])
-                    elif os.path.exists('service-account-key.json'):
-                        from google.oauth2 import service_account
-                        creds = service_account.Credentials.from_service_account_file(
-                            'service-account-key.json',
-                            scopes=['https://www.googleapis.com/auth/spreadsheets']
-                        )
-                    
-                    if creds and creds.valid:
-                        service = build('sheets', 'v4', credentials=creds)
-                        
-                        # 取得所有保護範圍
-                        spreadsheet = service.spreadsheets().get(
-                            spreadsheetId=spreadsheet_id,
-                            ranges=[],
-                            includeGridData=False
-                        ).execute()
-                        
-                        # 刪除所有保護範圍
-                        requests = []
-                        if 'sheets' in spreadsheet:
-                            for sheet in spreadsheet['sheets']:
-                                if 'protectedRanges' in sheet:
-                                    for protected_range in sheet['protectedRanges']:
-                                        requests.append({
-                                            'deleteProtectedRange': {
-                                                'protectedRangeId': protected_range['protectedRangeId']
-                                            }
-                                        })
-                        
-                        if requests:
-                            body = {'requests': requests}
-                            result = service.spreadsheets().batchUpdate(
-                                spreadsheetId=spreadsheet_id,
-                                body=body
-                            ).execute()
-                            print(f"DEBUG: 已成功解除所有 Google Sheets 保護")
-                        else:
-                            print(f"DEBUG: 沒有找到需要解除的保護範圍")
-                            
-                    else:
-                        print(f"DEBUG: 無法取得有效的認證憑證，跳過 Google Sheets 保護解除")
-                            
-                except Exception as e:
-                    print(f"DEBUG: 解除保護失敗: {e}")
-                    print(f"DEBUG: 將使用應用程式層面的編輯控制")
+                # 所有變更以單次 batch_update 寫回
+                updated_count = len(write_buffer)
+                updates = write_buffer.flush()
+                print(f"DEBUG: 已重新啟用 {updated_count} 筆記錄的編輯功能")
+                
+                # 同步修補請購單快照
+                get_sheet_cache('請購單').apply_cell_updates(updates)
+                
+                # 同一次操作中解除所有 Google Sheets 保護
+                remove_protected_ranges()
                 
                 return jsonify({
                     'success': True, 
@@ -1035,80 +1170,20 @@ def verify_admin_password():
                 })
             else:
                 # 重新啟用特定請購單的編輯功能
-                all_records = get_safe_records(worksheet)
-                
-                # 找到對應的請購單
-                target_row = None
-                for i, record in enumerate(all_records, start=2):
-                    if str(record.get('請購單號', '')).replace('-', '') == purchase_no:
-                        target_row = i
-                        break
+                # 依請購單號索引找到對應的列號（寫入前確認該列仍是這張請購單）
+                target_row, purchase_record = get_sheet_cache('請購單').locate(purchase_no, worksheet)
                 
                 if not target_row:
                     return jsonify({'success': False, 'message': '找不到指定的請購單'})
                 
                 # 設定為可編輯
-                worksheet.update_cell(target_row, edit_status_col, '可編輯')
+                write_buffer = CellWriteBuffer(worksheet)
+                write_buffer.set(target_row, edit_status_col, '可編輯')
+                updates = write_buffer.flush()
+                get_sheet_cache('請購單').apply_cell_updates(updates)
                 
-                # 嘗試解除 Google Sheets 保護
-                try:
-                    # 使用 Google Sheets API 解除保護
-                    from googleapiclient.discovery import build
-                    from googleapiclient.errors import HttpError
-                    
-                    # 取得認證憑證
-                    creds = None
-                    if os.path.exists('token.json'):
-                        from google.auth.transport.requests import Request
-                        from google.oauth2.credentials import Credentials
-                        creds = Credentials.from_authorized_user_file('token.json', ['https://www.googleapis.com/auth/spreadsheets'])
-                    elif os.path.exists('service-account-key.json'):
-                        from google.oauth2 import service_account
-                        creds = service_account.Credentials.from_service_account_file(
-                            'service-account-key.json',
-                            scopes=['https://www.googleapis.com/auth/spreadsheets']
-                        )
-                    
-                    if creds and creds.valid:
-                        service = build('sheets', 'v4', credentials=creds)
-                        
-                        # 取得所有保護範圍
-                        spreadsheet = service.spreadsheets().get(
-                            spreadsheetId=spreadsheet_id,
-                            ranges=[],
-                            includeGridData=False
-                        ).execute()
-                        
-                        # 找到並刪除特定請購單的保護範圍
-                        requests = []
-                        if 'sheets' in spreadsheet:
-                            for sheet in spreadsheet['sheets']:
-                                if 'protectedRanges' in sheet:
-                                    for protected_range in sheet['protectedRanges']:
-                                        # 檢查保護範圍的描述是否包含請購單號
-                                        if 'description' in protected_range and purchase_no in protected_range['description']:
-                                            requests.append({
-                                                'deleteProtectedRange': {
-                                                    'protectedRangeId': protected_range['protectedRangeId']
-                                                }
-                                            })
-                        
-                        if requests:
-                            body = {'requests': requests}
-                            result = service.spreadsheets().batchUpdate(
-                                spreadsheetId=spreadsheet_id,
-                                body=body
-                            ).execute()
-                            print(f"DEBUG: 已成功解除請購單 {purchase_no} 的 Google Sheets 保護")
-                        else:
-                            print(f"DEBUG: 沒有找到請購單 {purchase_no} 的保護範圍")
-                            
-                    else:
-                        print(f"DEBUG: 無法取得有效的認證憑證，跳過 Google Sheets 保護解除")
-                            
-                except Exception as e:
-                    print(f"DEBUG: 解除保護失敗: {e}")
-                    print(f"DEBUG: 將使用應用程式層面的編輯控制")
+                # 嘗試解除該請購單的 Google Sheets 保護
+                remove_protected_ranges(purchase_no)
                 
                 return jsonify({
                     'success': True, 
@@ -1116,8 +1191,10 @@ def verify_admin_password():
                     'can_edit': True
                 })
         else:
-            return jsonify({'success': False, 'message': '密碼錯誤'})
+            return jsonify({'success': False, 'message': '密碼錯誤'}), 403
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"驗證密碼失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1138,20 +1215,10 @@ def lock_record():
             return jsonify({'success': False, 'message': '缺少必要參數'})
         
         # 更新 Google Sheets，設定為唯讀狀態
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        worksheet = get_worksheet('請購單')
         
-        # 取得所有資料
-        all_records = get_safe_records(worksheet)
-        
-        # 找到對應的請購單
-        target_row = None
-        for i, record in enumerate(all_records, start=2):
-            if str(record.get('請購單號', '')).replace('-', '') == purchase_no:
-                target_row = i
-                break
+        # 依請購單號索引找到對應的列號（寫入前確認該列仍是這張請購單）
+        target_row, purchase_record = get_sheet_cache('請購單').locate(purchase_no, worksheet)
         
         if not target_row:
             print(f"DEBUG: 找不到請購單 {purchase_no}")
@@ -1159,57 +1226,29 @@ def lock_record():
         
         print(f"DEBUG: 找到請購單 {purchase_no} 在第 {target_row} 行")
         
-        # 取得欄位標題
-        headers = worksheet.row_values(1)
-        print(f"DEBUG: 欄位標題: {headers}")
-        
-        # 找到編輯狀態欄位的索引（使用現有的最後一欄）
-        edit_status_col = None
-        for i, header in enumerate(headers):
-            if header == '編輯狀態':
-                edit_status_col = i + 1
-                break
-        
-        if not edit_status_col:
-            # 檢查是否有空欄位可以使用
-            empty_col = None
-            for i, header in enumerate(headers):
-                if not header or header.strip() == '':
-                    empty_col = i + 1
-                    break
-            
-            if empty_col:
-                # 使用空欄位
-                edit_status_col = empty_col
-                worksheet.update_cell(1, edit_status_col, '編輯狀態')
-                print(f"DEBUG: 使用空欄位第 {edit_status_col} 欄作為編輯狀態欄位")
-            else:
-                # 檢查是否可以在現有範圍內添加新欄位
-                current_cols = len(headers)
-                if current_cols < 24:  # Google Sheets 最大欄位數
-                    edit_status_col = current_cols + 1
-                    worksheet.update_cell(1, edit_status_col, '編輯狀態')
-                    print(f"DEBUG: 新增編輯狀態欄位在第 {edit_status_col} 欄")
-                else:
-                    # 如果無法添加新欄位，使用最後一欄覆蓋
-                    edit_status_col = 24
-                    worksheet.update_cell(1, edit_status_col, '編輯狀態')
-                    print(f"DEBUG: 使用最後一欄第 {edit_status_col} 欄作為編輯狀態欄位")
-        else:
-            print(f"DEBUG: 找到編輯狀態欄位在第 {edit_status_col} 欄")
+        # 編輯狀態欄位已於啟動時建立，直接由欄位對照表取得
+        edit_status_col, = require_columns('請購單', ['編輯狀態'])
+        print(f"DEBUG: 編輯狀態欄位在第 {edit_status_col} 欄")
+        write_buffer = CellWriteBuffer(worksheet)
         
         # 使用編輯狀態欄位來標記鎖定狀態
         # 注意：由於 gspread 6.2.1 的限制，我們無法直接設定 Google Sheets 保護
         # 但我們可以在應用程式層面實現鎖定功能
-        worksheet.update_cell(target_row, edit_status_col, '唯讀')
+        write_buffer.set(target_row, edit_status_col, '唯讀')
+        updates = write_buffer.flush()
         print(f"DEBUG: 已將請購單 {purchase_no} 設定為唯讀狀態")
         
+        # 同步修補請購單快照
+        get_sheet_cache('請購單').apply_cell_updates(updates)
+        
         return jsonify({
             'success': True, 
             'message': f'請購單 {purchase_no} 已鎖定為唯讀狀態',
             'is_locked': True
         })
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"鎖定記錄失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1238,120 +1277,21 @@ def update_receipt_status():
         print(f"DEBUG: 當前登入者: {current_user_name}")
         
         # 更新 Google Sheets 中的驗收單驗收狀態
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 找到對應的請購單號
-        all_records = get_safe_records(worksheet)
-        row_index = None
+        worksheet = get_worksheet('請購單')
         
-        for i, record in enumerate(all_records, start=2):  # start=2 因為第1行是標題
-            if str(record.get('請購單號', '')).replace('-', '') == purchase_no:
-                row_index = i
-                break
+        # 依請購單號索引找到對應的列號（寫入前確認該列仍是這張請購單）
+        row_index, purchase_record = get_sheet_cache('請購單').locate(purchase_no, worksheet)
         
         if row_index is None:
             return jsonify({'success': False, 'message': '找不到請購單'})
         
-        # 先取得欄位標題來確定正確的欄位位置
-        headers = worksheet.row_values(1)
-        print(f"DEBUG: 欄位標題: {headers}")
-        
-        # 尋找驗收單驗收狀態欄位
-        receipt_status_col = None
-        receipt_person_col = None
-        receipt_date_col = None
-        
-        for i, header in enumerate(headers, 1):
-            if '驗收單狀態' in header or '驗收狀態' in header or 'receipt_status' in header:
-                receipt_status_col = i
-                print(f"DEBUG: 找到驗收狀態欄位 '{header}' 在第 {i} 欄")
-            elif '驗收人員' in header or 'receipt_person' in header:
-                receipt_person_col = i
-                print(f"DEBUG: 找到驗收人員欄位 '{header}' 在第 {i} 欄")
-            elif '驗收日期' in header or 'receipt_date' in header:
-                receipt_date_col = i
-                print(f"DEBUG: 找到驗收日期欄位 '{header}' 在第 {i} 欄")
-        
-        # 如果找不到驗收單驗收狀態欄位，尋找空欄位或添加新欄位
-        if receipt_status_col is None:
-            # 檢查是否有空欄位可以使用
-            empty_col = None
-            for i, header in enumerate(headers):
-                if not header or header.strip() == '':
-                    empty_col = i + 1
-                    break
-            
-            if empty_col:
-                receipt_status_col = empty_col
-                worksheet.update_cell(1, receipt_status_col, '驗收單狀態')
-                print(f"DEBUG: 使用空欄位第 {receipt_status_col} 欄作為驗收單狀態欄位")
-            else:
-                # 檢查是否可以在現有範圍內添加新欄位
-                current_cols = len(headers)
-                if current_cols < 24:  # Google Sheets 最大欄位數
-                    receipt_status_col = current_cols + 1
-                    worksheet.update_cell(1, receipt_status_col, '驗收單狀態')
-                    print(f"DEBUG: 新增驗收單狀態欄位在第 {receipt_status_col} 欄")
-                else:
-                    # 如果無法添加新欄位，使用最後一欄覆蓋
-                    receipt_status_col = 24
-                    worksheet.update_cell(1, receipt_status_col, '驗收單狀態')
-                    print(f"DEBUG: 使用最後一欄第 {receipt_status_col} 欄作為驗收單狀態欄位")
-        
-        # 如果找不到驗收人員欄位，尋找空欄位或添加新欄位
-        if receipt_person_col is None:
-            # 檢查是否有空欄位可以使用
-            empty_col = None
-            for i, header in enumerate(headers):
-                if not header or header.strip() == '':
-                    empty_col = i + 1
-                    break
-            
-            if empty_col:
-                receipt_person_col = empty_col
-                worksheet.update_cell(1, receipt_person_col, '驗收人員')
-                print(f"DEBUG: 使用空欄位第 {receipt_person_col} 欄作為驗收人員欄位")
-            else:
-                # 檢查是否可以在現有範圍內添加新欄位
-                current_cols = len(headers)
-                if current_cols < 24:  # Google Sheets 最大欄位數
-                    receipt_person_col = current_cols + 1
-                    worksheet.update_cell(1, receipt_person_col, '驗收人員')
-                    print(f"DEBUG: 新增驗收人員欄位在第 {receipt_person_col} 欄")
-                else:
-                    # 如果無法添加新欄位，使用最後一欄覆蓋
-                    receipt_person_col = 24
-                    worksheet.update_cell(1, receipt_person_col, '驗收人員')
-                    print(f"DEBUG: 使用最後一欄第 {receipt_person_col} 欄作為驗收人員欄位")
-        
-        # 如果找不到驗收日期欄位，尋找空欄位或添加新欄位
-        if receipt_date_col is None:
-            # 檢查是否有空欄位可以使用
-            empty_col = None
-            for i, header in enumerate(headers):
-                if not header or header.strip() == '':
-                    empty_col = i + 1
-                    break
-            
-            if empty_col:
-                receipt_date_col = empty_col
-                worksheet.update_cell(1, receipt_date_col, '驗收日期')
-                print(f"DEBUG: 使用空欄位第 {receipt_date_col} 欄作為驗收日期欄位")
-            else:
-                # 檢查是否可以在現有範圍內添加新欄位
-                current_cols = len(headers)
-                if current_cols < 24:  # Google Sheets 最大欄位數
-                    receipt_date_col = current_cols + 1
-                    worksheet.update_cell(1, receipt_date_col, '驗收日期')
-                    print(f"DEBUG: 新增驗收日期欄位在第 {receipt_date_col} 欄")
-                else:
-                    # 如果無法添加新欄位，使用最後一欄覆蓋
-                    receipt_date_col = 24
-                    worksheet.update_cell(1, receipt_date_col, '驗收日期')
-                    print(f"DEBUG: 使用最後一欄第 {receipt_date_col} 欄作為驗收日期欄位")
+        # 驗收單驗收狀態、驗收人員、驗收日期欄位（含別名）已於啟動時建立，
+        # 直接由欄位對照表取得
+        receipt_status_col, receipt_person_col, receipt_date_col = require_columns(
+            '請購單', ['驗收單狀態', '驗收人員', '驗收日期'])
+        
+        # 所有變更先寫入緩衝區，最後一次送出
+        write_buffer = CellWriteBuffer(worksheet)
         
         # 取得當前日期
         current_date = datetime.now().strftime('%Y%m%d')
@@ -1359,13 +1299,19 @@ def update_receipt_status():
         print(f"DEBUG: 更新欄位 - 驗收單驗收狀態: {receipt_status_col}, 驗收人員: {receipt_person_col}, 驗收日期: {receipt_date_col}")
         
         # 更新驗收單驗收狀態
-        worksheet.update_cell(row_index, receipt_status_col, receipt_status)
+        write_buffer.set(row_index, receipt_status_col, receipt_status)
         
         # 更新驗收人員（自動帶入登入者姓名）
-        worksheet.update_cell(row_index, receipt_person_col, current_user_name)
+        write_buffer.set(row_index, receipt_person_col, current_user_name)
         
         # 更新驗收日期（自動帶入當前日期）
-        worksheet.update_cell(row_index, receipt_date_col, current_date)
+        write_buffer.set(row_index, receipt_date_col, current_date)
+        
+        # 執行更新（單次 batch_update）
+        updates = write_buffer.flush()
+        
+        # 同步修補請購單快照
+        get_sheet_cache('請購單').apply_cell_updates(updates)
         
         print(f"DEBUG: 已更新 - 驗收單驗收狀態: {receipt_status}, 驗收人員: {current_user_name}, 驗收日期: {current_date}")
         
@@ -1384,6 +1330,8 @@ def update_receipt_status():
             'receipt_date': current_date
         })
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"更新驗收單驗收狀態失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1531,10 +1479,7 @@ def test_receipt_approval_check():
 def debug_receipt_data():
     """調試驗收單資料"""
     try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        worksheet = get_worksheet('請購單')
         all_records = get_safe_records(worksheet)
         
         # 分析所有記錄的簽核狀態
@@ -1573,6 +1518,8 @@ def debug_receipt_data():
             'approval_analysis': approval_analysis,
             'columns': list(all_records[0].keys()) if all_records else []
         })
+    except QuotaExceededError:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1596,19 +1543,8 @@ def get_purchase_status(purchase_no):
         return jsonify({'success': False, 'message': '未登入'})
     
     try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 找到對應的請購單號
-        all_records = get_safe_records(worksheet)
-        purchase_record = None
-        
-        for record in all_records:
-            if str(record.get('請購單號', '')).replace('-', '') == purchase_no:
-                purchase_record = record
-                break
+        # 依請購單號索引找到對應的請購單
+        row_index, purchase_record = get_sheet_cache('請購單').find(purchase_no)
         
         if not purchase_record:
             return jsonify({'success': False, 'message': '找不到請購單'})
@@ -1633,6 +1569,8 @@ def get_purchase_status(purchase_no):
             }
         })
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"獲取請購單狀態失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1641,10 +1579,7 @@ def get_purchase_status(purchase_no):
 def debug_data():
     """調試資料頁面"""
     try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
+        worksheet = get_worksheet('請購單')
         all_records = get_safe_records(worksheet)
         
         # 只返回前5筆記錄用於調試
@@ -1682,6 +1617,8 @@ def debug_data():
                 'receipt_status': target_record.get('receipt_status') if target_record else None
             } if target_record else None
         })
+    except QuotaExceededError:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1705,20 +1642,22 @@ def search_purchase_requests():
         client = get_google_sheets_client()
         if not client:
             return jsonify({'success': False, 'message': '無法建立 Google Sheets 客戶端'})
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        if not spreadsheet_id:
-            return jsonify({'success': False, 'message': '未設定試算表 ID'})
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        all_records = get_safe_records(worksheet)
+        # 根據搜尋類型進行篩選
+        filtered_records = []
+        mirror = get_sheet_mirror()
+        search_filter = purchase_search_filter(search_type, data) if mirror is not None else None
+        if search_filter is not None:
+            # 由本機鏡像以索引查詢，不需逐筆比對
+            filtered_records = mirror.select('請購單', *search_filter)
+            all_records = []
+        else:
+            # 取得所有資料
+            all_records = get_purchase_records()
         
         print(f"DEBUG: 總記錄數: {len(all_records)}")
         if all_records:
             print(f"DEBUG: 第一筆記錄: {all_records[0]}")
         
-        # 根據搜尋類型進行篩選
-        filtered_records = []
-        
         for record in all_records:
             if search_type == 'purchase_no':
                 # 依請購單號搜尋
@@ -1936,6 +1875,8 @@ def search_purchase_requests():
             'total_count': len(filtered_records)
         })
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"搜尋請購單失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1955,12 +1896,8 @@ def test_search_purchase_requests():
         client = get_google_sheets_client()
         if not client:
             return jsonify({'success': False, 'message': '無法建立 Google Sheets 客戶端'})
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        if not spreadsheet_id:
-            return jsonify({'success': False, 'message': '未設定試算表 ID'})
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        all_records = get_safe_records(worksheet)
+        # 取得所有資料
+        all_records = get_purchase_records()
         
         print(f"TEST DEBUG: 總記錄數: {len(all_records)}")
         if all_records:
@@ -2028,6 +1965,8 @@ def test_search_purchase_requests():
             'total_count': len(filtered_records)
         })
         
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"測試搜尋請購單失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -2037,23 +1976,18 @@ def purchase_request_new():
     if 'logged_in' not in session or not session['logged_in']:
         return redirect(url_for('index'))
     username = session.get('username')
-    user_info = get_user_info(username)
     if request.method == 'POST':
-        # 強制由系統產生唯一請購單號
-        purchase_no = generate_purchase_no()
+        user_info = get_user_info(username)
         today = datetime.now().strftime('%Y%m%d')
         department = request.form.get('department')
         applicant = user_info['name']
         applicant_mail = user_info['mail']
-        item_name = request.form.get('item_name')
-        spec = request.form.get('spec')
-        quantity = request.form.get('quantity')
-        unit = request.form.get('unit')
-        need_date = request.form.get('need_date')
-        purpose = request.form.get('purpose')
-        note = request.form.get('note')
         sign_status = request.form.get('sign_status')
         reject_reason = request.form.get('reject_reason')
+        line_items = parse_line_items(request.form)
+        if not line_items:
+            flash('請至少填寫一項品名', 'error')
+            return redirect(url_for('purchase_request_new'))
         attachment_url = ''
         if 'attachment' in request.files:
             file = request.files['attachment']
@@ -2068,59 +2002,91 @@ def purchase_request_new():
                 print(f'附件URL: {attachment_url}')
                 print(f'附件URL長度: {len(attachment_url) if attachment_url else 0}')
         try:
-            client = get_google_sheets_client()
-            spreadsheet_id = os.getenv('SPREADSHEET_ID')
-            spreadsheet = client.open_by_key(spreadsheet_id)
-            worksheet = spreadsheet.worksheet('請購單')
+            worksheet = get_worksheet('請購單')
+            
+            # 每個品項一個請購單號，一次配發連續號碼（附件上傳完成後才配號，避免上傳失敗留下空號）
+            purchase_nos = get_purchase_no_allocator().allocate(len(line_items))
             
             # 準備要寫入的資料 - 按照 Google Sheets 的欄位順序
-            row_data = [
-                purchase_no,        # 1. 請購單號
-                today,             # 2. 請購日期
-                department,        # 3. 請購部門
-                applicant,         # 4. 申請人
-                applicant_mail,    # 5. mail
-                item_name,         # 6. 品名
-                spec,              # 7. 規格
-                quantity,          # 8. 數量
-                unit,              # 9. 單位
-                need_date,         # 10. 需求日期
-                purpose,           # 11. 用途
-                attachment_url,    # 12. 上傳附件
-                note,              # 13. 備註
-                sign_status,       # 14. 請購單簽核
-                reject_reason      # 15. 請購單駁回原因
-            ]
+            rows = []
+            for purchase_no, item in zip(purchase_nos, line_items):
+                rows.append([
+                    purchase_no,           # 1. 請購單號
+                    today,                 # 2. 請購日期
+                    department,            # 3. 請購部門
+                    applicant,             # 4. 申請人
+                    applicant_mail,        # 5. mail
+                    item['item_name'],     # 6. 品名
+                    item['spec'],          # 7. 規格
+                    item['quantity'],      # 8. 數量
+                    item['unit'],          # 9. 單位
+                    item['need_date'],     # 10. 需求日期
+                    item['purpose'],       # 11. 用途
+                    attachment_url,        # 12. 上傳附件
+                    item['note'],          # 13. 備註
+                    sign_status,           # 14. 請購單簽核
+                    reject_reason          # 15. 請購單駁回原因
+                ])
             
             print(f'=== 寫入Google Sheets ===')
-            print(f'請購單號: {purchase_no}')
+            print(f'請購單號: {", ".join(purchase_nos)}')
             print(f'附件URL: {attachment_url}')
-            print(f'資料列: {row_data}')
+            print(f'資料列數: {len(rows)}')
             
-            worksheet.append_row(row_data)
-            # 寫入日誌
-            user_info = get_user_info(session['username'])
+            worksheet.append_rows(rows)
+            # 新增列後請購單快照重新載入
+            get_sheet_cache('請購單').invalidate()
+            # 寫入日誌（多個品項只記錄一筆）
             now = datetime.now().strftime('%Y%m%d %H:%M')
-            update_system_log(user_info.get('name', session['username']), action_str=f'請購單建立 {purchase_no} {now}')
-            flash('請購單已成功建立！', 'success')
+            update_system_log(user_info.get('name', session['username']), action_str=f'請購單建立 {format_purchase_no_range(purchase_nos)} {now}')
+            flash(f'請購單已成功建立！（{format_purchase_no_range(purchase_nos)}，共 {len(purchase_nos)} 項）', 'success')
             return redirect(url_for('purchase_request_new'))
         except Exception as e:
             print(f"寫入請購單失敗: {e}")
             flash('請購單建立失敗，請稍後再試', 'error')
             return redirect(url_for('purchase_request_new'))
-    purchase_no = generate_purchase_no()
+    # 彼此獨立的讀取同時送出
+    fetched = fetch_concurrently(
+        user_info=copy_current_request_context(lambda: get_user_info(username)),
+        purchase_no=preview_purchase_no,
+        departments=lambda: get_dropdown_list('請購部門', '部門名稱'),
+        units=lambda: get_dropdown_list('單位', '單位名稱')
+    )
+    user_info = fetched['user_info']
     today = datetime.now().strftime('%Y%m%d')
-    departments = get_dropdown_list('請購部門', '部門名稱')
-    units = get_dropdown_list('單位', '單位名稱')
     return render_template('purchase_request_new.html',
-        purchase_no=purchase_no,
+        purchase_no=fetched['purchase_no'],
         today=today,
-        departments=departments,
-        units=units,
+        departments=fetched['departments'],
+        units=fetched['units'],
         username=user_info['name'],
         user_mail=user_info['mail']
     )
 
+@app.route('/purchase-request/import', methods=['POST'])
+def purchase_request_import():
+    """由 CSV/XLSX 批次匯入請購單，回傳逐列結果"""
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'success': False, 'message': '未登入'})
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'success': False, 'message': '請選擇要匯入的檔案'})
+    try:
+        user_info = get_user_info(session['username'])
+        result = import_purchase_requests(file, user_info['name'], user_info['mail'])
+        if result['purchase_nos']:
+            now = datetime.now().strftime('%Y%m%d %H:%M')
+            update_system_log(user_info.get('name', session['username']),
+                              action_str=f"請購單匯入 {result['imported']} 筆 {format_purchase_no_range(result['purchase_nos'])} {now}")
+        return jsonify({'success': True, **result})
+    except ImportFileError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        print(f"匯入請購單失敗: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/check-sheet-protection')
 def check_sheet_protection():
     """檢查 Google Sheets 保護狀態"""
@@ -2128,8 +2094,7 @@ def check_sheet_protection():
         return jsonify({'success': False, 'message': '未登入'})
     
     try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
+        spreadsheet_id = get_spreadsheet_id()
         
         # 使用 Google Sheets API 檢查保護狀態
         from googleapiclient.discovery import build
@@ -2152,11 +2117,11 @@ def check_sheet_protection():
             service = build('sheets', 'v4', credentials=creds)
             
             # 取得試算表資訊
-            spreadsheet = service.spreadsheets().get(
+            spreadsheet = execute_with_quota(service.spreadsheets().get(
                 spreadsheetId=spreadsheet_id,
                 ranges=[],
                 includeGridData=False
-            ).execute()
+            ), bucket='read')
             
             protection_info = []
             if 'sheets' in spreadsheet:
@@ -2182,60 +2147,64 @@ def check_sheet_protection():
                 'message': '無法取得有效的認證憑證'
             })
             
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"檢查保護狀態失敗: {e}")
         return jsonify({'error': str(e)}), 500
 
 def write_system_log(name, login_time=None, logout_time=None, action=''):
-    try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('系統日誌')
-        row = [
-            name,
-            login_time or '',
-            logout_time or '',
-            action
-        ]
-        worksheet.append_row(row)
-    except Exception as e:
-        print(f"寫入系統日誌失敗: {e}")
+    """
+    新增一筆系統日誌（交由背景寫入器寫入，不阻塞請求）
+    
+    Returns:
+        日誌ID，寫入後可由日誌列號對照表取得該列列號
+    """
+    log_id = uuid.uuid4().hex
+    get_system_log_writer().submit(LogEvent('append', name, login_time=login_time,
+                                            logout_time=logout_time, action=action,
+                                            log_id=log_id))
+    return log_id
 
 def update_system_log(name, action_str=None, logout_time=None):
-    try:
-        client = get_google_sheets_client()
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('系統日誌')
-        records = worksheet.get_all_records()
-        # 找到該用戶最後一筆尚未登出的紀錄
-        target_row = None
-        for idx, row in reversed(list(enumerate(records, start=2))):  # start=2 因為第1行是標題
-            print(f"檢查日誌: {row.get('姓名')} 登出時間: {row.get('登出時間')}")
-            if row.get('姓名') == name and not row.get('登出時間'):
-                target_row = idx
-                break
-        print(f"找到要更新的 row: {target_row}")
-        if target_row:
-            if action_str:
-                old_content = worksheet.cell(target_row, 4).value or ''
-                new_content = (old_content + action_str + ' ; ').strip()
-                worksheet.update_cell(target_row, 4, new_content)
-            if logout_time:
-                worksheet.update_cell(target_row, 3, logout_time)
-        else:
-            print(f"找不到未登出的日誌列，無法寫入登出時間")
-    except Exception as e:
-        print(f'更新系統日誌失敗: {e}')
+    """更新目前 session 的登入日誌列（交由背景寫入器寫入，不阻塞請求）
+
+    session 內已有列號時直接寫入該列；否則依日誌ID或姓名定位
+    """
+    in_request = has_request_context()
+    get_system_log_writer().submit(LogEvent('update', name, logout_time=logout_time,
+                                            action=action_str or '',
+                                            log_id=session.get('log_id') if in_request else None,
+                                            log_row=session.get('log_row') if in_request else None,
+                                            log_epoch=session.get('log_epoch') if in_request else None))
+
+@app.before_request
+def start_cache_refresher():
+    """每個 worker 第一次處理請求時啟動快取背景更新"""
+    get_cache_refresher().start()
+
+@app.before_request
+def resolve_log_row():
+    """登入列寫入後，將其列號存入 session，之後的日誌更新直接寫入該列
+
+    日誌輪替會搬移列號，epoch 不同時重新取得
+    """
+    if 'log_id' not in session:
+        return
+    registry = get_system_log_writer().registry
+    epoch = registry.epoch()
+    if 'log_row' in session and session.get('log_epoch') == epoch:
+        return
+    log_row = registry.get(session['log_id'])
+    if log_row:
+        session['log_row'] = log_row
+        session['log_epoch'] = epoch
+    else:
+        session.pop('log_row', None)
 
 @app.route('/user-management', methods=['GET'])
 def user_management():
-    client = get_google_sheets_client()
-    spreadsheet_id = os.getenv('SPREADSHEET_ID')
-    spreadsheet = client.open_by_key(spreadsheet_id)
-    worksheet = spreadsheet.worksheet('使用者帳號')
-    users = worksheet.get_all_records()
+    users = get_user_directory().get_users()
     return render_template('user_management.html', users=users)
 
 @app.route('/user-management/add', methods=['POST'])
@@ -2245,11 +2214,7 @@ def user_management_add():
     password = request.form.get('password')
     role = request.form.get('role')
     mail = request.form.get('mail')
-    client = get_google_sheets_client()
-    spreadsheet_id = os.getenv('SPREADSHEET_ID')
-    spreadsheet = client.open_by_key(spreadsheet_id)
-    worksheet = spreadsheet.worksheet('使用者帳號')
-    worksheet.append_row([name, username, password, role, mail])
+    get_user_directory().add_user([name, username, password, role, mail])
     flash('新增成功', 'success')
     return redirect(url_for('user_management'))
 
@@ -2260,48 +2225,127 @@ def user_management_update():
     password = request.form.get('password')
     role = request.form.get('role')
     mail = request.form.get('mail')
-    client = get_google_sheets_client()
-    spreadsheet_id = os.getenv('SPREADSHEET_ID')
-    spreadsheet = client.open_by_key(spreadsheet_id)
-    worksheet = spreadsheet.worksheet('使用者帳號')
-    records = worksheet.get_all_records()
-    for idx, row in enumerate(records, start=2):
-        if row.get('帳號') == username:
-            worksheet.update(f'A{idx}:E{idx}', [[name, username, password, role, mail]])
-            break
+    # 依使用者目錄快取的列號直接更新，並修補快照
+    get_user_directory().update_user(username, [name, username, password, role, mail])
+    # 使用者資料已變更，各 session 內的資料於下次請求重新載入
+    invalidate_user_profiles()
     flash('更新成功', 'success')
     return redirect(url_for('user_management'))
 
 @app.route('/user-management/delete', methods=['POST'])
 def user_management_delete():
     username = request.form.get('username')
-    client = get_google_sheets_client()
-    spreadsheet_id = os.getenv('SPREADSHEET_ID')
-    spreadsheet = client.open_by_key(spreadsheet_id)
-    worksheet = spreadsheet.worksheet('使用者帳號')
-    records = worksheet.get_all_records()
-    for idx, row in enumerate(records, start=2):
-        if row.get('帳號') == username:
-            worksheet.delete_rows(idx)
-            break
+    get_user_directory().delete_user(username)
+    invalidate_user_profiles()
     flash('刪除成功', 'success')
     return redirect(url_for('user_management'))
 
+@app.route('/quota-status')
+def quota_status():
+    """目前可用的 Google API 配額（每台主機所有 worker 共用）"""
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'success': False, 'message': '未登入'})
+    try:
+        return jsonify({'success': True, 'quota': get_quota_governor().remaining()})
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/cache-status')
+def cache_status():
+    """目前 worker 的快取背景更新狀態（各快取的資料年齡與上次更新時間）"""
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'success': False, 'message': '未登入'})
+    try:
+        mirror = get_sheet_mirror()
+        return jsonify({'success': True, 'pid': os.getpid(), 'caches': get_cache_refresher().status(),
+                        'mirror': mirror.status() if mirror is not None else None})
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.errorhandler(QuotaExceededError)
+def handle_quota_exceeded(e):
+    """等待配額逾時：回覆 503 讓使用者稍後重試，而非 500"""
+    print(f"配額不足: {e}")
+    # 瀏覽器頁面回覆文字，fetch/AJAX 請求（JSON 或 Accept */*）回覆 JSON
+    if request.is_json or request.accept_mimetypes.best_match(['application/json', 'text/html'], 'application/json') == 'application/json':
+        return jsonify({'success': False, 'message': '系統忙碌中，請稍後再試'}), 503
+    return '系統忙碌中，請稍後再試', 503
+
+@app.route('/master-data/refresh', methods=['POST'])
+def master_data_refresh():
+    """管理者修改主檔工作表後，立即重新載入下拉選單資料"""
+    if 'logged_in' not in session or not session['logged_in']:
+        return redirect(url_for('index'))
+    if session.get('role') in ['一般人員', '主管']:
+        return '權限不足，無法存取此頁面', 403
+    try:
+        records = get_master_data().refresh()
+        flash('下拉選單資料已重新載入（' + '、'.join(f'{title} {len(rows)} 筆' for title, rows in records.items()) + '）', 'success')
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        print(f"重新載入主檔資料失敗: {e}")
+        flash('重新載入下拉選單資料失敗，請稍後再試', 'error')
+    return redirect(url_for('dashboard'))
+
 @app.route('/system-log')
 def system_log():
     if 'logged_in' not in session or not session['logged_in']:
         return redirect(url_for('index'))
     if session.get('role') == '一般人員':
         return '權限不足，無法存取此頁面', 403
-    client = get_google_sheets_client()
-    spreadsheet_id = os.getenv('SPREADSHEET_ID')
-    spreadsheet = client.open_by_key(spreadsheet_id)
-    worksheet = spreadsheet.worksheet('系統日誌')
-    records = worksheet.get_all_records()
-    # 取得所有姓名與登入時間選項
-    names = sorted(set(r.get('姓名','') for r in records if r.get('姓名')))
-    login_times = sorted(set(r.get('登入時間','') for r in records if r.get('登入時間')))
-    return render_template('system_log.html', records=records, names=names, login_times=login_times)
+    # 頁面只載入篩選選項，日誌內容由 /system-log/query 分頁取得
+    try:
+        names = get_log_names()
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        print(f"取得系統日誌姓名失敗: {e}")
+        names = []
+    return render_template('system_log.html', names=names,
+                           retention_days=SYSTEM_LOG_RETENTION_DAYS)
+
+@app.route('/system-log/query')
+def system_log_query():
+    """分頁查詢系統日誌
+    
+    參數：name、start_date/end_date (YYYY-MM-DD)、order (desc/asc)、limit、cursor
+    未指定起始日期或起始日期在保留期間內時只查詢熱分區
+    """
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'success': False, 'message': '未登入'})
+    if session.get('role') == '一般人員':
+        return jsonify({'success': False, 'message': '權限不足'}), 403
+    
+    try:
+        start_date = request.args.get('start_date', '')
+        end_date = request.args.get('end_date', '')
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+            end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        except ValueError:
+            return jsonify({'success': False, 'message': '日期格式錯誤'})
+        
+        result = query_system_log(
+            name=request.args.get('name', '').strip() or None,
+            start=start,
+            end=end,
+            order=request.args.get('order', 'desc'),
+            limit=request.args.get('limit', 50, type=int),
+            cursor=request.args.get('cursor')
+        )
+        result['success'] = True
+        return jsonify(result)
+        
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        print(f"查詢系統日誌失敗: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/attendance-check')
 def attendance_check():
@@ -2333,16 +2377,11 @@ def fetch_taiwan_holidays(year, api_key):
     return holidays
 
 def get_schedule_data(start_date=None, end_date=None):
-    # 1. 取得 Google Drive 服務
-    service_account_info = os.getenv('GOOGLE_SERVICE_ACCOUNT_INFO')
-    if service_account_info:
-        creds_dict = json.loads(service_account_info)
-        creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-    else:
-        creds = Credentials.from_service_account_file('service-account-key.json', scopes=SCOPES)
+    # 1. 取得 Google Drive 服務（沿用連線池的共用憑證）
+    creds = get_sheets_pool().get_credentials()
     drive_service = build('drive', 'v3', credentials=creds)
     # 2. 搜尋檔名包含「排班表」的 Excel 檔案
-    results = drive_service.files().list(q="name contains '排班表' and mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' and trashed=false", fields="files(id, name)").execute()
+    results = execute_with_quota(drive_service.files().list(q="name contains '排班表' and mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' and trashed=false", fields="files(id, name)"))
     files = results.get('files', [])
     if not files:
         return []
@@ -2353,7 +2392,7 @@ def get_schedule_data(start_date=None, end_date=None):
     downloader = MediaIoBaseDownload(fh, request)
     done = False
     while not done:
-        status, done = downloader.next_chunk()
+        status, done = get_quota_governor().call(downloader.next_chunk, 'drive')
     fh.seek(0)
     # 4. 用 pandas 讀取分頁「班表」
     try:
@@ -2526,5 +2565,25 @@ def download_schedule():
     output.seek(0)
     return send_file(output, as_attachment=True, download_name='班表匯出.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
+@app.cli.command('ensure-schema')
+def ensure_schema_command():
+    """建立請購單必要欄位（flask --app app ensure-schema）"""
+    added = ensure_schema()
+    if added:
+        for sheet_name, columns in added.items():
+            print(f"{sheet_name} 已新增欄位: {', '.join(columns)}")
+    else:
+        print("所有必要欄位皆已存在")
+
+@app.cli.command('rotate-system-log')
+def rotate_system_log_command():
+    """將過期的系統日誌搬到每月封存工作表（flask --app app rotate-system-log）"""
+    archived = rotate_system_log()
+    if archived:
+        for title, count in sorted(archived.items()):
+            print(f"{title}: 封存 {count} 筆")
+    else:
+        print("沒有需要封存的系統日誌")
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
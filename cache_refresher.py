@@ -0,0 +1,198 @@
+"""
+快取背景更新模組
+每個 gunicorn worker 一個背景執行緒，在請購單、使用者帳號快照與主檔資料到期前重新讀取，
+讀取期間使用者請求繼續取得舊快照，穩定運作時使用者請求不必等待 Sheets 讀取
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, Optional, Callable, List
+
+from sheet_cache import get_sheet_cache
+from master_data import get_master_data
+from sheet_mirror import get_sheet_mirror
+
+# 設為 0 可停用背景更新（例如單次執行的維護腳本）
+REFRESHER_ENABLED = os.getenv('CACHE_REFRESHER', '1') != '0'
+
+# 檢查間隔秒數
+REFRESH_CHECK_INTERVAL = float(os.getenv('CACHE_REFRESH_INTERVAL', '2'))
+
+# 到期前多少秒開始重新讀取
+REFRESH_LEAD = float(os.getenv('CACHE_REFRESH_LEAD', '10'))
+
+# 背景更新的工作表快照
+REFRESH_SHEETS = ['請購單', '使用者帳號']
+
+
+class RefreshTarget:
+    """一個背景更新的快取"""
+
+    def __init__(self, name: str, ttl: Callable[[], float], age: Callable[[], Optional[float]],
+                 refresh: Callable[[], Any]):
+        """
+        Args:
+            name: 名稱（狀態顯示用）
+            ttl: 取得存活秒數
+            age: 取得目前資料已存在的秒數，尚未載入時為 None
+            refresh: 重新讀取
+        """
+        self.name = name
+        self.ttl = ttl
+        self.age = age
+        self.refresh = refresh
+        self.last_refresh_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def due(self, lead: float) -> bool:
+        age = self.age()
+        # 存活時間很短時至少保留一半的時間給快照使用
+        return age is None or age >= self.ttl() - min(lead, self.ttl() / 2)
+
+
+class CacheRefresher:
+    """快取背景更新器"""
+
+    def __init__(self, interval: float = REFRESH_CHECK_INTERVAL, lead: float = REFRESH_LEAD):
+        """
+        初始化更新器
+
+        Args:
+            interval: 檢查間隔秒數
+            lead: 到期前多少秒開始重新讀取
+        """
+        self.interval = interval
+        self.lead = lead
+        self.targets: List[RefreshTarget] = []
+        # 每次檢查後執行的工作（例如同步本機鏡像）
+        self.listeners: List[Callable[[], Any]] = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def register(self, target: RefreshTarget):
+        """加入背景更新的快取"""
+        self.targets.append(target)
+
+    def add_listener(self, listener: Callable[[], Any]):
+        """加入每次檢查後執行的工作"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """啟動背景執行緒；fork 後的子行程會重新啟動自己的執行緒"""
+        if not REFRESHER_ENABLED:
+            return
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='cache-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止背景執行緒"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh_due()
+            for listener in self.listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    print(f"背景工作失敗: {e}")
+            self._stop.wait(self.interval)
+
+    def refresh_due(self):
+        """重新讀取即將到期的快取"""
+        for target in self.targets:
+            try:
+                if not target.due(self.lead):
+                    continue
+                started = time.time()
+                target.refresh()
+                target.last_refresh_at = time.time()
+                target.last_duration = target.last_refresh_at - started
+                target.last_error = None
+            except Exception as e:
+                # 失敗時舊快照繼續使用，下次檢查再重試
+                target.last_error = str(e)
+                print(f"背景更新 {target.name} 失敗: {e}")
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各快取的更新狀態
+
+        Returns:
+            名稱 -> {'age', 'ttl', 'last_refresh_age', 'last_duration', 'last_error'}
+        """
+        now = time.time()
+        result = {}
+        for target in self.targets:
+            age = target.age()
+            result[target.name] = {
+                'age': round(age, 1) if age is not None else None,
+                'ttl': target.ttl(),
+                'last_refresh_age': round(now - target.last_refresh_at, 1) if target.last_refresh_at else None,
+                'last_duration': round(target.last_duration, 2) if target.last_duration is not None else None,
+                'last_error': target.last_error,
+            }
+        result['running'] = self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+        return result
+
+
+def sheet_target(sheet_name: str) -> RefreshTarget:
+    """工作表快照的更新設定"""
+    cache = get_sheet_cache(sheet_name)
+    return RefreshTarget(
+        sheet_name,
+        ttl=lambda: cache.ttl,
+        age=cache.age,
+        refresh=lambda: cache.get_snapshot(force=True)
+    )
+
+
+def master_data_target() -> RefreshTarget:
+    """主檔資料的更新設定"""
+    master_data = get_master_data()
+    return RefreshTarget(
+        '主檔資料',
+        ttl=lambda: master_data.ttl,
+        age=master_data.age,
+        refresh=master_data.refresh
+    )
+
+
+# 全域背景更新器
+_cache_refresher = None
+_cache_refresher_lock = threading.Lock()
+
+
+def get_cache_refresher() -> CacheRefresher:
+    """
+    取得全域背景更新器（已加入請購單、使用者帳號與主檔資料，啟用鏡像時同步鏡像）
+
+    Returns:
+        CacheRefresher 實例
+    """
+    global _cache_refresher
+
+    if _cache_refresher is None:
+        with _cache_refresher_lock:
+            if _cache_refresher is None:
+                refresher = CacheRefresher()
+                for sheet_name in REFRESH_SHEETS:
+                    refresher.register(sheet_target(sheet_name))
+                refresher.register(master_data_target())
+                mirror = get_sheet_mirror()
+                if mirror is not None:
+                    refresher.add_listener(mirror.sync_all)
+                _cache_refresher = refresher
+
+    return _cache_refresher
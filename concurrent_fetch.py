@@ -0,0 +1,113 @@
+"""
+並行讀取模組
+路由中彼此獨立的 Google Sheets 讀取以有上限的執行緒池同時送出，
+等待全部完成後一起回傳，回應時間取決於最慢的一個讀取而非總和
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+# 執行緒池大小上限，可用環境變數調整
+FETCH_MAX_WORKERS = int(os.getenv('FETCH_MAX_WORKERS', '4'))
+
+
+class ConcurrentFetcher:
+    """並行讀取器
+
+    - 執行緒池依 process 建立，fork 後自動重建
+    - 池內執行緒再呼叫 fetch 時直接依序執行，避免巢狀等待造成池耗盡
+    - 每個工作的例外在全部工作結束後才拋出，不會留下未完成的讀取
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        初始化讀取器
+
+        Args:
+            max_workers: 執行緒數上限，預設為 FETCH_MAX_WORKERS
+        """
+        self.max_workers = max_workers or FETCH_MAX_WORKERS
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._local = threading.local()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix='sheets-fetch',
+                        initializer=self._mark_worker
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _mark_worker(self):
+        self._local.is_worker = True
+
+    def fetch(self, tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """
+        同時執行多個獨立的讀取並等待全部完成
+
+        Args:
+            tasks: 名稱 -> 無參數的讀取函式
+
+        Returns:
+            名稱 -> 讀取結果
+        """
+        if len(tasks) <= 1 or getattr(self._local, 'is_worker', False):
+            return {key: task() for key, task in tasks.items()}
+
+        executor = self._get_executor()
+        futures = {key: executor.submit(task) for key, task in tasks.items()}
+
+        results = {}
+        error = None
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"並行讀取 {key} 失敗: {e}")
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return results
+
+
+# 全域並行讀取器實例
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_concurrent_fetcher() -> ConcurrentFetcher:
+    """
+    取得全域並行讀取器實例
+
+    Returns:
+        ConcurrentFetcher 實例
+    """
+    global _fetcher
+
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = ConcurrentFetcher()
+
+    return _fetcher
+
+
+def fetch_concurrently(**tasks: Callable[[], Any]) -> Dict[str, Any]:
+    """
+    以全域讀取器同時執行多個獨立的讀取
+
+    例：fetch_concurrently(users=lambda: ..., units=lambda: ...)
+
+    Returns:
+        名稱 -> 讀取結果
+    """
+    return get_concurrent_fetcher().fetch(tasks)
@@ -0,0 +1,60 @@
+"""
+離線測試共用設定
+匯入專案模組前先指定暫存的 APP_LOCK_DIR，並提供取代 Google Sheets 的假快取、工作表與連線池
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('APP_LOCK_DIR', tempfile.mkdtemp())
+
+
+class FakeCache:
+    """只提供 get_snapshot() 的快取，記錄讀取次數"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.reads = 0
+
+    def get_snapshot(self, force=False):
+        self.reads += 1
+        return self.snapshot
+
+
+class FakeWorksheet:
+    """整張工作表讀取（get()）的假工作表，on_read 可在讀取時模擬其他 worker 的動作"""
+
+    def __init__(self, title, rows=None):
+        self.title = title
+        self.spreadsheet_id = 'fake'
+        self.rows = rows or []
+        self.reads = 0
+        self.on_read = None
+
+    def get(self, range_name=None, pad_values=True):
+        self.reads += 1
+        if self.on_read is not None:
+            self.on_read()
+        return [list(row) for row in self.rows]
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets):
+        self._worksheets = worksheets
+
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+
+class FakePool:
+    """取代 get_sheets_pool() 的連線池（工作表名稱 -> FakeWorksheet）"""
+
+    def __init__(self, worksheets):
+        self.worksheets = worksheets
+        self.spreadsheet = FakeSpreadsheet(worksheets)
+
+    def get_worksheet(self, sheet_name):
+        return self.worksheets[sheet_name]
+
+    def get_spreadsheet(self):
+        return self.spreadsheet
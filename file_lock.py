@@ -0,0 +1,86 @@
+"""
+跨行程檔案鎖
+讓同一台主機上的多個 gunicorn worker 互斥執行關鍵區段（例如欄位建立、單號配號）
+"""
+
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 本機開發環境
+    fcntl = None
+
+# 鎖檔存放目錄，可用環境變數指定（需為所有 worker 共用的本機路徑）
+LOCK_DIR = os.getenv('APP_LOCK_DIR', tempfile.gettempdir())
+
+
+class FileLock:
+    """以 flock 實作的跨行程互斥鎖，同一行程內的執行緒另以 threading.Lock 互斥
+
+    用法：
+        with FileLock('purchase_no'):
+            ...
+    """
+
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, name: str):
+        """
+        初始化檔案鎖
+
+        Args:
+            name: 鎖名稱，對應到 LOCK_DIR 下的 hrsystem_<name>.lock
+        """
+        self.path = os.path.join(LOCK_DIR, f'hrsystem_{name}.lock')
+        with FileLock._thread_locks_guard:
+            self._thread_lock = FileLock._thread_locks.setdefault(self.path, threading.Lock())
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        取得鎖
+
+        Args:
+            blocking: 是否等待；False 時鎖已被占用就立即回傳 False
+
+        Returns:
+            是否取得鎖
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._fd)
+            self._fd = None
+            self._thread_lock.release()
+            return False
+        except Exception:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            if self._fd is not None:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+        finally:
+            self._fd = None
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -220,8 +220,8 @@ def remove_purchase_protection(purchase_no: str) -> Dict[str, Any]:
     """
     # 需要先找到請購單對應的列號
     # 這裡需要整合現有的 Google Sheets 查詢邏輯
-    from app import get_google_sheets_client, get_safe_records
-    import os
+    from app import get_google_sheets_client
+    from sheet_cache import get_sheet_cache
     
     try:
         client = get_google_sheets_client()
@@ -231,18 +231,8 @@ def remove_purchase_protection(purchase_no: str) -> Dict[str, Any]:
                 'message': '無法連接到 Google Sheets'
             }
         
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 找到請購單對應的列號
-        all_records = get_safe_records(worksheet)
-        target_row = None
-        
-        for i, record in enumerate(all_records, start=2):
-            if record.get('請購單號') == purchase_no:
-                target_row = i
-                break
+        # 依請購單號索引找到對應的列號
+        target_row, purchase_record = get_sheet_cache('請購單').find(purchase_no)
         
         if not target_row:
             return {
@@ -276,8 +266,8 @@ def check_purchase_protection(purchase_no: str) -> Dict[str, Any]:
         檢查結果字典
     """
     # 需要先找到請購單對應的列號
-    from app import get_google_sheets_client, get_safe_records
-    import os
+    from app import get_google_sheets_client
+    from sheet_cache import get_sheet_cache
     
     try:
         client = get_google_sheets_client()
@@ -287,18 +277,8 @@ def check_purchase_protection(purchase_no: str) -> Dict[str, Any]:
                 'message': '無法連接到 Google Sheets'
             }
         
-        spreadsheet_id = os.getenv('SPREADSHEET_ID')
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet('請購單')
-        
-        # 找到請購單對應的列號
-        all_records = get_safe_records(worksheet)
-        target_row = None
-        
-        for i, record in enumerate(all_records, start=2):
-            if record.get('請購單號') == purchase_no:
-                target_row = i
-                break
+        # 依請購單號索引找到對應的列號
+        target_row, purchase_record = get_sheet_cache('請購單').find(purchase_no)
         
         if not target_row:
             return {
@@ -0,0 +1,25 @@
+"""
+gunicorn 設定
+gunicorn 啟動時自動載入目前目錄的 gunicorn.conf.py；
+主行程在建立 worker 前確認一次必要欄位，請求中不必再補建欄位。
+部署時已另外執行 flask --app app ensure-schema 者，可設定 ENSURE_SCHEMA_ON_STARTUP=false 略過
+（略過或失敗時，請求中缺少欄位仍會補建）
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+
+def on_starting(server):
+    """主行程啟動時（建立 worker 之前）執行一次"""
+    load_dotenv()
+    if os.getenv('ENSURE_SCHEMA_ON_STARTUP', 'true').lower() == 'false':
+        return
+    try:
+        from sheet_schema import ensure_schema
+        added = ensure_schema()
+        for sheet_name, columns in added.items():
+            print(f"{sheet_name} 已新增欄位: {', '.join(columns)}")
+    except Exception as e:
+        print(f"啟動時確認欄位結構失敗: {e}")
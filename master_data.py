@@ -0,0 +1,137 @@
+"""
+主檔資料快取模組
+請購部門、單位等下拉選單主檔很少變動，以一次 values_batch_get 讀取所有主檔工作表，
+長時間快取在記憶體中；管理者修改主檔後可手動重新載入
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, Optional, List
+
+from sheets_client import get_sheets_pool
+
+# 主檔工作表與下拉選單使用的欄位
+MASTER_DATA_SHEETS = {
+    '請購部門': '部門名稱',
+    '單位': '單位名稱',
+}
+
+# 主檔存活秒數，可用環境變數調整
+MASTER_DATA_TTL = int(os.getenv('MASTER_DATA_TTL', '3600'))
+
+
+def parse_sheet_values(values: List[List[Any]]) -> List[Dict[str, Any]]:
+    """將含標題列的儲存格值轉為記錄列表"""
+    if not values:
+        return []
+    headers = values[0]
+    return [
+        dict(zip(headers, list(row) + [''] * (len(headers) - len(row))))
+        for row in values[1:]
+    ]
+
+
+class MasterDataCache:
+    """主檔資料快取"""
+
+    def __init__(self, sheets: Optional[Dict[str, str]] = None, ttl: Optional[int] = None):
+        """
+        初始化快取
+
+        Args:
+            sheets: 工作表名稱 -> 下拉選單欄位，預設為 MASTER_DATA_SHEETS
+            ttl: 存活秒數，預設為 MASTER_DATA_TTL
+        """
+        self.sheets = dict(sheets or MASTER_DATA_SHEETS)
+        self.ttl = MASTER_DATA_TTL if ttl is None else ttl
+        self._records: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def age(self) -> Optional[float]:
+        """目前資料已存在的秒數，尚未載入時為 None"""
+        return time.time() - self._fetched_at if self._records is not None else None
+
+    def refresh(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        以一次 values_batch_get 重新讀取所有主檔工作表
+
+        Returns:
+            工作表名稱 -> 記錄列表
+        """
+        titles = list(self.sheets)
+        spreadsheet = get_sheets_pool().get_spreadsheet()
+        response = spreadsheet.values_batch_get([f"'{title}'!A:Z" for title in titles])
+        value_ranges = response.get('valueRanges', [])
+
+        records = {}
+        for title, value_range in zip(titles, value_ranges):
+            records[title] = parse_sheet_values(value_range.get('values', []))
+
+        with self._lock:
+            self._records = records
+            self._fetched_at = time.time()
+        print(f"DEBUG: 主檔資料已重新載入: {', '.join(f'{t} {len(r)} 筆' for t, r in records.items())}")
+        return records
+
+    def get_records(self, sheet_name: str) -> List[Dict[str, Any]]:
+        """
+        取得主檔記錄（過期才重新讀取）
+
+        Args:
+            sheet_name: 主檔工作表名稱
+
+        Returns:
+            記錄列表副本
+        """
+        records = self._records
+        if records is None or time.time() - self._fetched_at >= self.ttl:
+            # 同時過期的請求只由一個執行緒重新讀取
+            with self._refresh_lock:
+                records = self._records
+                if records is None or time.time() - self._fetched_at >= self.ttl:
+                    records = self.refresh()
+        return [dict(record) for record in records.get(sheet_name, [])]
+
+    def get_list(self, sheet_name: str, col_name: Optional[str] = None) -> List[Any]:
+        """
+        取得下拉選單選項
+
+        Args:
+            sheet_name: 主檔工作表名稱
+            col_name: 欄位名稱，預設為 MASTER_DATA_SHEETS 的設定
+
+        Returns:
+            非空白的欄位值列表
+        """
+        col_name = col_name or self.sheets.get(sheet_name)
+        return [r[col_name] for r in self.get_records(sheet_name) if col_name in r and r[col_name]]
+
+    def invalidate(self):
+        """使主檔資料失效，下次讀取時重新載入"""
+        with self._lock:
+            self._records = None
+
+
+# 全域主檔快取實例
+_master_data = None
+_master_data_lock = threading.Lock()
+
+
+def get_master_data() -> MasterDataCache:
+    """
+    取得全域主檔快取實例
+
+    Returns:
+        MasterDataCache 實例
+    """
+    global _master_data
+
+    if _master_data is None:
+        with _master_data_lock:
+            if _master_data is None:
+                _master_data = MasterDataCache()
+
+    return _master_data
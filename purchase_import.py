@@ -0,0 +1,258 @@
+"""
+請購單批次匯入模組
+以串流方式讀取上傳的 CSV 或 XLSX（openpyxl read_only 模式），依主檔快取驗證請購部門與單位，
+一次配發所有請購單號，分批以 append_rows 寫入並控制寫入速率，回傳逐列的匯入結果
+"""
+
+import io
+import os
+import csv
+import math
+import time
+from datetime import datetime, date
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+
+import openpyxl
+
+from sheets_client import get_sheets_pool
+from sheet_cache import get_sheet_cache
+from master_data import get_master_data
+from purchase_no import get_purchase_no_allocator
+
+# 每次 append_rows 寫入的列數
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '500'))
+
+# 每分鐘最多的寫入請求數（Google Sheets 每位使用者每分鐘 60 次寫入）
+IMPORT_WRITES_PER_MINUTE = int(os.getenv('IMPORT_WRITES_PER_MINUTE', '50'))
+
+# 單一檔案的列數上限
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '5000'))
+
+# 匯入的請購單簽核狀態（與新增請購單表單的預設值相同，才會列入待簽核筆數）
+IMPORT_SIGN_STATUS = '待簽核'
+
+# 匯入檔案的欄位標題 -> 欄位代號
+IMPORT_COLUMNS = {
+    '請購部門': 'department',
+    '品名': 'item_name',
+    '規格': 'spec',
+    '數量': 'quantity',
+    '單位': 'unit',
+    '需求日期': 'need_date',
+    '用途': 'purpose',
+    '備註': 'note',
+}
+
+REQUIRED_IMPORT_COLUMNS = ['請購部門', '品名', '數量', '單位', '需求日期']
+
+
+class ImportFileError(Exception):
+    """匯入檔案格式錯誤（整個檔案無法匯入）"""
+
+
+def _iter_csv(stream) -> Iterator[List[Any]]:
+    # utf-8-sig 可處理 Excel 另存 CSV 時加上的 BOM
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        text.detach()
+
+
+def _iter_xlsx(stream) -> Iterator[List[Any]]:
+    # read_only 模式逐列讀取，不會把整個活頁簿載入記憶體
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def iter_import_rows(file_storage) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    逐列讀取上傳檔案
+
+    Args:
+        file_storage: Flask 上傳檔案
+
+    Yields:
+        (檔案列號, 欄位代號 -> 值)，略過空白列
+    """
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.csv'):
+        rows = _iter_csv(file_storage.stream)
+    elif filename.endswith('.xlsx'):
+        rows = _iter_xlsx(file_storage.stream)
+    else:
+        raise ImportFileError('僅支援 CSV 或 XLSX 檔案')
+
+    headers = None
+    for line_no, row in enumerate(rows, 1):
+        if headers is None:
+            headers = [str(value or '').strip() for value in row]
+            missing = [name for name in REQUIRED_IMPORT_COLUMNS if name not in headers]
+            if missing:
+                raise ImportFileError(f"缺少欄位: {', '.join(missing)}")
+            continue
+        if all(value is None or str(value).strip() == '' for value in row):
+            continue
+        record = {}
+        for header, value in zip(headers, row):
+            if header in IMPORT_COLUMNS:
+                record[IMPORT_COLUMNS[header]] = value
+        yield line_no, record
+
+    if headers is None:
+        raise ImportFileError('檔案沒有內容')
+
+
+def _normalize_date(value: Any) -> Optional[str]:
+    """需求日期統一為 YYYY-MM-DD（與新增頁面的日期欄位相同）"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    text = str(value or '').strip()
+    for fmt in ('%Y-%m-%d', '%Y/%m/%d', '%Y%m%d'):
+        try:
+            return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def _normalize_quantity(value: Any) -> Optional[int]:
+    try:
+        quantity = float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(quantity):
+        # inf、nan、1e400 無法轉為整數
+        return None
+    if quantity <= 0 or quantity != int(quantity):
+        return None
+    return int(quantity)
+
+
+def validate_import_row(record: Dict[str, Any], departments: set, units: set) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    驗證並整理一列匯入資料
+
+    Args:
+        record: 欄位代號 -> 值
+        departments: 有效的請購部門
+        units: 有效的單位
+
+    Returns:
+        (整理後的品項, 錯誤訊息列表)
+    """
+    item = {field: str(record.get(field) if record.get(field) is not None else '').strip()
+            for field in IMPORT_COLUMNS.values()}
+    errors = []
+
+    if not item['item_name']:
+        errors.append('品名不可空白')
+    if item['department'] not in departments:
+        errors.append(f"請購部門「{item['department']}」不存在")
+    if item['unit'] not in units:
+        errors.append(f"單位「{item['unit']}」不存在")
+
+    quantity = _normalize_quantity(record.get('quantity'))
+    if quantity is None:
+        errors.append('數量需為正整數')
+    else:
+        item['quantity'] = str(quantity)
+
+    need_date = _normalize_date(record.get('need_date'))
+    if need_date is None:
+        errors.append('需求日期格式錯誤')
+    else:
+        item['need_date'] = need_date
+
+    return item, errors
+
+
+class WritePacer:
+    """控制寫入請求的最小間隔"""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._last = None
+
+    def wait(self):
+        if self._last is not None:
+            remaining = self.interval - (time.monotonic() - self._last)
+            if remaining > 0:
+                time.sleep(remaining)
+        self._last = time.monotonic()
+
+
+def import_purchase_requests(file_storage, applicant: str, applicant_mail: str) -> Dict[str, Any]:
+    """
+    匯入請購單
+
+    Args:
+        file_storage: Flask 上傳檔案（CSV 或 XLSX）
+        applicant: 申請人
+        applicant_mail: 申請人mail
+
+    Returns:
+        {'total', 'imported', 'failed', 'purchase_nos', 'rows'}，
+        rows 為逐列結果 {'line', 'status', 'purchase_no', 'errors'}
+    """
+    master_data = get_master_data()
+    departments = set(str(d) for d in master_data.get_list('請購部門'))
+    units = set(str(u) for u in master_data.get_list('單位'))
+
+    report = []
+    valid = []
+    for line_no, record in iter_import_rows(file_storage):
+        if len(report) >= IMPORT_MAX_ROWS:
+            raise ImportFileError(f'超過單次匯入上限 {IMPORT_MAX_ROWS} 列')
+        item, errors = validate_import_row(record, departments, units)
+        entry = {'line': line_no, 'status': '失敗' if errors else '待寫入', 'purchase_no': '', 'errors': errors}
+        report.append(entry)
+        if not errors:
+            valid.append((entry, item))
+
+    purchase_nos = []
+    if valid:
+        # 一次配發所有單號
+        purchase_nos = get_purchase_no_allocator().allocate(len(valid))
+        today = datetime.now().strftime('%Y%m%d')
+        rows = []
+        for purchase_no, (entry, item) in zip(purchase_nos, valid):
+            entry['purchase_no'] = purchase_no
+            rows.append([
+                purchase_no, today, item['department'], applicant, applicant_mail,
+                item['item_name'], item['spec'], item['quantity'], item['unit'],
+                item['need_date'], item['purpose'], '', item['note'], IMPORT_SIGN_STATUS, ''
+            ])
+
+        worksheet = get_sheets_pool().get_worksheet('請購單')
+        pacer = WritePacer(IMPORT_WRITES_PER_MINUTE)
+        try:
+            for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+                pacer.wait()
+                worksheet.append_rows(rows[start:start + IMPORT_CHUNK_SIZE])
+                for entry, item in valid[start:start + IMPORT_CHUNK_SIZE]:
+                    entry['status'] = '成功'
+                print(f"DEBUG: 匯入請購單 {min(start + IMPORT_CHUNK_SIZE, len(rows))}/{len(rows)} 列")
+        except Exception as e:
+            print(f"匯入請購單寫入失敗: {e}")
+            for entry, item in valid:
+                if entry['status'] == '待寫入':
+                    entry['status'] = '失敗'
+                    entry['errors'].append('寫入失敗，請重新匯入此列')
+        finally:
+            get_sheet_cache('請購單').invalidate()
+
+    imported = [entry['purchase_no'] for entry in report if entry['status'] == '成功']
+    return {
+        'total': len(report),
+        'imported': len(imported),
+        'failed': len(report) - len(imported),
+        'purchase_nos': imported,
+        'rows': report,
+    }
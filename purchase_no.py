@@ -0,0 +1,137 @@
+"""
+請購單號配號模組
+以每日流水號計數器配發請購單號 (YYYYmmdd-流水號)，計數器存放於本機檔案並以跨行程檔案鎖保護，
+每天只在第一次配號時由請購單快照找出當日最大流水號作為起點，之後配號不再讀取工作表
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from file_lock import FileLock, LOCK_DIR
+from sheet_cache import get_sheet_cache
+
+# 計數器檔案（需為所有 worker 共用的本機路徑）
+SEQUENCE_FILE = os.path.join(LOCK_DIR, 'hrsystem_purchase_no_seq.json')
+
+
+def format_purchase_no(day: str, seq: int) -> str:
+    """組成請購單號，例如 20250718-001"""
+    return f"{day}-{seq:03d}"
+
+
+def max_sequence_for_day(records: List[Dict[str, Any]], day: str) -> int:
+    """
+    找出記錄中指定日期已使用的最大流水號
+
+    Args:
+        records: 請購單記錄列表
+        day: 日期 (YYYYmmdd)
+
+    Returns:
+        最大流水號，當日尚無請購單時為 0
+    """
+    max_seq = 0
+    for record in records:
+        no = str(record.get('請購單號', ''))
+        if not no.startswith(day):
+            continue
+        try:
+            max_seq = max(max_seq, int(no.split('-')[1]))
+        except (IndexError, ValueError):
+            continue
+    return max_seq
+
+
+class PurchaseNoAllocator:
+    """每日流水號配號器
+
+    計數器內容為 {"date": "YYYYmmdd", "seq": 最後配出的流水號}，
+    讀取、遞增、寫回都在 FileLock('purchase_no') 內完成，多個 worker 同時送出也不會重號。
+    """
+
+    def __init__(self, path: str = SEQUENCE_FILE):
+        """
+        初始化配號器
+
+        Args:
+            path: 計數器檔案路徑
+        """
+        self.path = path
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, state: Dict[str, Any]):
+        # 先寫暫存檔再取代，避免寫到一半中斷留下損壞的計數器
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _current_seq(self, day: str) -> int:
+        """取得指定日期最後配出的流水號；換日時由快照重新起算（鎖內呼叫）"""
+        state = self._read_state()
+        if state and state.get('date') == day:
+            return int(state.get('seq', 0))
+
+        # 每天第一次配號：強制重新讀取快照，納入工作表上手動新增的請購單
+        snapshot = get_sheet_cache('請購單').get_snapshot(force=True)
+        seq = max_sequence_for_day(snapshot.records, day)
+        print(f"DEBUG: 請購單號計數器換日 {day}，由快照起算流水號 {seq}")
+        return seq
+
+    def allocate(self, count: int = 1) -> List[str]:
+        """
+        配發連續的請購單號
+
+        Args:
+            count: 配發數量
+
+        Returns:
+            請購單號列表
+        """
+        day = datetime.now().strftime('%Y%m%d')
+        with FileLock('purchase_no'):
+            seq = self._current_seq(day)
+            self._write_state({'date': day, 'seq': seq + count})
+        return [format_purchase_no(day, seq + i) for i in range(1, count + 1)]
+
+    def allocate_one(self) -> str:
+        """配發一個請購單號"""
+        return self.allocate(1)[0]
+
+    def peek(self) -> str:
+        """預覽下一個請購單號（僅供畫面顯示，不會保留該號碼）"""
+        day = datetime.now().strftime('%Y%m%d')
+        state = self._read_state()
+        if state and state.get('date') == day:
+            return format_purchase_no(day, int(state.get('seq', 0)) + 1)
+        # 當日尚未配號時由目前快照推算，不觸發換日起算
+        records = get_sheet_cache('請購單').get_snapshot().records
+        return format_purchase_no(day, max_sequence_for_day(records, day) + 1)
+
+
+# 全域配號器實例
+_purchase_no_allocator = None
+
+
+def get_purchase_no_allocator() -> PurchaseNoAllocator:
+    """
+    取得全域配號器實例
+
+    Returns:
+        PurchaseNoAllocator 實例
+    """
+    global _purchase_no_allocator
+
+    if _purchase_no_allocator is None:
+        _purchase_no_allocator = PurchaseNoAllocator()
+
+    return _purchase_no_allocator
@@ -0,0 +1,257 @@
+"""
+Google API 配額控管模組
+以權杖桶限制 Sheets 讀取、寫入與 Drive 請求的速率，權杖狀態存於本機檔案，
+同一台主機上所有 gunicorn worker 與執行緒共用；遇到配額或暫時性錯誤時以隨機化的指數退避重試
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from typing import Dict, Any, Optional, Callable
+
+import requests
+
+from file_lock import FileLock, LOCK_DIR
+
+# 每分鐘請求數上限（預設為 Google Sheets 每位使用者每分鐘 60 次讀取、60 次寫入）
+QUOTA_LIMITS = {
+    'read': int(os.getenv('SHEETS_READS_PER_MINUTE', '60')),
+    'write': int(os.getenv('SHEETS_WRITES_PER_MINUTE', '60')),
+    'drive': int(os.getenv('DRIVE_REQUESTS_PER_MINUTE', '600')),
+}
+
+# 設為 0 可停用速率限制（仍會重試）
+QUOTA_ENABLED = os.getenv('QUOTA_GOVERNOR', '1') != '0'
+
+# 等待權杖的最長秒數，超過時拋出 QuotaExceededError
+QUOTA_MAX_WAIT = float(os.getenv('QUOTA_MAX_WAIT', '10'))
+
+# 單次 API 呼叫（含等待權杖與重試退避）的總秒數上限，
+# 需遠低於 gunicorn worker 逾時（預設 30 秒），避免 worker 在請求中被終止
+QUOTA_CALL_BUDGET = float(os.getenv('QUOTA_CALL_BUDGET', '15'))
+
+# 重試次數與退避秒數
+QUOTA_MAX_RETRIES = int(os.getenv('QUOTA_MAX_RETRIES', '5'))
+QUOTA_BACKOFF_BASE = float(os.getenv('QUOTA_BACKOFF_BASE', '1'))
+QUOTA_BACKOFF_MAX = float(os.getenv('QUOTA_BACKOFF_MAX', '32'))
+
+# 權杖桶狀態檔
+QUOTA_STATE_FILE = os.path.join(LOCK_DIR, 'hrsystem_quota.json')
+
+# 任何請求都可重試的狀態碼（請求已被拒絕，重送不會重複寫入）
+RATE_LIMIT_STATUSES = {429}
+# 只有可重複執行的請求（讀取）才重試的暫時性錯誤
+TRANSIENT_STATUSES = {408, 500, 502, 503, 504}
+# 403 的這些原因代表配額不足而非權限不足
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'RATE_LIMIT_EXCEEDED', 'usageLimits')
+
+
+class QuotaExceededError(Exception):
+    """等待配額逾時"""
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """
+    取得 API 錯誤的 HTTP 狀態碼
+
+    Returns:
+        狀態碼；連線錯誤或逾時為 0；無法辨識時為 None
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return 0
+    code = getattr(error, 'code', None)  # gspread APIError
+    if isinstance(code, int):
+        return code
+    resp = getattr(error, 'resp', None)  # googleapiclient HttpError
+    if resp is not None and getattr(resp, 'status', None) is not None:
+        return int(resp.status)
+    return None
+
+
+def is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """
+    判斷錯誤是否可重試
+
+    Args:
+        error: 例外
+        idempotent: 請求可否重複執行（寫入請求只在確定被拒絕時重試）
+    """
+    status = error_status(error)
+    if status is None:
+        return False
+    if status in RATE_LIMIT_STATUSES:
+        return True
+    if status == 403:
+        return any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+    return idempotent and (status == 0 or status in TRANSIENT_STATUSES)
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重試前的等待秒數（full jitter）"""
+    return random.uniform(0, min(QUOTA_BACKOFF_MAX, QUOTA_BACKOFF_BASE * (2 ** attempt)))
+
+
+class QuotaGovernor:
+    """跨行程共用的權杖桶
+
+    每個配額類別一個桶，容量為每分鐘上限，依經過時間連續補充；
+    收到 429 時清空該桶，讓其他 worker 一起放慢。
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, path: str = QUOTA_STATE_FILE):
+        """
+        初始化配額控管
+
+        Args:
+            limits: 類別 -> 每分鐘上限，預設為 QUOTA_LIMITS
+            path: 權杖桶狀態檔路徑
+        """
+        self.limits = dict(limits or QUOTA_LIMITS)
+        self.path = path
+
+    def _read_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state: Dict[str, Any]):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _refill(self, state: Dict[str, Any], bucket: str, now: float) -> Dict[str, float]:
+        capacity = self.limits[bucket]
+        entry = state.get(bucket) or {'tokens': capacity, 'updated': now}
+        elapsed = max(0.0, now - entry['updated'])
+        entry = {
+            'tokens': min(capacity, entry['tokens'] + elapsed * capacity / 60.0),
+            'updated': now,
+        }
+        state[bucket] = entry
+        return entry
+
+    def acquire(self, bucket: str, deadline: Optional[float] = None):
+        """
+        取得一個權杖，不足時等待補充
+
+        Args:
+            bucket: 'read'、'write' 或 'drive'
+            deadline: 最晚等待到的時間，預設為 QUOTA_MAX_WAIT 秒後
+        """
+        if not QUOTA_ENABLED or bucket not in self.limits or self.limits[bucket] <= 0:
+            return
+        deadline = min(deadline or float('inf'), time.time() + QUOTA_MAX_WAIT)
+        while True:
+            with FileLock('quota'):
+                now = time.time()
+                state = self._read_state()
+                entry = self._refill(state, bucket, now)
+                if entry['tokens'] >= 1:
+                    entry['tokens'] -= 1
+                    self._write_state(state)
+                    return
+                self._write_state(state)
+                wait = (1 - entry['tokens']) * 60.0 / self.limits[bucket]
+            if now + wait > deadline:
+                raise QuotaExceededError(f'Google API {bucket} 配額不足，請稍後再試')
+            time.sleep(wait)
+
+    def penalize(self, bucket: str):
+        """收到配額錯誤時清空權杖桶"""
+        if bucket not in self.limits:
+            return
+        with FileLock('quota'):
+            state = self._read_state()
+            entry = self._refill(state, bucket, time.time())
+            entry['tokens'] = min(entry['tokens'], 0.0)
+            self._write_state(state)
+
+    def remaining(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各類別目前可用的配額
+
+        Returns:
+            類別 -> {'remaining', 'per_minute'}
+        """
+        with FileLock('quota'):
+            state = self._read_state()
+            now = time.time()
+            result = {}
+            for bucket, per_minute in self.limits.items():
+                entry = self._refill(state, bucket, now)
+                result[bucket] = {'remaining': int(entry['tokens']), 'per_minute': per_minute}
+        return result
+
+    def call(self, func: Callable[[], Any], bucket: str, idempotent: bool = True) -> Any:
+        """
+        取得權杖後執行 API 呼叫，可重試的錯誤以指數退避重試；
+        等待與重試的總時間不超過 QUOTA_CALL_BUDGET 秒
+
+        Args:
+            func: 無參數的 API 呼叫
+            bucket: 配額類別
+            idempotent: 請求可否重複執行
+
+        Returns:
+            func 的回傳值
+        """
+        deadline = time.time() + QUOTA_CALL_BUDGET
+        for attempt in range(QUOTA_MAX_RETRIES + 1):
+            self.acquire(bucket, deadline)
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= QUOTA_MAX_RETRIES or not is_retryable(e, idempotent):
+                    raise
+                rate_limited = error_status(e) in RATE_LIMIT_STATUSES or error_status(e) == 403
+                if rate_limited:
+                    self.penalize(bucket)
+                delay = backoff_delay(attempt)
+                if time.time() + delay > deadline:
+                    if rate_limited:
+                        raise QuotaExceededError(f'Google API {bucket} 配額不足，請稍後再試') from e
+                    raise
+                print(f"DEBUG: Google API {bucket} 請求失敗（{error_status(e)}），{delay:.1f} 秒後第 {attempt + 1} 次重試")
+                time.sleep(delay)
+
+
+# 全域配額控管實例
+_quota_governor = None
+_quota_governor_lock = threading.Lock()
+
+
+def get_quota_governor() -> QuotaGovernor:
+    """
+    取得全域配額控管實例
+
+    Returns:
+        QuotaGovernor 實例
+    """
+    global _quota_governor
+
+    if _quota_governor is None:
+        with _quota_governor_lock:
+            if _quota_governor is None:
+                _quota_governor = QuotaGovernor()
+
+    return _quota_governor
+
+
+def execute_with_quota(request, bucket: str = 'drive', idempotent: bool = True) -> Any:
+    """
+    以配額控管執行 googleapiclient 請求
+
+    Args:
+        request: googleapiclient 的 HttpRequest
+        bucket: 配額類別
+        idempotent: 請求可否重複執行
+
+    Returns:
+        request.execute() 的結果
+    """
+    return get_quota_governor().call(request.execute, bucket, idempotent)
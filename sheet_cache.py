@@ -0,0 +1,610 @@
+"""
+工作表快照快取模組
+將整張工作表讀成快照保存在記憶體中，依 TTL 自動更新，
+寫入時由呼叫端同步修補或使之失效，避免每次頁面載入都讀取整張工作表
+"""
+
+import os
+import time
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional, List, Tuple, Set, FrozenSet, Callable
+
+from gspread.utils import numericise_all, numericise, rowcol_to_a1
+
+from file_lock import FileLock
+from sheets_client import get_sheets_pool
+from snapshot_store import get_snapshot_store, StoredSnapshot, StoredPatch, apply_patch_rows
+from single_flight import SingleFlight, get_single_flight, fetch_values, flight_key
+
+# 快照存活秒數，可用環境變數調整
+DEFAULT_CACHE_TTL = int(os.getenv('SHEET_CACHE_TTL', '60'))
+
+# 快照保留的修補紀錄筆數（供鏡像等衍生資料只更新修補過的列）
+PATCH_LOG_SIZE = 50
+
+
+def read_sheet_values(worksheet, numericise_values: bool = True,
+                      fresh: bool = False) -> Tuple[List[str], List[Dict[str, Any]], bool]:
+    """
+    一次讀取整張工作表並轉為記錄，處理重複標題問題
+
+    同時進行的整張工作表讀取會合併為一次
+
+    Args:
+        worksheet: gspread 工作表
+        numericise_values: 是否將數值字串轉為數字（與 get_all_records() 相同）
+        fresh: 是否不加入進行中的讀取（需要讀到最新資料時）
+
+    Returns:
+        (標題列, 記錄列表, 是否已數值化)
+    """
+    entire_sheet = fetch_values(worksheet, fresh=fresh)
+    if not entire_sheet or entire_sheet == [[]]:
+        return [], [], True
+
+    headers = entire_sheet[0]
+    data_rows = entire_sheet[1:]
+    duplicates = [h for h, count in Counter(headers).items() if count > 1]
+
+    if not duplicates and not numericise_values:
+        records = [dict(zip(headers, row)) for row in data_rows]
+        return headers, records, False
+
+    if not duplicates:
+        # 與 get_all_records() 相同：數值字串轉為數字
+        records = [dict(zip(headers, numericise_all(row))) for row in data_rows]
+        return headers, records, True
+
+    print("DEBUG: 檢測到重複標題，使用手動標題設定")
+    # 清理重複和空標題
+    cleaned_headers = []
+    for i, header in enumerate(headers):
+        if header:
+            cleaned_headers.append(header)
+        else:
+            cleaned_headers.append(f'Column_{i+1}')
+
+    records = []
+    for row in data_rows:
+        record = {}
+        for i, value in enumerate(row):
+            if i < len(cleaned_headers):
+                record[cleaned_headers[i]] = value
+        records.append(record)
+    return cleaned_headers, records, False
+
+
+def build_key_index(records: List[Dict[str, Any]], key_column: str) -> Dict[str, int]:
+    """
+    建立主鍵索引，同時收錄原始值與去除 '-' 的值（例如 20250718-001 與 20250718001）
+
+    Args:
+        records: 記錄列表
+        key_column: 主鍵欄位名稱
+
+    Returns:
+        主鍵 -> 記錄索引；重複主鍵以第一筆為準
+    """
+    index = {}
+    for i, record in enumerate(records):
+        key = str(record.get(key_column, '')).strip()
+        if not key:
+            continue
+        index.setdefault(key, i)
+        index.setdefault(key.replace('-', ''), i)
+    return index
+
+
+class SheetSnapshot:
+    """工作表快照（建立後不再修改，修補時產生新版本）"""
+
+    def __init__(self, sheet_name: str, headers: List[str], records: List[Dict[str, Any]],
+                 version: int, fetched_at: float, numericised: bool = True,
+                 key_column: Optional[str] = None, key_index: Optional[Dict[str, int]] = None,
+                 patch_log: Tuple[Tuple[int, FrozenSet[int]], ...] = ()):
+        self.sheet_name = sheet_name
+        self.headers = headers
+        self.records = records
+        self.version = version
+        self.fetched_at = fetched_at
+        self.numericised = numericised
+        self.key_column = key_column
+        if key_index is None and key_column:
+            key_index = build_key_index(records, key_column)
+        self.key_index = key_index or {}
+        # (修補前版本, 修補的記錄索引)，由舊到新
+        self.patch_log = patch_log
+
+    def changed_since(self, version: int) -> Optional[Set[int]]:
+        """
+        取得某個較舊版本之後修補過的記錄索引
+
+        Args:
+            version: 較舊的快照版本
+
+        Returns:
+            記錄索引集合；該版本不在修補紀錄中（例如期間曾重新載入）時為 None
+        """
+        for i, (base_version, _) in enumerate(self.patch_log):
+            if base_version == version:
+                changed = set()
+                for _, later in self.patch_log[i:]:
+                    changed |= later
+                return changed
+        return None
+
+    def lookup(self, key: Any) -> Optional[int]:
+        """依主鍵取得記錄索引，找不到時回傳 None"""
+        if key is None:
+            return None
+        return self.key_index.get(str(key).strip())
+
+    def age(self) -> float:
+        """快照已存在的秒數"""
+        return time.time() - self.fetched_at
+
+    def row_number(self, index: int) -> int:
+        """記錄索引轉為工作表列號（第1列是標題）"""
+        return index + 2
+
+
+class SheetCache:
+    """單一工作表的快照快取
+
+    讀取時若快照過期才重新讀取整張工作表；寫入端透過 apply_cell_updates()
+    修補快照，無法修補時呼叫 invalidate() 讓下次讀取重新載入。
+
+    同時過期的讀取合併為一次載入，載入期間不持有快照鎖，修補與失效不必等待讀取完成；
+    載入期間若快照被修補或失效，該次載入的結果只回給當時的等待者，不會存成快照。
+    已有執行緒（例如背景更新）在重新讀取時，過期的快照先回傳給請求端，不必等待。
+
+    啟用共用快照時，快照同時存於 SnapshotStore：每次取得快照先比對共用版本，
+    其他 worker 已更新就直接載入、已失效就重新讀取；同一時間只有一個 worker 從 Sheets 讀取，
+    修補與失效也寫回共用儲存，下一個請求在任何 worker 都看得到。
+    不共用記錄的工作表（例如含密碼的使用者帳號）只共用版本號：修補與失效都遞增共用版本，
+    其他 worker 比對到版本改變就自行從 Sheets 重新讀取。
+    """
+
+    def __init__(self, sheet_name: str, ttl: Optional[int] = None, key_column: Optional[str] = None,
+                 numericise_values: bool = True, share_records: bool = True):
+        """
+        初始化快取
+
+        Args:
+            sheet_name: 工作表名稱
+            ttl: 快照存活秒數，預設為 SHEET_CACHE_TTL
+            key_column: 主鍵欄位，設定後每個快照都會建立主鍵索引
+            numericise_values: 是否將數值字串轉為數字
+            share_records: 是否將記錄存入共用儲存；False 時只共用版本號
+        """
+        self.sheet_name = sheet_name
+        self.ttl = DEFAULT_CACHE_TTL if ttl is None else ttl
+        self.key_column = key_column
+        self.numericise_values = numericise_values
+        self.share_records = share_records
+        self._snapshot: Optional[SheetSnapshot] = None
+        self._version = 0
+        # 快照被修補或失效時遞增，用來判斷進行中的載入是否已過時
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._flight = SingleFlight()
+        self.store = get_snapshot_store()
+        # 快照修補後呼叫的函式（參數為修補後的快照）
+        self.patch_listeners: List[Callable[[SheetSnapshot], Any]] = []
+
+    def add_patch_listener(self, listener: Callable[[SheetSnapshot], Any]):
+        """加入快照修補後呼叫的函式（重複加入同一函式只保留一個）"""
+        if listener not in self.patch_listeners:
+            self.patch_listeners.append(listener)
+
+    def _flight_key(self) -> tuple:
+        return flight_key(self.sheet_name)
+
+    def _install(self, snapshot: SheetSnapshot, generation: int) -> SheetSnapshot:
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot = snapshot
+        return snapshot
+
+    def _from_stored(self, stored: StoredSnapshot) -> SheetSnapshot:
+        return SheetSnapshot(self.sheet_name, stored.headers, stored.records,
+                             stored.version, stored.fetched_at, stored.numericised,
+                             key_column=self.key_column)
+
+    def _unsaved_version(self) -> int:
+        # 未存入共用儲存的快照以負數版本區分，不會與共用版本重複
+        with self._lock:
+            self._version += 1
+            return -self._version
+
+    def _load(self, fresh: bool = False) -> SheetSnapshot:
+        generation = self._generation
+        if self.store is not None and self.share_records:
+            return self._load_shared(generation, fresh)
+
+        shared_version = None
+        if self.store is not None:
+            # 只共用版本號：以讀取前的共用版本標記快照，讀取期間其他 worker 修改時下次比對即重新讀取
+            state = self.store.state(self.sheet_name)
+            shared_version = state.version if state else 0
+        worksheet = get_sheets_pool().get_worksheet(self.sheet_name)
+        headers, records, numericised = read_sheet_values(worksheet, self.numericise_values, fresh=fresh)
+        with self._lock:
+            if shared_version is None:
+                self._version += 1
+            snapshot = SheetSnapshot(self.sheet_name, headers, records,
+                                     self._version if shared_version is None else shared_version,
+                                     time.time(), numericised, key_column=self.key_column)
+        return self._install(snapshot, generation)
+
+    def _load_shared(self, generation: int, fresh: bool) -> SheetSnapshot:
+        """由共用儲存載入，必要時由本 worker 從 Sheets 讀取並寫回"""
+        requested_at = time.time()
+        stale = self._snapshot
+        lock = FileLock(f'snapshot_{self.sheet_name}')
+        if not lock.acquire(blocking=fresh or stale is None):
+            # 其他 worker 正在讀取，完成前繼續使用舊快照
+            return stale
+        try:
+            # 等待期間其他 worker 可能已完成讀取
+            stored = self.store.load(self.sheet_name)
+            if stored is not None:
+                # 強制讀取時只接受本次呼叫之後才開始的讀取
+                usable = stored.fetched_at >= requested_at if fresh else requested_at - stored.fetched_at < self.ttl
+                if usable:
+                    return self._install(self._from_stored(stored), generation)
+
+            state = self.store.state(self.sheet_name)
+            expected_version = state.version if state else 0
+            started_at = time.time()
+            worksheet = get_sheets_pool().get_worksheet(self.sheet_name)
+            headers, records, numericised = read_sheet_values(worksheet, self.numericise_values, fresh=fresh)
+            version = self.store.save(self.sheet_name, headers, records, numericised,
+                                      started_at, expected_version=expected_version)
+        finally:
+            lock.release()
+
+        if version is None:
+            # 讀取期間其他 worker 寫入或使快照失效，結果只回給目前的等待者
+            return SheetSnapshot(self.sheet_name, headers, records, self._unsaved_version(),
+                                 started_at, numericised, key_column=self.key_column)
+        snapshot = SheetSnapshot(self.sheet_name, headers, records, version, started_at,
+                                 numericised, key_column=self.key_column)
+        return self._install(snapshot, generation)
+
+    def _sync_with_store(self, snapshot: Optional[SheetSnapshot]) -> Optional[SheetSnapshot]:
+        """比對共用版本：其他 worker 已更新時改用共用快照，已失效時清除本地快照"""
+        state = self.store.state(self.sheet_name)
+        if state is None or (snapshot is not None and snapshot.version == state.version):
+            return snapshot
+
+        latest = None
+        if state.fetched_at is not None:
+            if snapshot is not None and snapshot.version > 0:
+                # 其他 worker 只修補過時，套用變更的列即可
+                patches = self.store.load_patches(self.sheet_name, snapshot.version)
+                if patches is not None:
+                    latest = self._apply_stored_patches(snapshot, patches)
+            if latest is None:
+                stored = self.store.load(self.sheet_name)
+                latest = self._from_stored(stored) if stored is not None else None
+        if latest is None and snapshot is None:
+            return None
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._snapshot = latest
+                self._bump_generation()
+        return latest
+
+    def _apply_stored_patches(self, snapshot: SheetSnapshot, patches: List[StoredPatch]) -> Optional[SheetSnapshot]:
+        """將其他 worker 寫入的修補套用到目前快照，無法對應時回傳 None（改為完整載入）"""
+        records = list(snapshot.records)
+        patch_log = snapshot.patch_log
+        keys_changed = False
+        for patch in patches:
+            if self.key_column:
+                keys_changed = keys_changed or any(
+                    index >= len(records) or records[index].get(self.key_column) != record.get(self.key_column)
+                    for index, record in patch.rows
+                )
+            if not apply_patch_rows(records, patch.rows):
+                return None
+            changed = frozenset(index for index, _ in patch.rows)
+            patch_log = (patch_log + ((patch.base_version, changed),))[-PATCH_LOG_SIZE:]
+        return SheetSnapshot(self.sheet_name, snapshot.headers, records,
+                             patches[-1].version, snapshot.fetched_at, snapshot.numericised,
+                             key_column=self.key_column,
+                             key_index=None if keys_changed else snapshot.key_index,
+                             patch_log=patch_log)
+
+    def _bump_generation(self):
+        """快照內容已由寫入端改變（鎖內呼叫），之後的讀取不再加入進行中的載入"""
+        self._generation += 1
+        key = self._flight_key()
+        self._flight.forget(key)
+        get_single_flight().forget(key)
+
+    def age(self) -> Optional[float]:
+        """目前快照已存在的秒數，尚未載入或已失效時為 None（共用快照以最後一次讀取為準）"""
+        if self.store is not None and self.share_records:
+            state = self.store.state(self.sheet_name)
+            return time.time() - state.fetched_at if state and state.fetched_at is not None else None
+        snapshot = self._snapshot
+        return snapshot.age() if snapshot is not None else None
+
+    def is_fresh(self, snapshot: Optional[SheetSnapshot]) -> bool:
+        return snapshot is not None and snapshot.age() < self.ttl
+
+    def get_snapshot(self, force: bool = False) -> SheetSnapshot:
+        """
+        取得快照，過期或強制時重新讀取
+
+        Args:
+            force: 是否忽略 TTL 直接重新讀取
+
+        Returns:
+            SheetSnapshot
+        """
+        snapshot = self._snapshot
+        if self.store is not None and not force:
+            snapshot = self._sync_with_store(snapshot)
+        if not force and self.is_fresh(snapshot):
+            return snapshot
+        if not force and snapshot is not None and self._flight.running(self._flight_key()):
+            # stale-while-revalidate：重新讀取完成前先使用舊快照
+            return snapshot
+        return self._flight.do(self._flight_key(), lambda: self._load(fresh=force), fresh=force)
+
+    def get_records(self) -> List[Dict[str, Any]]:
+        """取得記錄副本，呼叫端可自由修改而不影響快照"""
+        return [dict(record) for record in self.get_snapshot().records]
+
+    def find(self, key: Any) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """
+        依主鍵查詢單筆記錄
+
+        Args:
+            key: 主鍵值（請購單號可帶或不帶 '-'）
+
+        Returns:
+            (工作表列號, 記錄副本)；找不到時為 (None, None)
+        """
+        snapshot = self.get_snapshot()
+        index = snapshot.lookup(key)
+        if index is None:
+            return None, None
+        return snapshot.row_number(index), dict(snapshot.records[index])
+
+    def locate(self, key: Any, worksheet) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """
+        依主鍵取得要寫入的工作表列號
+
+        快照的列號以該列的主鍵儲存格確認一次；工作表在快照期間被插入、刪除或排序而對不上，
+        或快照中找不到該主鍵時，強制重新讀取快照後再定位
+
+        Args:
+            key: 主鍵值（請購單號可帶或不帶 '-'）
+            worksheet: 要寫入的 gspread 工作表
+
+        Returns:
+            (工作表列號, 記錄副本)；找不到時為 (None, None)
+        """
+        for force in (False, True):
+            snapshot = self.get_snapshot(force=force)
+            index = snapshot.lookup(key)
+            if index is None:
+                continue
+            row = snapshot.row_number(index)
+            expected = str(snapshot.records[index].get(self.key_column, '')).strip()
+            key_col = snapshot.headers.index(self.key_column) + 1
+            if str(worksheet.cell(row, key_col).value or '').strip() == expected:
+                return row, dict(snapshot.records[index])
+            print(f"DEBUG: {self.sheet_name} 第 {row} 列已不是 {key}，重新讀取")
+        return None, None
+
+    def locate_many(self, keys: List[Any], worksheet) -> Dict[Any, int]:
+        """
+        依主鍵批次取得要寫入的工作表列號
+
+        與 locate() 相同，但所有列的主鍵儲存格以一次 batch_get 確認；
+        有任何一列對不上或找不到時，強制重新讀取快照後再定位其餘主鍵
+
+        Args:
+            keys: 主鍵值列表（請購單號可帶或不帶 '-'）
+            worksheet: 要寫入的 gspread 工作表
+
+        Returns:
+            {主鍵: 工作表列號}，只包含確認無誤的主鍵
+        """
+        located = {}
+        pending = list(dict.fromkeys(keys))
+        for force in (False, True):
+            snapshot = self.get_snapshot(force=force)
+            targets = []
+            for key in pending:
+                index = snapshot.lookup(key)
+                if index is not None:
+                    targets.append((key, index))
+
+            if targets:
+                key_col = snapshot.headers.index(self.key_column) + 1
+                ranges = [rowcol_to_a1(snapshot.row_number(index), key_col) for _, index in targets]
+                cells = worksheet.batch_get(ranges)
+                for (key, index), cell in zip(targets, cells):
+                    value = cell[0][0] if cell and cell[0] else ''
+                    expected = str(snapshot.records[index].get(self.key_column, '')).strip()
+                    if str(value).strip() == expected:
+                        located[key] = snapshot.row_number(index)
+
+            pending = [key for key in pending if key not in located]
+            if not pending or force:
+                break
+            print(f"DEBUG: {self.sheet_name} 有 {len(pending)} 筆主鍵無法以快照定位，重新讀取")
+        return located
+
+    def invalidate(self):
+        """使快照失效，下次讀取時重新載入（所有 worker）"""
+        with self._lock:
+            self._snapshot = None
+            self._bump_generation()
+            if self.store is not None:
+                self.store.invalidate(self.sheet_name)
+
+    def apply_cell_updates(self, updates: List[Tuple[int, int, Any]]) -> bool:
+        """
+        將已寫入工作表的儲存格同步修補到快照
+
+        Args:
+            updates: (列號, 欄號, 值) 列表，列號與欄號皆為 1-based
+
+        Returns:
+            是否修補成功；無法對應到快照時改為使快照失效
+        """
+        self._adopt_stored()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return False
+
+            records = list(snapshot.records)
+            touched = {}
+            for row, col, value in updates:
+                index = row - 2
+                if row < 2 or index >= len(records) or col < 1 or col > len(snapshot.headers):
+                    # 新增列或新增欄位，快照結構已不同
+                    self.invalidate()
+                    return False
+                if index not in touched:
+                    touched[index] = dict(records[index])
+                    records[index] = touched[index]
+                if snapshot.numericised:
+                    value = numericise(value)
+                touched[index][snapshot.headers[col - 1]] = value
+
+            # 修補不會改變記錄順序，沿用原本的主鍵索引
+            patched = self._commit_patch(snapshot, records, set(touched), snapshot.key_index)
+        return self._notify_patched(patched)
+
+    def append_records(self, start_row: int, rows: List[List[Any]]) -> bool:
+        """
+        將已附加到工作表最後的列同步加入快照
+
+        Args:
+            start_row: 第一個新增列的列號（1-based，append_rows 回應的 updatedRange）
+            rows: 新增列的值（依標題順序）
+
+        Returns:
+            是否修補成功；新增列不是接在快照最後一列之後時改為使快照失效
+        """
+        self._adopt_stored()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return False
+            if start_row != len(snapshot.records) + 2 or not snapshot.headers:
+                # 期間有其他寫入者新增或刪除列，快照無法對應
+                self.invalidate()
+                return False
+
+            width = len(snapshot.headers)
+            records = list(snapshot.records)
+            for row in rows:
+                values = (list(row) + [''] * width)[:width]
+                if snapshot.numericised:
+                    values = numericise_all(values)
+                records.append(dict(zip(snapshot.headers, values)))
+            added = set(range(len(snapshot.records), len(records)))
+            # 有主鍵欄位時重建主鍵索引
+            patched = self._commit_patch(snapshot, records, added,
+                                         None if snapshot.key_column else snapshot.key_index)
+        return self._notify_patched(patched)
+
+    def _adopt_stored(self):
+        """修補前先採用其他 worker 已寫回共用儲存的快照，修補才能接在最新內容之後"""
+        if self.store is not None and self._snapshot is not None:
+            self._sync_with_store(self._snapshot)
+
+    def _commit_patch(self, snapshot: SheetSnapshot, records: List[Dict[str, Any]],
+                      changed: Set[int], key_index: Optional[Dict[str, int]]) -> Optional[SheetSnapshot]:
+        """以修補後的記錄產生新版本快照（鎖內呼叫）；無法寫回共用儲存時使快照失效並回傳 None"""
+        if self.store is not None:
+            if self.share_records:
+                # 修補後的快照寫回共用儲存；期間已被其他 worker 更新時無法確定內容，改為失效
+                # 只寫入變更的列，不重新序列化整張工作表
+                version = self.store.save_patch(self.sheet_name, snapshot.headers, records,
+                                                snapshot.numericised, snapshot.fetched_at, changed,
+                                                expected_version=snapshot.version)
+            else:
+                # 只遞增共用版本，其他 worker 下次比對時重新讀取
+                version = self.store.invalidate(self.sheet_name, expected_version=snapshot.version)
+            if version is None:
+                self.invalidate()
+                return None
+        else:
+            self._version += 1
+            version = self._version
+        self._bump_generation()
+        patch_log = (snapshot.patch_log + ((snapshot.version, frozenset(changed)),))[-PATCH_LOG_SIZE:]
+        self._snapshot = SheetSnapshot(self.sheet_name, snapshot.headers, records,
+                                       version, snapshot.fetched_at,
+                                       snapshot.numericised,
+                                       key_column=snapshot.key_column,
+                                       key_index=key_index,
+                                       patch_log=patch_log)
+        return self._snapshot
+
+    def _notify_patched(self, patched: Optional[SheetSnapshot]) -> bool:
+        if patched is None:
+            return False
+        for listener in self.patch_listeners:
+            try:
+                listener(patched)
+            except Exception as e:
+                print(f"快照修補後的處理失敗: {e}")
+        return True
+
+
+# 全域快取實例（依工作表名稱）
+_sheet_caches: Dict[str, SheetCache] = {}
+_sheet_caches_lock = threading.Lock()
+
+
+# 各工作表的主鍵欄位
+SHEET_KEY_COLUMNS = {
+    '請購單': '請購單號',
+}
+
+# 保留原始字串、不做數值轉換的工作表（帳號、密碼需逐字比對）
+RAW_VALUE_SHEETS = {'使用者帳號'}
+
+# 記錄不寫入共用快照儲存的工作表（含明文密碼），各 worker 自行讀取，只共用版本號
+PRIVATE_SNAPSHOT_SHEETS = {'使用者帳號'}
+
+# 個別工作表的快照存活秒數（未列出者使用 SHEET_CACHE_TTL）
+SHEET_CACHE_TTLS = {
+    '使用者帳號': int(os.getenv('USER_CACHE_TTL', '300')),
+}
+
+
+def get_sheet_cache(sheet_name: str) -> SheetCache:
+    """
+    取得工作表快取實例
+
+    Args:
+        sheet_name: 工作表名稱
+
+    Returns:
+        SheetCache 實例
+    """
+    cache = _sheet_caches.get(sheet_name)
+    if cache is None:
+        with _sheet_caches_lock:
+            cache = _sheet_caches.get(sheet_name)
+            if cache is None:
+                cache = SheetCache(sheet_name, ttl=SHEET_CACHE_TTLS.get(sheet_name),
+                                   key_column=SHEET_KEY_COLUMNS.get(sheet_name),
+                                   numericise_values=sheet_name not in RAW_VALUE_SHEETS,
+                                   share_records=sheet_name not in PRIVATE_SNAPSHOT_SHEETS)
+                _sheet_caches[sheet_name] = cache
+    return cache
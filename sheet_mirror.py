@@ -0,0 +1,300 @@
+"""
+本機 SQLite 鏡像模組
+將請購單快照同步到本機 SQLite，並在常用的查詢欄位建立索引，
+讀取頁面以 SQL 篩選，頁面延遲不再隨工作表筆數增加；Google Sheets 仍是唯一的正式資料來源
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple, Callable, Sequence, Set
+
+from file_lock import FileLock, LOCK_DIR
+from sheet_cache import get_sheet_cache, SheetSnapshot
+from snapshot_store import get_snapshot_store
+
+# 設為 1 啟用鏡像（預設停用，各頁面直接篩選快照）
+SHEET_MIRROR_ENABLED = os.getenv('SHEET_MIRROR', '0') == '1'
+
+# 鏡像檔案路徑（需為所有 worker 共用的本機路徑）
+MIRROR_DB = os.path.join(LOCK_DIR, 'hrsystem_mirror.db')
+
+# 請求端發現鏡像落後超過此秒數時自行整表重建（背景更新停用或延遲時的保險）
+MIRROR_MAX_LAG = float(os.getenv('SHEET_MIRROR_MAX_LAG', '30'))
+
+
+def _text(field: str) -> Callable[[Dict[str, Any]], str]:
+    return lambda record: str(record.get(field, '') if record.get(field) is not None else '').strip()
+
+
+def purchase_no_number(record: Dict[str, Any]) -> Optional[int]:
+    """請購單號去除 '-' 後的數值（範圍搜尋用），非數字時為 None"""
+    try:
+        return int(str(record.get('請購單號', '')).strip().replace('-', ''))
+    except ValueError:
+        return None
+
+
+def purchase_date_key(record: Dict[str, Any]) -> Optional[str]:
+    """請購日期統一為 YYYYMMDD（日期區間搜尋用），無法解析時為 None"""
+    value = str(record.get('請購日期', '')).replace('-', '').replace('/', '')
+    if len(value) != 8:
+        return None
+    try:
+        return datetime.strptime(value, '%Y%m%d').strftime('%Y%m%d')
+    except ValueError:
+        return None
+
+
+# 工作表 -> (資料表, 欄位 -> 取值函式)；每個欄位都建立索引，完整記錄另存於 data 欄
+# 只收錄有頁面以 SQL 查詢的工作表：使用者帳號由 UserDirectory 的記憶體索引查詢，
+# 系統日誌由 SystemLogIndex 查詢，同步它們只會增加 Sheets 讀取
+MIRROR_TABLES: Dict[str, Tuple[str, Dict[str, Callable[[Dict[str, Any]], Any]]]] = {
+    '請購單': ('purchase_requests', {
+        'purchase_no': _text('請購單號'),
+        'purchase_no_num': purchase_no_number,
+        'purchase_date': purchase_date_key,
+        'purchase_date_raw': _text('請購日期'),
+        'department': _text('請購部門'),
+        'applicant': _text('申請人'),
+        'sign_status': _text('請購單簽核'),
+        'receipt_status': _text('驗收單狀態'),
+        'receipt_approver': _text('驗收簽核人員'),
+        'edit_status': _text('編輯狀態'),
+    }),
+}
+
+
+class SheetMirror:
+    """本機 SQLite 鏡像
+
+    - 以快照版本判斷是否需要同步；快照由 SheetCache 提供（已含背景更新與跨 worker 共用），
+      同步本身不會額外讀取 Sheets
+    - 快照修補（簽核、驗收等寫入）後只以 UPDATE 更新修補過的列，寫入後下一個查詢即反映
+    - 重新載入的快照由背景更新整表重建（單一交易內替換，查詢不會看到同步到一半的資料）；
+      重建前請求端先使用目前的鏡像，頁面延遲不隨工作表筆數增加
+    """
+
+    def __init__(self, path: str = MIRROR_DB, tables: Optional[Dict[str, Any]] = None):
+        """
+        初始化鏡像
+
+        Args:
+            path: SQLite 檔案路徑或 URI
+            tables: 同步的工作表，預設為 MIRROR_TABLES
+        """
+        self.path = path
+        self.tables = tables or MIRROR_TABLES
+        self._local = threading.local()
+        self._pid = os.getpid()
+        # 工作表 -> 本行程第一次發現鏡像落後的時間
+        self._behind_since: Dict[str, float] = {}
+        for sheet_name in self.tables:
+            get_sheet_cache(sheet_name).add_patch_listener(sync_patched)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, uri=self.path.startswith('file:'))
+            if not self.path.startswith('file:'):
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self._create_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute('CREATE TABLE IF NOT EXISTS mirror_state '
+                     '(sheet_name TEXT PRIMARY KEY, version INTEGER NOT NULL, synced_at REAL NOT NULL)')
+        for table, columns in self.tables.values():
+            column_defs = ', '.join(f'{column}' for column in columns)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                         f'(row_number INTEGER PRIMARY KEY, {column_defs}, data TEXT NOT NULL)')
+            for column in columns:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})')
+
+    def _synced_version(self, conn: sqlite3.Connection, sheet_name: str) -> Optional[int]:
+        row = conn.execute('SELECT version FROM mirror_state WHERE sheet_name = ?', (sheet_name,)).fetchone()
+        return row[0] if row else None
+
+    def _row(self, sheet_name: str, snapshot: SheetSnapshot, index: int) -> tuple:
+        record = snapshot.records[index]
+        columns = self.tables[sheet_name][1]
+        return (snapshot.row_number(index), *(extract(record) for extract in columns.values()),
+                json.dumps(record, ensure_ascii=False, default=str))
+
+    def sync(self, sheet_name: str, rebuild: bool = True, snapshot: Optional[SheetSnapshot] = None) -> bool:
+        """
+        將工作表快照同步到鏡像（版本相同時不做事）
+
+        快照只有修補時只更新修補過的列；其餘情況整表重建
+
+        Args:
+            sheet_name: 工作表名稱
+            rebuild: 是否允許整表重建；False 時（請求端）除非鏡像尚無資料或落後超過 MIRROR_MAX_LAG 秒，
+                     否則先沿用目前的鏡像，留給背景更新重建
+            snapshot: 要同步的快照，預設為目前的快照
+
+        Returns:
+            是否執行了同步
+        """
+        snapshot = snapshot or get_sheet_cache(sheet_name).get_snapshot()
+        conn = self._connect()
+        synced_version = self._synced_version(conn, sheet_name)
+        if synced_version == snapshot.version:
+            self._behind_since.pop(sheet_name, None)
+            return False
+
+        changed = snapshot.changed_since(synced_version) if synced_version is not None else None
+        if changed is not None:
+            return self._apply_rows(conn, sheet_name, snapshot, synced_version, changed)
+
+        if not rebuild and synced_version is not None:
+            behind_since = self._behind_since.setdefault(sheet_name, time.time())
+            if time.time() - behind_since < MIRROR_MAX_LAG:
+                return False
+        return self._rebuild(conn, sheet_name, snapshot)
+
+    def _apply_rows(self, conn: sqlite3.Connection, sheet_name: str, snapshot: SheetSnapshot,
+                    synced_version: int, indexes: Set[int]) -> bool:
+        """只更新修補過的列"""
+        table, columns = self.tables[sheet_name]
+        rows = [self._row(sheet_name, snapshot, index) for index in sorted(indexes)]
+        placeholders = ', '.join('?' * (len(columns) + 2))
+        with FileLock('sheet_mirror'):
+            # 等待鎖的期間其他 worker 可能已同步到別的版本，改由下一次同步處理
+            if self._synced_version(conn, sheet_name) != synced_version:
+                return False
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO {table} (row_number, {", ".join(columns)}, data) VALUES ({placeholders})',
+                    rows
+                )
+                conn.execute('INSERT OR REPLACE INTO mirror_state (sheet_name, version, synced_at) VALUES (?, ?, ?)',
+                             (sheet_name, snapshot.version, time.time()))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        self._behind_since.pop(sheet_name, None)
+        print(f"DEBUG: 鏡像已更新 {sheet_name} 版本 {snapshot.version}，{len(rows)} 列")
+        return True
+
+    def _rebuild(self, conn: sqlite3.Connection, sheet_name: str, snapshot: SheetSnapshot) -> bool:
+        """整表重建"""
+        table, columns = self.tables[sheet_name]
+        rows = [self._row(sheet_name, snapshot, index) for index in range(len(snapshot.records))]
+        placeholders = ', '.join('?' * (len(columns) + 2))
+        with FileLock('sheet_mirror'):
+            # 等待鎖的期間其他 worker 可能已同步同一版本
+            if self._synced_version(conn, sheet_name) == snapshot.version:
+                return False
+            started = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(f'DELETE FROM {table}')
+                conn.executemany(
+                    f'INSERT INTO {table} (row_number, {", ".join(columns)}, data) VALUES ({placeholders})', rows
+                )
+                conn.execute('INSERT OR REPLACE INTO mirror_state (sheet_name, version, synced_at) VALUES (?, ?, ?)',
+                             (sheet_name, snapshot.version, time.time()))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        self._behind_since.pop(sheet_name, None)
+        print(f"DEBUG: 鏡像已同步 {sheet_name} 版本 {snapshot.version}，{len(rows)} 列，{time.time() - started:.3f} 秒")
+        return True
+
+    def sync_all(self):
+        """同步所有鏡像的工作表（背景更新呼叫）"""
+        for sheet_name in self.tables:
+            try:
+                self.sync(sheet_name)
+            except Exception as e:
+                print(f"同步鏡像 {sheet_name} 失敗: {e}")
+
+    def select(self, sheet_name: str, where: str = '1', params: Sequence[Any] = (),
+               order_by: str = 'row_number') -> List[Dict[str, Any]]:
+        """
+        查詢記錄（查詢前先套用快照的修補）
+
+        Args:
+            sheet_name: 工作表名稱
+            where: SQL 條件，欄位為 MIRROR_TABLES 定義的欄位
+            params: 條件參數
+            order_by: 排序
+
+        Returns:
+            記錄列表（與快照記錄相同格式，可自由修改）
+        """
+        self.sync(sheet_name, rebuild=False)
+        table = self.tables[sheet_name][0]
+        cursor = self._connect().execute(f'SELECT data FROM {table} WHERE {where} ORDER BY {order_by}', tuple(params))
+        return [json.loads(row[0]) for row in cursor]
+
+    def count(self, sheet_name: str, where: str = '1', params: Sequence[Any] = ()) -> int:
+        """
+        計算符合條件的筆數
+
+        Args:
+            sheet_name: 工作表名稱
+            where: SQL 條件
+            params: 條件參數
+
+        Returns:
+            筆數
+        """
+        self.sync(sheet_name, rebuild=False)
+        table = self.tables[sheet_name][0]
+        return self._connect().execute(f'SELECT COUNT(*) FROM {table} WHERE {where}', tuple(params)).fetchone()[0]
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """各工作表的鏡像版本與同步時間"""
+        now = time.time()
+        rows = self._connect().execute('SELECT sheet_name, version, synced_at FROM mirror_state').fetchall()
+        return {name: {'version': version, 'synced_age': round(now - synced_at, 1)}
+                for name, version, synced_at in rows}
+
+
+# 全域鏡像實例
+_sheet_mirror = None
+_sheet_mirror_lock = threading.Lock()
+
+
+def get_sheet_mirror() -> Optional[SheetMirror]:
+    """
+    取得全域鏡像實例
+
+    未啟用共用快照時各 worker 的快照版本不同，鏡像改為每個 worker 各自的記憶體資料庫
+
+    Returns:
+        SheetMirror 實例；未啟用鏡像時為 None
+    """
+    global _sheet_mirror
+
+    if not SHEET_MIRROR_ENABLED:
+        return None
+    if _sheet_mirror is None or (get_snapshot_store() is None and _sheet_mirror._pid != os.getpid()):
+        with _sheet_mirror_lock:
+            if _sheet_mirror is None or (get_snapshot_store() is None and _sheet_mirror._pid != os.getpid()):
+                if get_snapshot_store() is not None:
+                    _sheet_mirror = SheetMirror()
+                else:
+                    _sheet_mirror = SheetMirror(f'file:hrsystem_mirror_{os.getpid()}?mode=memory&cache=shared')
+
+    return _sheet_mirror
+
+
+def sync_patched(snapshot: SheetSnapshot):
+    """快照修補後立即更新鏡像中修補過的列（SheetCache 的修補監聽函式）"""
+    mirror = get_sheet_mirror()
+    if mirror is not None and snapshot.sheet_name in mirror.tables:
+        mirror.sync(snapshot.sheet_name, rebuild=False, snapshot=snapshot)
@@ -0,0 +1,213 @@
+"""
+工作表欄位結構模組
+由快照的標題列建立欄位名稱 -> 欄號對照表，並以標題指紋判斷是否需要重建，
+寫入端不必每次呼叫 row_values(1) 再逐欄搜尋；
+必要欄位在啟動時一次建立（ensure_sheet_columns），請求中不再動態新增欄位
+"""
+
+import hashlib
+import threading
+from typing import Dict, Any, Optional, List
+
+from gspread.utils import rowcol_to_a1
+
+from file_lock import FileLock
+from sheets_client import get_sheets_pool
+from sheet_cache import get_sheet_cache
+
+# 同一欄位可能的標題名稱（以包含比對，與原本的搜尋邏輯一致）
+COLUMN_ALIASES = {
+    '驗收單狀態': ['驗收單狀態', '驗收狀態', 'receipt_status'],
+    '驗收人員': ['驗收人員', 'receipt_person'],
+    '驗收日期': ['驗收日期', 'receipt_date'],
+}
+
+# 各工作表必須存在的欄位（應用程式寫入用的狀態欄位）
+REQUIRED_COLUMNS = {
+    '請購單': ['編輯狀態', '驗收單狀態', '驗收人員', '驗收日期'],
+}
+
+
+def header_fingerprint(headers: List[str]) -> str:
+    """標題列指紋，標題有任何增減或改名都會改變"""
+    return hashlib.sha1('\x1f'.join(str(h) for h in headers).encode('utf-8')).hexdigest()
+
+
+def _is_blank_header(header: Any, col: int) -> bool:
+    # 重複標題時快照以 Column_<欄號> 代替空白標題
+    header = str(header or '').strip()
+    return header == '' or header == f'Column_{col}'
+
+
+class ColumnResolver:
+    """欄位名稱對照表（建立後不再修改）"""
+
+    def __init__(self, headers: List[str]):
+        """
+        初始化對照表
+
+        Args:
+            headers: 標題列
+        """
+        self.headers = list(headers)
+        self.fingerprint = header_fingerprint(self.headers)
+        self.width = len(self.headers)
+
+        self._exact: Dict[str, int] = {}
+        self.empty_cols: List[int] = []
+        for col, header in enumerate(self.headers, 1):
+            if _is_blank_header(header, col):
+                self.empty_cols.append(col)
+            else:
+                self._exact.setdefault(str(header).strip(), col)
+
+        # 別名欄位：依序比對，最後符合的欄位為準（與原本的逐欄搜尋相同）
+        self._aliased: Dict[str, int] = {}
+        for name, aliases in COLUMN_ALIASES.items():
+            for col, header in enumerate(self.headers, 1):
+                header = str(header)
+                if any(alias in header for alias in aliases) and not self._claimed_by_earlier_alias(name, header):
+                    self._aliased[name] = col
+
+    @staticmethod
+    def _claimed_by_earlier_alias(name: str, header: str) -> bool:
+        # 原本以 if/elif 依序判斷，標題只會歸屬到第一個符合的別名組
+        for other, aliases in COLUMN_ALIASES.items():
+            if other == name:
+                return False
+            if any(alias in header for alias in aliases):
+                return True
+        return False
+
+    def col(self, name: str) -> Optional[int]:
+        """
+        取得欄號
+
+        Args:
+            name: 欄位名稱；有別名組的欄位會一併比對別名
+
+        Returns:
+            1-based 欄號，找不到時為 None
+        """
+        if name in COLUMN_ALIASES:
+            return self._aliased.get(name)
+        return self._exact.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return self.col(name) is not None
+
+
+class ColumnResolverCache:
+    """依工作表快取 ColumnResolver，標題指紋改變時才重建"""
+
+    def __init__(self):
+        self._resolvers: Dict[str, ColumnResolver] = {}
+        self._lock = threading.Lock()
+
+    def get(self, sheet_name: str) -> ColumnResolver:
+        """
+        取得工作表的欄位對照表（由快照標題列建立，不額外讀取 API）
+
+        Args:
+            sheet_name: 工作表名稱
+
+        Returns:
+            ColumnResolver
+        """
+        headers = get_sheet_cache(sheet_name).get_snapshot().headers
+        fingerprint = header_fingerprint(headers)
+        resolver = self._resolvers.get(sheet_name)
+        if resolver is None or resolver.fingerprint != fingerprint:
+            resolver = ColumnResolver(headers)
+            with self._lock:
+                self._resolvers[sheet_name] = resolver
+        return resolver
+
+
+# 全域對照表快取
+_column_resolvers = ColumnResolverCache()
+
+
+def get_column_resolver(sheet_name: str) -> ColumnResolver:
+    """
+    取得工作表的欄位對照表
+
+    Args:
+        sheet_name: 工作表名稱
+
+    Returns:
+        ColumnResolver
+    """
+    return _column_resolvers.get(sheet_name)
+
+
+def ensure_sheet_columns(sheet_name: str, required: Optional[List[str]] = None) -> List[str]:
+    """
+    確認工作表的必要欄位存在，缺少的欄位一次附加在標題列最後（可重複執行）
+
+    Args:
+        sheet_name: 工作表名稱
+        required: 必要欄位，預設為 REQUIRED_COLUMNS 的設定
+
+    Returns:
+        本次新增的欄位名稱列表
+    """
+    if required is None:
+        required = REQUIRED_COLUMNS.get(sheet_name, [])
+    if not required:
+        return []
+
+    # 多個 worker 同時啟動時只讓一個新增欄位，其他 worker 取得鎖後會看到已存在
+    with FileLock(f'schema_{sheet_name}'):
+        worksheet = get_sheets_pool().get_worksheet(sheet_name)
+        headers = worksheet.row_values(1)
+        columns = ColumnResolver(headers)
+        missing = [name for name in required if name not in columns]
+        if not missing:
+            return []
+
+        start_col = len(headers) + 1
+        end_col = start_col + len(missing) - 1
+        if end_col > worksheet.col_count:
+            worksheet.add_cols(end_col - worksheet.col_count)
+        worksheet.update([missing], f'{rowcol_to_a1(1, start_col)}:{rowcol_to_a1(1, end_col)}')
+        print(f"DEBUG: {sheet_name} 新增欄位 {missing}，位於第 {start_col} 到 {end_col} 欄")
+
+    get_sheet_cache(sheet_name).invalidate()
+    return missing
+
+
+def ensure_schema() -> Dict[str, List[str]]:
+    """
+    確認各工作表的必要欄位存在，缺少的欄位一次建立（可重複執行）
+
+    Returns:
+        工作表名稱 -> 本次新增的欄位名稱列表
+    """
+    added = {}
+    for sheet_name in REQUIRED_COLUMNS:
+        columns = ensure_sheet_columns(sheet_name)
+        if columns:
+            added[sheet_name] = columns
+    return added
+
+
+def require_columns(sheet_name: str, names: List[str]) -> List[int]:
+    """
+    取得必要欄位的欄號；若有欄位不存在（例如啟動時建立失敗）則補建一次
+
+    Args:
+        sheet_name: 工作表名稱
+        names: 欄位名稱列表
+
+    Returns:
+        與 names 對應的 1-based 欄號列表
+    """
+    cols = [get_column_resolver(sheet_name).col(name) for name in names]
+    if None in cols:
+        ensure_sheet_columns(sheet_name, names)
+        cols = [get_column_resolver(sheet_name).col(name) for name in names]
+        if None in cols:
+            missing = [name for name, col in zip(names, cols) if col is None]
+            raise Exception(f"{sheet_name} 缺少必要欄位: {missing}")
+    return cols
@@ -0,0 +1,69 @@
+"""
+工作表批次寫入模組
+收集單一請求內的所有儲存格變更，最後以一次 batch_update 寫回，
+取代逐格 update_cell 的多次 API 往返
+"""
+
+from typing import Any, List, Tuple
+
+from gspread.utils import rowcol_to_a1, ValueInputOption
+
+
+class CellWriteBuffer:
+    """儲存格寫入緩衝區
+
+    用法：
+        buffer = CellWriteBuffer(worksheet)
+        buffer.set(row, col, value)
+        updates = buffer.flush()   # 一次 API 呼叫
+        get_sheet_cache('請購單').apply_cell_updates(updates)
+    """
+
+    def __init__(self, worksheet):
+        """
+        初始化寫入緩衝區
+
+        Args:
+            worksheet: gspread 工作表
+        """
+        self.worksheet = worksheet
+        # (列號, 欄號) -> 值，同一格重複設定時以最後一次為準
+        self._cells = {}
+
+    def set(self, row: int, col: int, value: Any):
+        """
+        加入一個儲存格變更
+
+        Args:
+            row: 列號（1-based）
+            col: 欄號（1-based）
+            value: 新值
+        """
+        self._cells[(row, col)] = value
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def pending(self) -> List[Tuple[int, int, Any]]:
+        """尚未寫入的變更 (列號, 欄號, 值)"""
+        return [(row, col, value) for (row, col), value in self._cells.items()]
+
+    def flush(self) -> List[Tuple[int, int, Any]]:
+        """
+        以單次 batch_update 寫入所有變更
+
+        Returns:
+            已寫入的 (列號, 欄號, 值) 列表，可直接用於修補快照
+        """
+        updates = self.pending()
+        if not updates:
+            return []
+
+        data = [
+            {'range': rowcol_to_a1(row, col), 'values': [[value]]}
+            for row, col, value in updates
+        ]
+        # 與 update_cell() 相同，以使用者輸入方式解析值
+        self.worksheet.batch_update(data, value_input_option=ValueInputOption.user_entered)
+        self._cells = {}
+        return updates
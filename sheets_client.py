@@ -0,0 +1,203 @@
+"""
+Google Sheets 客戶端連線池
+在每個 gunicorn worker 內共用憑證、HTTP 連線與試算表/工作表物件，
+避免每次呼叫都重新授權與建立 TLS 連線
+"""
+
+import os
+import json
+import threading
+from typing import Dict, Any, Optional, List
+
+import gspread
+from gspread.http_client import HTTPClient
+from google.oauth2.service_account import Credentials
+
+from quota import get_quota_governor
+
+# Google Sheets API 設定
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+DEFAULT_SPREADSHEET_ID = '1ZB6ri0fzqTRk_ciHibcGXEuViNmW1Ag9kkazE8A5iKc'
+
+
+def get_spreadsheet_id() -> str:
+    """取得試算表ID（環境變數優先）"""
+    return os.getenv('SPREADSHEET_ID', DEFAULT_SPREADSHEET_ID)
+
+
+def load_service_account_info() -> Dict[str, Any]:
+    """從環境變數或服務帳戶金鑰檔案讀取憑證資料"""
+    service_account_info = os.getenv('GOOGLE_SERVICE_ACCOUNT_INFO')
+    if service_account_info:
+        return json.loads(service_account_info)
+    # 如果沒有環境變數，嘗試從檔案讀取
+    with open('service-account-key.json') as f:
+        return json.load(f)
+
+
+class GovernedHTTPClient(HTTPClient):
+    """經過配額控管的 gspread HTTP 客戶端
+
+    GET 計入讀取配額，其餘計入寫入配額，Drive API 另計；
+    配額錯誤一律重試，暫時性錯誤只重試讀取
+    """
+
+    def request(self, method: str, endpoint: str, *args, **kwargs):
+        if '/drive/' in endpoint:
+            bucket = 'drive'
+        else:
+            bucket = 'read' if method.upper() == 'GET' else 'write'
+        return get_quota_governor().call(
+            lambda: HTTPClient.request(self, method, endpoint, *args, **kwargs),
+            bucket,
+            idempotent=method.upper() == 'GET'
+        )
+
+
+class SheetsClientPool:
+    """Google Sheets 客戶端連線池
+
+    - 憑證只解析一次，OAuth token 在整個 process 內共用並自動更新
+    - 每個執行緒持有自己的 gspread Client（requests.Session 不保證執行緒安全），
+      連線以 keep-alive 方式重複使用
+    - open_by_key 與 worksheet() 的結果依執行緒快取，省去每次的 metadata 讀取
+    - fork 後自動重建，子行程不會沿用父行程的連線
+    """
+
+    def __init__(self, scopes: Optional[List[str]] = None):
+        """
+        初始化連線池
+
+        Args:
+            scopes: 授權範圍，預設為試算表與雲端硬碟
+        """
+        self.scopes = scopes or SCOPES
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._credentials = None
+        self._local = threading.local()
+        # 每次 reset 遞增，讓其他執行緒的快取在下次使用時失效
+        self._generation = 0
+
+    def _check_fork(self):
+        """偵測 fork，子行程需重建所有連線"""
+        if self._pid != os.getpid():
+            self.reset()
+
+    def reset(self):
+        """清除憑證與所有執行緒的連線快取"""
+        with self._lock:
+            self._pid = os.getpid()
+            self._credentials = None
+            self._local = threading.local()
+            self._generation += 1
+
+    def get_credentials(self) -> Credentials:
+        """取得共用的服務帳戶憑證"""
+        self._check_fork()
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    creds_dict = load_service_account_info()
+                    self._credentials = Credentials.from_service_account_info(creds_dict, scopes=self.scopes)
+        return self._credentials
+
+    def _thread_state(self) -> threading.local:
+        self._check_fork()
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            local.generation = self._generation
+            local.client = None
+            local.spreadsheets = {}
+            local.worksheets = {}
+        return local
+
+    def get_client(self) -> gspread.Client:
+        """取得目前執行緒的 gspread 客戶端"""
+        local = self._thread_state()
+        if local.client is None:
+            local.client = gspread.authorize(self.get_credentials(), http_client=GovernedHTTPClient)
+        return local.client
+
+    def get_spreadsheet(self, spreadsheet_id: Optional[str] = None) -> gspread.Spreadsheet:
+        """
+        取得快取的試算表物件
+
+        Args:
+            spreadsheet_id: 試算表ID，預設讀取環境變數
+
+        Returns:
+            gspread.Spreadsheet
+        """
+        spreadsheet_id = spreadsheet_id or get_spreadsheet_id()
+        local = self._thread_state()
+        spreadsheet = local.spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            spreadsheet = self.get_client().open_by_key(spreadsheet_id)
+            local.spreadsheets[spreadsheet_id] = spreadsheet
+        return spreadsheet
+
+    def get_worksheet(self, sheet_name: str, spreadsheet_id: Optional[str] = None) -> gspread.Worksheet:
+        """
+        取得快取的工作表物件
+
+        Args:
+            sheet_name: 工作表名稱
+            spreadsheet_id: 試算表ID，預設讀取環境變數
+
+        Returns:
+            gspread.Worksheet
+        """
+        spreadsheet_id = spreadsheet_id or get_spreadsheet_id()
+        local = self._thread_state()
+        key = (spreadsheet_id, sheet_name)
+        worksheet = local.worksheets.get(key)
+        if worksheet is None:
+            worksheet = self.get_spreadsheet(spreadsheet_id).worksheet(sheet_name)
+            local.worksheets[key] = worksheet
+        return worksheet
+
+    def forget_worksheet(self, sheet_name: str, spreadsheet_id: Optional[str] = None):
+        """工作表被新增、刪除或改名後，清除目前執行緒的快取物件"""
+        spreadsheet_id = spreadsheet_id or get_spreadsheet_id()
+        local = self._thread_state()
+        local.worksheets.pop((spreadsheet_id, sheet_name), None)
+
+
+# 全域連線池實例
+_sheets_pool = None
+_sheets_pool_lock = threading.Lock()
+
+
+def get_sheets_pool() -> SheetsClientPool:
+    """
+    取得全域連線池實例
+
+    Returns:
+        SheetsClientPool 實例
+    """
+    global _sheets_pool
+
+    if _sheets_pool is None:
+        with _sheets_pool_lock:
+            if _sheets_pool is None:
+                _sheets_pool = SheetsClientPool()
+
+    return _sheets_pool
+
+
+def _reset_pool_after_fork():
+    global _sheets_pool_lock
+    # fork 當下其他執行緒可能持有鎖，子行程一律換新鎖
+    _sheets_pool_lock = threading.Lock()
+    if _sheets_pool is not None:
+        _sheets_pool._lock = threading.Lock()
+        _sheets_pool.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
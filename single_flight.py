@@ -0,0 +1,152 @@
+"""
+單一飛行（single-flight）讀取合併模組
+同一個 worker 內對同一個（試算表, 工作表, 範圍）同時發出的讀取只送出一次，
+其餘等待中的請求共用該次結果，尖峰時段 N 個同時載入的頁面只花一次 Sheets 讀取
+"""
+
+import os
+import threading
+from typing import Dict, Any, Optional, Callable, Hashable, List
+
+from sheets_client import get_spreadsheet_id
+
+
+class _Call:
+    """進行中的一次讀取"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """依鍵合併同時進行的呼叫
+
+    - 第一個呼叫者執行讀取，之後同鍵的呼叫者等待並共用結果（包括例外）
+    - fresh=True 的呼叫不加入進行中的讀取，另起一次並成為後來者等待的對象
+    - forget() 讓之後的呼叫不再加入目前進行中的讀取（資料已被寫入時使用）
+    - fork 後自動清除父行程遺留的進行中讀取（子行程內不會有人完成它們）
+    """
+
+    def __init__(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._calls = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any], fresh: bool = False) -> Any:
+        """
+        執行或加入同鍵的讀取
+
+        Args:
+            key: 讀取鍵，通常為 (試算表ID, 工作表名稱, 範圍)
+            func: 無參數的讀取函式
+            fresh: 是否不加入進行中的讀取
+
+        Returns:
+            func 的回傳值（等待者取得同一個物件，不可修改）
+        """
+        self._check_fork()
+        with self._lock:
+            call = None if fresh else self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            if call.waiters:
+                print(f"DEBUG: 合併讀取 {key}，共用結果的請求 {call.waiters} 個")
+            call.event.set()
+        return call.result
+
+    def forget(self, key: Hashable):
+        """之後同鍵的呼叫另起新的讀取"""
+        self._check_fork()
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def running(self, key: Hashable) -> bool:
+        """該鍵目前是否有進行中的讀取"""
+        self._check_fork()
+        with self._lock:
+            return key in self._calls
+
+    def in_flight(self) -> List[Hashable]:
+        """目前進行中的讀取鍵"""
+        self._check_fork()
+        with self._lock:
+            return list(self._calls)
+
+
+def flight_key(sheet_name: str, range_name: Optional[str] = None,
+               spreadsheet_id: Optional[str] = None) -> tuple:
+    """
+    讀取鍵
+
+    Args:
+        sheet_name: 工作表名稱
+        range_name: 範圍，None 表示整張工作表
+        spreadsheet_id: 試算表ID，預設讀取環境變數
+
+    Returns:
+        (試算表ID, 工作表名稱, 範圍)
+    """
+    return (spreadsheet_id or get_spreadsheet_id(), sheet_name, range_name or '*')
+
+
+# 全域讀取合併實例
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    取得全域讀取合併實例
+
+    Returns:
+        SingleFlight 實例
+    """
+    return _single_flight
+
+
+def fetch_values(worksheet, range_name: Optional[str] = None, fresh: bool = False) -> List[List[Any]]:
+    """
+    合併同時進行的工作表讀取
+
+    Args:
+        worksheet: gspread 工作表
+        range_name: 範圍，None 表示整張工作表
+        fresh: 是否不加入進行中的讀取
+
+    Returns:
+        儲存格值（二維列表，與其他等待者共用，不可修改）
+    """
+    key = flight_key(worksheet.title, range_name, worksheet.spreadsheet_id)
+    if range_name is None:
+        return _single_flight.do(key, lambda: worksheet.get(pad_values=True), fresh=fresh)
+    return _single_flight.do(key, lambda: worksheet.get(range_name, pad_values=True), fresh=fresh)
+
@@ -0,0 +1,362 @@
+"""
+跨 worker 共用的快照儲存模組
+工作表快照存於本機 SQLite 檔案，由一個 worker 從 Sheets 讀取後寫入，其他 worker 直接載入；
+每次寫入或失效都遞增全域版本號，其他 worker 在下一個請求比對版本即可得知快照已改變；
+修補只寫入變更的列，累積到 SNAPSHOT_PATCH_LIMIT 筆時才合併回完整快照
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, List, Set, Tuple, NamedTuple
+
+from file_lock import LOCK_DIR
+
+# 設為 0 可停用共用快照（各 worker 各自讀取）
+SHARED_SNAPSHOTS_ENABLED = os.getenv('SHARED_SNAPSHOTS', '1') != '0'
+
+# SQLite 檔案所在目錄（需為所有 worker 共用的本機路徑）；快照含工作表內容，
+# 目錄建立為 0700、檔案為 0600，只有執行服務的帳號可讀取
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(LOCK_DIR, 'hrsystem_snapshots'))
+SNAPSHOT_DB = os.path.join(SNAPSHOT_DIR, 'snapshots.db')
+
+# 修補紀錄累積到此筆數時改為寫入完整快照並清除修補紀錄
+SNAPSHOT_PATCH_LIMIT = int(os.getenv('SNAPSHOT_PATCH_LIMIT', '200'))
+
+# 舊版直接放在 LOCK_DIR 的快照檔（權限未限制且含使用者帳號），啟用新路徑時刪除
+LEGACY_SNAPSHOT_DB = os.path.join(LOCK_DIR, 'hrsystem_snapshots.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS store_version (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    sheet_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    fetched_at REAL,
+    numericised INTEGER,
+    headers TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshot_records (
+    sheet_name TEXT PRIMARY KEY,
+    records TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_patches (
+    sheet_name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    base_version INTEGER NOT NULL,
+    rows TEXT NOT NULL,
+    PRIMARY KEY (sheet_name, version)
+);
+INSERT OR IGNORE INTO store_version (id, version) VALUES (0, 0);
+"""
+
+
+class SnapshotState(NamedTuple):
+    """快照的版本資訊（不含資料）"""
+    version: int
+    fetched_at: Optional[float]  # 已失效時為 None
+
+
+class StoredSnapshot(NamedTuple):
+    """共用的快照資料"""
+    version: int
+    fetched_at: float
+    numericised: bool
+    headers: List[str]
+    records: List[Dict[str, Any]]
+
+
+class StoredPatch(NamedTuple):
+    """一次修補寫入的列"""
+    version: int
+    base_version: int
+    rows: List[Tuple[int, Dict[str, Any]]]  # (記錄索引, 修補後的記錄)
+
+
+def apply_patch_rows(records: List[Dict[str, Any]], rows: List[Tuple[int, Dict[str, Any]]]) -> bool:
+    """
+    將修補的列套用到記錄列表（就地修改）
+
+    Args:
+        records: 記錄列表
+        rows: (記錄索引, 記錄) 列表，索引等於目前筆數時附加在最後
+
+    Returns:
+        是否套用成功；索引超出最後一筆之後時為 False
+    """
+    for index, record in rows:
+        if index < len(records):
+            records[index] = record
+        elif index == len(records):
+            records.append(record)
+        else:
+            return False
+    return True
+
+
+class SnapshotStore:
+    """SQLite 快照儲存
+
+    - 版本號全域單調遞增，寫入快照與使快照失效都會取得新版本
+    - 寫入時可指定預期版本，期間被其他 worker 修改或失效時放棄寫入
+    - 修補存為以版本為鍵的變更列，完整快照只在讀取與合併時寫入
+    - 每個執行緒使用自己的連線，fork 後重新連線
+    """
+
+    def __init__(self, path: str = SNAPSHOT_DB):
+        """
+        初始化儲存
+
+        Args:
+            path: SQLite 檔案路徑
+        """
+        self.path = path
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self._prepare_file()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _prepare_file(self):
+        """建立僅限本帳號存取的目錄與資料庫檔案（WAL 等附屬檔案沿用資料庫檔案的權限）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+        os.chmod(self.path, 0o600)
+
+    def _next_version(self, conn: sqlite3.Connection) -> int:
+        conn.execute('UPDATE store_version SET version = version + 1 WHERE id = 0')
+        return conn.execute('SELECT version FROM store_version WHERE id = 0').fetchone()[0]
+
+    def _version_matches(self, conn: sqlite3.Connection, sheet_name: str, expected_version: Optional[int]) -> bool:
+        if expected_version is None:
+            return True
+        row = conn.execute('SELECT version FROM snapshots WHERE sheet_name = ?', (sheet_name,)).fetchone()
+        return (row[0] if row else 0) == expected_version
+
+    def state(self, sheet_name: str) -> Optional[SnapshotState]:
+        """
+        取得快照版本資訊（每個請求都可呼叫的輕量查詢）
+
+        Returns:
+            SnapshotState，從未寫入時為 None
+        """
+        row = self._connect().execute(
+            'SELECT version, fetched_at FROM snapshots WHERE sheet_name = ?', (sheet_name,)
+        ).fetchone()
+        return SnapshotState(row[0], row[1]) if row else None
+
+    def load(self, sheet_name: str) -> Optional[StoredSnapshot]:
+        """
+        載入快照
+
+        Returns:
+            StoredSnapshot，從未寫入或已失效時為 None
+        """
+        conn = self._connect()
+        # 完整快照與修補紀錄在同一個讀取交易中取得，不會讀到合併到一半的內容
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute(
+                'SELECT s.version, s.fetched_at, s.numericised, s.headers, r.records '
+                'FROM snapshots s JOIN snapshot_records r ON r.sheet_name = s.sheet_name '
+                'WHERE s.sheet_name = ? AND s.fetched_at IS NOT NULL', (sheet_name,)
+            ).fetchone()
+            patches = self._patches(sheet_name) if row is not None else []
+        finally:
+            conn.execute('COMMIT')
+        if row is None:
+            return None
+        records = json.loads(row[4])
+        for patch in patches:
+            apply_patch_rows(records, patch.rows)
+        return StoredSnapshot(row[0], row[1], bool(row[2]), json.loads(row[3]), records)
+
+    def _patches(self, sheet_name: str, since_version: int = 0) -> List[StoredPatch]:
+        rows = self._connect().execute(
+            'SELECT version, base_version, rows FROM snapshot_patches '
+            'WHERE sheet_name = ? AND version > ? ORDER BY version', (sheet_name, since_version)
+        ).fetchall()
+        return [StoredPatch(version, base_version, [(index, record) for index, record in json.loads(patch_rows)])
+                for version, base_version, patch_rows in rows]
+
+    def load_patches(self, sheet_name: str, since_version: int) -> Optional[List[StoredPatch]]:
+        """
+        取得某個版本之後的修補（已有該版本快照的 worker 只需套用變更的列）
+
+        Args:
+            sheet_name: 工作表名稱
+            since_version: 目前持有的快照版本
+
+        Returns:
+            由舊到新的修補列表；該版本之後曾重新讀取、合併或失效時為 None
+        """
+        patches = self._patches(sheet_name, since_version)
+        if not patches or patches[0].base_version != since_version:
+            return None
+        return patches
+
+    def save(self, sheet_name: str, headers: List[str], records: List[Dict[str, Any]],
+             numericised: bool, fetched_at: float, expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        寫入快照
+
+        Args:
+            sheet_name: 工作表名稱
+            headers: 標題列
+            records: 記錄列表
+            numericised: 記錄是否已數值化
+            fetched_at: 讀取時間
+            expected_version: 預期的目前版本（0 表示尚無快照），不符時放棄寫入；None 表示不檢查
+
+        Returns:
+            新版本號；放棄寫入時為 None
+        """
+        headers_json = json.dumps(headers, ensure_ascii=False)
+        records_json = json.dumps(records, ensure_ascii=False, default=str)
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not self._version_matches(conn, sheet_name, expected_version):
+                conn.execute('ROLLBACK')
+                return None
+            version = self._next_version(conn)
+            conn.execute(
+                'INSERT OR REPLACE INTO snapshots (sheet_name, version, fetched_at, numericised, headers) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (sheet_name, version, fetched_at, int(numericised), headers_json)
+            )
+            conn.execute('INSERT OR REPLACE INTO snapshot_records (sheet_name, records) VALUES (?, ?)',
+                         (sheet_name, records_json))
+            conn.execute('DELETE FROM snapshot_patches WHERE sheet_name = ?', (sheet_name,))
+            conn.execute('COMMIT')
+            return version
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def save_patch(self, sheet_name: str, headers: List[str], records: List[Dict[str, Any]],
+                   numericised: bool, fetched_at: float, changed: Set[int],
+                   expected_version: int) -> Optional[int]:
+        """
+        寫入修補（只序列化變更的列；修補紀錄已達 SNAPSHOT_PATCH_LIMIT 筆時改寫完整快照）
+
+        Args:
+            sheet_name: 工作表名稱
+            headers: 標題列
+            records: 修補後的完整記錄列表
+            numericised: 記錄是否已數值化
+            fetched_at: 讀取時間
+            changed: 變更或新增的記錄索引
+            expected_version: 修補前的快照版本，不符時放棄寫入
+
+        Returns:
+            新版本號；放棄寫入時為 None
+        """
+        conn = self._connect()
+        patch_count = conn.execute('SELECT COUNT(*) FROM snapshot_patches WHERE sheet_name = ?',
+                                   (sheet_name,)).fetchone()[0]
+        if patch_count >= SNAPSHOT_PATCH_LIMIT:
+            return self.save(sheet_name, headers, records, numericised, fetched_at,
+                             expected_version=expected_version)
+
+        rows_json = json.dumps([[index, records[index]] for index in sorted(changed)],
+                               ensure_ascii=False, default=str)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not self._version_matches(conn, sheet_name, expected_version):
+                conn.execute('ROLLBACK')
+                return None
+            version = self._next_version(conn)
+            # 記錄另存一個資料表，遞增版本不必改寫整張工作表的資料
+            conn.execute('UPDATE snapshots SET version = ? WHERE sheet_name = ?', (version, sheet_name))
+            conn.execute(
+                'INSERT INTO snapshot_patches (sheet_name, version, base_version, rows) VALUES (?, ?, ?, ?)',
+                (sheet_name, version, expected_version, rows_json)
+            )
+            conn.execute('COMMIT')
+            return version
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def invalidate(self, sheet_name: str, expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        使快照失效（所有 worker 的下一個請求都會重新載入）
+
+        Args:
+            sheet_name: 工作表名稱
+            expected_version: 預期的目前版本（0 表示尚無快照），不符時放棄；None 表示不檢查
+
+        Returns:
+            新版本號；放棄時為 None
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not self._version_matches(conn, sheet_name, expected_version):
+                conn.execute('ROLLBACK')
+                return None
+            version = self._next_version(conn)
+            conn.execute(
+                'INSERT OR REPLACE INTO snapshots (sheet_name, version, fetched_at, numericised, headers) '
+                'VALUES (?, ?, NULL, NULL, NULL)',
+                (sheet_name, version)
+            )
+            conn.execute('DELETE FROM snapshot_records WHERE sheet_name = ?', (sheet_name,))
+            conn.execute('DELETE FROM snapshot_patches WHERE sheet_name = ?', (sheet_name,))
+            conn.execute('COMMIT')
+            return version
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def _remove_legacy_db():
+    for path in (LEGACY_SNAPSHOT_DB, LEGACY_SNAPSHOT_DB + '-wal', LEGACY_SNAPSHOT_DB + '-shm'):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"刪除舊版快照檔失敗: {e}")
+
+
+# 全域快照儲存實例
+_snapshot_store = None
+_snapshot_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> Optional[SnapshotStore]:
+    """
+    取得全域快照儲存實例
+
+    Returns:
+        SnapshotStore 實例；停用共用快照時為 None
+    """
+    global _snapshot_store
+
+    if not SHARED_SNAPSHOTS_ENABLED:
+        return None
+    if _snapshot_store is None:
+        with _snapshot_store_lock:
+            if _snapshot_store is None:
+                _remove_legacy_db()
+                _snapshot_store = SnapshotStore()
+
+    return _snapshot_store
@@ -0,0 +1,550 @@
+"""
+系統日誌背景寫入模組
+請求只把日誌事件放入記憶體佇列，由背景執行緒定期合併後寫入系統日誌工作表：
+新增列以一次 append_rows 寫入，既有列的動作/登出時間以一次 batch_update 寫入，
+worker 結束時會先寫完佇列中剩餘的事件；
+已登出且超過保留天數的紀錄每天輪替到每月封存工作表
+"""
+
+import os
+import json
+import time
+import atexit
+import queue
+import threading
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, Optional, List, Tuple
+
+from gspread.utils import a1_to_rowcol
+
+from file_lock import FileLock, LOCK_DIR
+from sheets_client import get_sheets_pool
+from sheet_cache import get_sheet_cache
+from sheet_writer import CellWriteBuffer
+
+LOG_SHEET = '系統日誌'
+
+# 欄位順序為 姓名、登入時間、登出時間、動作；以下為需更新欄位的位置（1-based）
+LOGOUT_COL, ACTION_COL = 3, 4
+
+# 寫入間隔秒數，可用環境變數調整
+FLUSH_INTERVAL = float(os.getenv('SYSTEM_LOG_FLUSH_INTERVAL', '5'))
+
+# 寫入失敗時同一事件最多重試次數
+MAX_ATTEMPTS = 3
+
+# 日誌ID -> 列號 對照檔（所有 worker 共用），只保留最近的項目
+LOG_ROWS_FILE = os.path.join(LOCK_DIR, 'hrsystem_log_rows.json')
+MAX_LOG_ROWS = 1000
+
+# 日誌輪替：已登出且超過保留天數的紀錄搬到每月封存工作表（系統日誌_YYYYMM）
+RETENTION_DAYS = int(os.getenv('SYSTEM_LOG_RETENTION_DAYS', '30'))
+ROTATION_ENABLED = os.getenv('SYSTEM_LOG_ROTATION', 'true').lower() == 'true'
+ROTATION_INTERVAL = 24 * 60 * 60
+ROTATION_STAMP_FILE = os.path.join(LOCK_DIR, 'hrsystem_log_rotation.stamp')
+ARCHIVE_PREFIX = f'{LOG_SHEET}_'
+
+
+def append_action(content: str, action_str: str) -> str:
+    """在動作欄位附加一筆動作（與原本逐筆更新的格式相同）"""
+    return (str(content or '') + action_str + ' ; ').strip()
+
+
+class LogRowRegistry:
+    """登入日誌列號對照表
+
+    登入列由背景寫入器新增，寫入後才知道列號；寫入器將 日誌ID -> 列號 記錄於共用檔案，
+    之後的請求（可能在其他 worker）再依 session 內的日誌ID 取得列號。
+    日誌輪替搬移列之後 epoch 遞增，session 內舊 epoch 的列號不再使用。
+    """
+
+    def __init__(self, path: str = LOG_ROWS_FILE):
+        """
+        初始化對照表
+
+        Args:
+            path: 對照檔路徑
+        """
+        self.path = path
+        self._state = (0, {})
+        self._mtime = None
+
+    def _load(self) -> Tuple[int, Dict[str, int]]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return 0, {}
+        if mtime != self._mtime:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+                self._state = (int(data.get('epoch', 0)), data.get('rows', {}))
+            except (OSError, ValueError, AttributeError):
+                self._state = (0, {})
+            self._mtime = mtime
+        return self._state
+
+    def _save(self, epoch: int, rows: Dict[str, int]):
+        # 鎖內呼叫
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'epoch': epoch, 'rows': rows}, f)
+        os.replace(tmp_path, self.path)
+        self._state = (epoch, rows)
+        self._mtime = os.path.getmtime(self.path)
+
+    def epoch(self) -> int:
+        """目前的列號版本"""
+        return self._load()[0]
+
+    def get(self, log_id: Optional[str]) -> Optional[int]:
+        """依日誌ID取得列號，尚未寫入或已過期時為 None"""
+        if not log_id:
+            return None
+        return self._load()[1].get(log_id)
+
+    def set_many(self, rows: Dict[str, int]):
+        """
+        記錄多個日誌ID的列號
+
+        Args:
+            rows: 日誌ID -> 列號
+        """
+        if not rows:
+            return
+        with FileLock('log_rows'):
+            epoch, current = self._load()
+            current = dict(current)
+            current.update(rows)
+            # 只保留最近的項目（dict 依插入順序）
+            if len(current) > MAX_LOG_ROWS:
+                current = dict(list(current.items())[-MAX_LOG_ROWS:])
+            self._save(epoch, current)
+
+    def remap(self, moved: Dict[int, int]):
+        """
+        日誌列搬移後更新列號，並遞增 epoch
+
+        Args:
+            moved: 舊列號 -> 新列號；不在其中的列視為已封存
+        """
+        with FileLock('log_rows'):
+            epoch, current = self._load()
+            rows = {log_id: moved[row] for log_id, row in current.items() if row in moved}
+            self._save(epoch + 1, rows)
+
+
+class LogEvent:
+    """日誌事件：新增一列（append）或更新該使用者最後一筆未登出的列（update）
+
+    update 事件若帶有 log_row（session 已知的列號）或 log_id（登入列的日誌ID），
+    直接寫入該列；兩者皆無或對不上時才以姓名搜尋整張日誌工作表。
+    """
+
+    def __init__(self, kind: str, name: str, login_time: Optional[str] = None,
+                 logout_time: Optional[str] = None, action: str = '',
+                 log_id: Optional[str] = None, log_row: Optional[int] = None,
+                 log_epoch: Optional[int] = None):
+        self.kind = kind
+        self.name = name
+        self.login_time = login_time
+        self.logout_time = logout_time
+        self.action = action
+        self.log_id = log_id
+        self.log_row = log_row
+        self.log_epoch = log_epoch
+        self.attempts = 0
+        # 是否更新的是工作表上既有的列（寫入失敗時只重試這些事件）
+        self.targets_sheet = False
+
+
+class SystemLogWriter:
+    """系統日誌背景寫入器"""
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        """
+        初始化寫入器
+
+        Args:
+            interval: 寫入間隔秒數
+        """
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.registry = LogRowRegistry()
+
+    def _ensure_started(self):
+        # 執行緒在第一次送出事件時才啟動；fork 後的子行程需重新啟動自己的執行緒
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._stop = threading.Event()
+            self._flush_lock = threading.Lock()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='system-log-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, event: LogEvent):
+        """
+        送出日誌事件（不會阻塞呼叫端）
+
+        Args:
+            event: 日誌事件
+        """
+        self._ensure_started()
+        self._queue.put(event)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+            maybe_rotate_system_log()
+        self.flush()
+
+    def _drain(self) -> List[LogEvent]:
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _requeue(self, events: List[LogEvent], error: Exception):
+        for event in events:
+            event.attempts += 1
+            if event.attempts < MAX_ATTEMPTS:
+                self._queue.put(event)
+            else:
+                print(f"寫入系統日誌失敗，放棄事件 {event.kind} {event.name}: {error}")
+
+    def flush(self):
+        """立即寫入佇列中的所有事件"""
+        with self._flush_lock:
+            events = self._drain()
+            if not events:
+                return
+            # 與日誌輪替互斥（輪替會搬移列號），所有 worker 共用同一把鎖
+            with FileLock('system_log'):
+                self._write(events)
+
+    def _write(self, events: List[LogEvent]):
+        """寫入一批事件（鎖內呼叫）"""
+        try:
+            worksheet = get_sheets_pool().get_worksheet(LOG_SHEET)
+        except Exception as e:
+            print(f"寫入系統日誌失敗: {e}")
+            self._requeue(events, e)
+            return
+
+        try:
+            new_rows, new_row_ids, sheet_updates, unmatched = self._coalesce(worksheet, events)
+        except Exception as e:
+            print(f"讀取系統日誌失敗: {e}")
+            self._requeue(events, e)
+            return
+
+        # 寫入的列與儲存格直接修補日誌快照（含共用快照），查詢不必重新讀取整張日誌
+        cache = get_sheet_cache(LOG_SHEET)
+        if new_rows:
+            try:
+                response = worksheet.append_rows(new_rows)
+            except Exception as e:
+                # 新增列尚未寫入，所有事件下次重試
+                print(f"寫入系統日誌失敗: {e}")
+                self._requeue(events, e)
+                return
+            start_row = self._record_rows(response, new_row_ids)
+            if start_row is None:
+                cache.invalidate()
+            else:
+                cache.append_records(start_row, new_rows)
+
+        updated_cells = len(sheet_updates)
+        if updated_cells:
+            try:
+                updates = sheet_updates.flush()
+            except Exception as e:
+                print(f"更新系統日誌失敗: {e}")
+                self._requeue([event for event in events if event.targets_sheet], e)
+                return
+            cache.apply_cell_updates(updates)
+
+        if new_rows or updated_cells:
+            print(f"DEBUG: 系統日誌已寫入 {len(events) - len(unmatched)} 筆事件（新增 {len(new_rows)} 列，"
+                  f"更新 {updated_cells} 格）")
+        if unmatched:
+            # 登入列可能還在其他 worker 的佇列中，下次寫入時再找
+            self._requeue(unmatched, Exception('找不到未登出的日誌列'))
+
+    def _record_rows(self, response: Dict[str, Any], new_row_ids: List[Optional[str]]) -> Optional[int]:
+        """
+        由 append_rows 的回應取得新增列的列號，記錄到日誌列號對照表
+
+        Returns:
+            第一個新增列的列號；無法取得時為 None
+        """
+        try:
+            updated_range = response['updates']['updatedRange']
+            start_row, _ = a1_to_rowcol(updated_range.split('!')[-1].split(':')[0])
+        except (KeyError, TypeError, IndexError) as e:
+            print(f"無法取得系統日誌新增列號: {e}")
+            return None
+        self.registry.set_many({
+            log_id: start_row + i for i, log_id in enumerate(new_row_ids) if log_id
+        })
+        return start_row
+
+    def _coalesce(self, worksheet, events: List[LogEvent]):
+        """
+        依送出順序合併事件
+
+        Returns:
+            (要新增的列, 各新增列的日誌ID, 既有列的 CellWriteBuffer, 找不到登入列的事件)
+        """
+        new_rows: List[List[str]] = []
+        new_row_ids: List[Optional[str]] = []
+        buffer = CellWriteBuffer(worksheet)
+
+        # 已知列號的事件：一次讀取這些列確認姓名，不必讀取整張工作表
+        direct_rows = {}
+        for event in events:
+            if event.kind == 'update':
+                # session 的列號只在輪替前後一致時可用，否則改查對照表（已依輪替更新）
+                row_number = event.log_row if event.log_epoch == self.registry.epoch() else None
+                row_number = row_number or self.registry.get(event.log_id)
+                if row_number:
+                    direct_rows[id(event)] = row_number
+        sheet_rows = self._read_rows(worksheet, sorted(set(direct_rows.values())))
+        open_rows: Optional[Dict[str, List[int]]] = None
+        closed_rows = set()
+        unmatched: List[LogEvent] = []
+
+        for event in events:
+            if event.kind == 'append':
+                new_rows.append([event.name, event.login_time or '', event.logout_time or '', event.action or ''])
+                new_row_ids.append(event.log_id)
+                continue
+
+            # 優先合併到本批次新增、尚未登出的列
+            target = None
+            for row, log_id in zip(reversed(new_rows), reversed(new_row_ids)):
+                if event.log_id and log_id:
+                    matched = log_id == event.log_id
+                else:
+                    matched = row[0] == event.name and not row[2]
+                if matched:
+                    target = row
+                    break
+            if target is not None:
+                if event.action:
+                    target[3] = append_action(target[3], event.action)
+                if event.logout_time:
+                    target[2] = event.logout_time
+                continue
+
+            row_number = direct_rows.get(id(event))
+            if row_number is not None:
+                values = sheet_rows.get(row_number)
+                if not values or values[0] != event.name:
+                    print(f"DEBUG: 系統日誌第 {row_number} 列不是 {event.name} 的紀錄，改以姓名搜尋")
+                    row_number = None
+
+            if row_number is None:
+                # 備援：讀取整張日誌一次，建立 姓名 -> 未登出列號 的索引（每批次最多一次）
+                if open_rows is None:
+                    all_rows, open_rows = self._load_open_rows(worksheet)
+                    for number, values in all_rows.items():
+                        sheet_rows.setdefault(number, values)
+                candidates = [number for number in open_rows.get(event.name, []) if number not in closed_rows]
+                if not candidates:
+                    print(f"DEBUG: 找不到 {event.name} 未登出的日誌列，稍後重試")
+                    unmatched.append(event)
+                    continue
+                row_number = candidates[-1]
+
+            values = sheet_rows[row_number]
+            event.targets_sheet = True
+            if event.action:
+                values[3] = append_action(values[3], event.action)
+                buffer.set(row_number, ACTION_COL, values[3])
+            if event.logout_time:
+                values[2] = event.logout_time
+                buffer.set(row_number, LOGOUT_COL, event.logout_time)
+                closed_rows.add(row_number)
+
+        return new_rows, new_row_ids, buffer, unmatched
+
+    @staticmethod
+    def _read_rows(worksheet, row_numbers: List[int]) -> Dict[int, List[str]]:
+        """以一次 batch_get 讀取指定的日誌列"""
+        if not row_numbers:
+            return {}
+        ranges = worksheet.batch_get([f'A{row}:D{row}' for row in row_numbers])
+        rows = {}
+        for row_number, value_range in zip(row_numbers, ranges):
+            row = list(value_range[0]) if value_range else []
+            rows[row_number] = (row + [''] * 4)[:4]
+        return rows
+
+    @staticmethod
+    def _load_open_rows(worksheet):
+        """讀取日誌工作表一次，建立 姓名 -> 未登出列號 的索引"""
+        values = worksheet.get('A:D', pad_values=True)
+        sheet_rows = {}
+        open_rows: Dict[str, List[int]] = {}
+        for row_number, row in enumerate(values[1:], start=2):
+            row = (list(row) + [''] * 4)[:4]
+            sheet_rows[row_number] = row
+            if row[0] and not row[2]:
+                open_rows.setdefault(row[0], []).append(row_number)
+        return sheet_rows, open_rows
+
+    def stop(self, timeout: float = 10):
+        """停止背景執行緒並寫完剩餘事件（worker 結束時呼叫）"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return
+        # 執行緒結束後才送出的事件
+        self.flush()
+
+
+# 全域寫入器實例
+_system_log_writer = None
+_system_log_writer_lock = threading.Lock()
+
+
+def get_system_log_writer() -> SystemLogWriter:
+    """
+    取得全域系統日誌寫入器
+
+    Returns:
+        SystemLogWriter 實例
+    """
+    global _system_log_writer
+
+    if _system_log_writer is None:
+        with _system_log_writer_lock:
+            if _system_log_writer is None:
+                _system_log_writer = SystemLogWriter()
+                atexit.register(_system_log_writer.stop)
+
+    return _system_log_writer
+
+
+def log_date(login_time: Any) -> Optional[date]:
+    """由登入時間 (YYYYmmdd HH:MM) 取得日期，無法解析時為 None"""
+    try:
+        return datetime.strptime(str(login_time or '').strip()[:8], '%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def archive_sheet_name(month: str) -> str:
+    """封存工作表名稱，例如 系統日誌_202507"""
+    return f'{ARCHIVE_PREFIX}{month}'
+
+
+def hot_cutoff(retention_days: Optional[int] = None, today: Optional[date] = None) -> date:
+    """熱分區（系統日誌工作表）保留的最早日期；早於此日期且已登出的紀錄會被封存"""
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    return (today or date.today()) - timedelta(days=retention_days)
+
+
+def rotate_system_log(retention_days: Optional[int] = None, today: Optional[date] = None) -> Dict[str, int]:
+    """
+    將已登出且早於保留天數的日誌搬到每月封存工作表，並改寫熱分區
+
+    Args:
+        retention_days: 保留天數，預設為 SYSTEM_LOG_RETENTION_DAYS
+        today: 基準日期（測試用）
+
+    Returns:
+        封存工作表名稱 -> 搬移筆數
+    """
+    cutoff = hot_cutoff(retention_days, today)
+    pool = get_sheets_pool()
+
+    # 與背景寫入器互斥，輪替期間各 worker 不會寫入日誌
+    with FileLock('system_log'):
+        worksheet = pool.get_worksheet(LOG_SHEET)
+        values = worksheet.get('A:D', pad_values=True)
+        if len(values) < 2:
+            return {}
+        headers = (list(values[0]) + [''] * 4)[:4]
+
+        kept = []
+        moved: Dict[int, int] = {}
+        archives: Dict[str, List[List[str]]] = {}
+        for row_number, row in enumerate(values[1:], start=2):
+            row = (list(row) + [''] * 4)[:4]
+            day = log_date(row[1])
+            # 尚未登出或無法判斷日期的紀錄一律保留
+            if row[2] and day is not None and day < cutoff:
+                archives.setdefault(archive_sheet_name(day.strftime('%Y%m')), []).append(row)
+            else:
+                kept.append(row)
+                moved[row_number] = len(kept) + 1
+
+        if not archives:
+            return {}
+
+        # 先寫入封存（失敗時熱分區不變），再改寫熱分區
+        spreadsheet = pool.get_spreadsheet()
+        existing = {ws.title for ws in spreadsheet.worksheets()}
+        for title, rows in sorted(archives.items()):
+            if title in existing:
+                pool.get_worksheet(title).append_rows(rows)
+            else:
+                archive = spreadsheet.add_worksheet(title=title, rows=len(rows) + 1, cols=len(headers))
+                archive.append_rows([headers] + rows)
+
+        last_row = len(values)
+        worksheet.update([headers] + kept, f'A1:D{len(kept) + 1}')
+        if last_row > len(kept) + 1:
+            worksheet.delete_rows(len(kept) + 2, last_row)
+
+        # 列號已改變，更新日誌列號對照表
+        get_system_log_writer().registry.remap(moved)
+
+    get_sheet_cache(LOG_SHEET).invalidate()
+    for title in archives:
+        get_sheet_cache(title).invalidate()
+
+    result = {title: len(rows) for title, rows in archives.items()}
+    print(f"DEBUG: 系統日誌輪替完成，封存 {sum(result.values())} 筆: {result}")
+    return result
+
+
+def maybe_rotate_system_log():
+    """距離上次輪替超過一天時執行輪替（所有 worker 共用戳記，每天只執行一次）"""
+    if not ROTATION_ENABLED:
+        return
+    try:
+        if time.time() - os.path.getmtime(ROTATION_STAMP_FILE) < ROTATION_INTERVAL:
+            return
+    except OSError:
+        pass
+    with FileLock('log_rotation'):
+        try:
+            if time.time() - os.path.getmtime(ROTATION_STAMP_FILE) < ROTATION_INTERVAL:
+                return
+        except OSError:
+            pass
+        # 先更新戳記，輪替失敗時也要隔一天才重試，避免每次寫入都重跑
+        with open(ROTATION_STAMP_FILE, 'a'):
+            pass
+        os.utime(ROTATION_STAMP_FILE, None)
+        try:
+            rotate_system_log()
+        except Exception as e:
+            print(f"系統日誌輪替失敗: {e}")
+
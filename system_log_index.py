@@ -0,0 +1,235 @@
+"""
+系統日誌查詢索引模組
+對系統日誌的各分區（熱分區與每月封存）快照建立依登入時間排序的索引與姓名索引，
+以二分搜尋定位時間區間，並用游標分頁查詢，查詢成本不隨日誌筆數增加
+"""
+
+import json
+import base64
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+from typing import Dict, Any, Optional, List, Tuple, Iterator, Set
+
+from sheets_client import get_sheets_pool
+from sheet_cache import get_sheet_cache
+from system_log import LOG_SHEET, archive_sheet_name, hot_cutoff
+
+# 每頁筆數上限
+MAX_PAGE_SIZE = 200
+
+# 索引項目：(登入時間, 分區順位, 記錄索引)，全域唯一且可排序
+Entry = Tuple[str, int, int]
+
+
+def _login_key(record: Dict[str, Any]) -> str:
+    return str(record.get('登入時間', '')).strip()
+
+
+def _name_key(record: Dict[str, Any]) -> str:
+    return str(record.get('姓名', '')).strip()
+
+
+class SystemLogIndex:
+    """單一分區快照的索引（建立後不再修改）"""
+
+    def __init__(self, title: str, rank: int, version: int, records: List[Dict[str, Any]],
+                 entries: Optional[List[Entry]] = None, by_name: Optional[Dict[str, List[Entry]]] = None):
+        """
+        建立索引
+
+        Args:
+            title: 分區工作表名稱
+            rank: 分區順位（越舊越小，同一登入時間依此排序）
+            version: 快照版本
+            records: 快照記錄
+            entries: 已排序的索引項目（由 patched() 沿用），預設依記錄建立
+            by_name: 姓名索引（由 patched() 沿用），預設依記錄建立
+        """
+        self.title = title
+        self.rank = rank
+        self.version = version
+        self.records = records
+        if entries is None:
+            entries = sorted((_login_key(record), rank, i) for i, record in enumerate(records))
+            by_name = {}
+            for entry in entries:
+                name = _name_key(records[entry[2]])
+                if name:
+                    by_name.setdefault(name, []).append(entry)
+        self.entries: List[Entry] = entries
+        self.by_name: Dict[str, List[Entry]] = by_name
+
+    def patched(self, version: int, records: List[Dict[str, Any]], changed: Set[int]) -> Optional['SystemLogIndex']:
+        """
+        快照修補後沿用目前的索引（寫入器只新增列或更新登出時間、動作）
+
+        Args:
+            version: 修補後的快照版本
+            records: 修補後的快照記錄
+            changed: 修補過的記錄索引
+
+        Returns:
+            新索引；既有記錄的登入時間或姓名被改變時為 None（需整個重建）
+        """
+        entries = list(self.entries)
+        by_name = dict(self.by_name)
+        copied = set()
+        for i in sorted(changed):
+            if i < len(self.records):
+                old, new = self.records[i], records[i]
+                if _login_key(old) != _login_key(new) or _name_key(old) != _name_key(new):
+                    return None
+                continue
+            entry = (_login_key(records[i]), self.rank, i)
+            insort(entries, entry)
+            name = _name_key(records[i])
+            if name:
+                if name not in copied:
+                    by_name[name] = list(by_name.get(name, []))
+                    copied.add(name)
+                insort(by_name[name], entry)
+        return SystemLogIndex(self.title, self.rank, version, records, entries, by_name)
+
+    def names(self) -> List[str]:
+        return list(self.by_name)
+
+    def scan(self, name: Optional[str], start_key: Optional[str], end_key: Optional[str],
+             cursor: Optional[Entry], descending: bool) -> Tuple[Iterator[Entry], int]:
+        """
+        取得符合條件的索引項目
+
+        Returns:
+            (依排序方向的項目迭代器, 符合條件的總筆數（不含游標限制）)
+        """
+        entries = self.by_name.get(name, []) if name else self.entries
+        lo = bisect_left(entries, (start_key,)) if start_key else 0
+        hi = bisect_left(entries, (end_key,)) if end_key else len(entries)
+        total = max(hi - lo, 0)
+
+        if descending:
+            if cursor is not None:
+                hi = min(hi, bisect_left(entries, cursor))
+            return (entries[i] for i in range(hi - 1, lo - 1, -1)), total
+        if cursor is not None:
+            lo = max(lo, bisect_right(entries, cursor))
+        return (entries[i] for i in range(lo, hi)), total
+
+
+class SystemLogIndexCache:
+    """依分區快取索引，快照版本改變時才更新（快照只被修補時沿用原索引）"""
+
+    def __init__(self):
+        self._indexes: Dict[str, SystemLogIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, title: str, rank: int) -> SystemLogIndex:
+        snapshot = get_sheet_cache(title).get_snapshot()
+        index = self._indexes.get(title)
+        if index is None or index.version != snapshot.version or index.rank != rank:
+            changed = snapshot.changed_since(index.version) if index is not None and index.rank == rank else None
+            patched = index.patched(snapshot.version, snapshot.records, changed) if changed is not None else None
+            index = patched or SystemLogIndex(title, rank, snapshot.version, snapshot.records)
+            with self._lock:
+                self._indexes[title] = index
+        return index
+
+
+# 全域索引快取
+_log_indexes = SystemLogIndexCache()
+
+
+def partition_titles(start: Optional[date] = None, end: Optional[date] = None) -> List[str]:
+    """
+    查詢區間涵蓋的分區，由舊到新；起始日期早於熱分區保留期間時才包含封存工作表
+
+    Args:
+        start: 登入日期起（含）
+        end: 登入日期迄（含）
+
+    Returns:
+        工作表名稱列表
+    """
+    titles = [LOG_SHEET]
+    if start is None or start >= hot_cutoff():
+        return titles
+
+    existing = {ws.title for ws in get_sheets_pool().get_spreadsheet().worksheets()}
+    month = date(start.year, start.month, 1)
+    last = end or date.today()
+    archive_titles = []
+    while month <= last:
+        title = archive_sheet_name(month.strftime('%Y%m'))
+        if title in existing:
+            archive_titles.append(title)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return archive_titles + titles
+
+
+def encode_cursor(entry: Entry) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(entry)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Entry]:
+    """解析游標，格式錯誤時視為第一頁"""
+    if not cursor:
+        return None
+    try:
+        key, rank, index = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(key), int(rank), int(index)
+    except (ValueError, TypeError):
+        return None
+
+
+def get_log_names() -> List[str]:
+    """熱分區中出現過的姓名（篩選選單用）"""
+    return sorted(_log_indexes.get(LOG_SHEET, 0).names())
+
+
+def query_system_log(name: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None,
+                     order: str = 'desc', limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    分頁查詢系統日誌
+
+    Args:
+        name: 姓名
+        start: 登入日期起（含）
+        end: 登入日期迄（含）
+        order: 'desc'（新到舊）或 'asc'
+        limit: 每頁筆數
+        cursor: 上一頁回傳的 next_cursor
+
+    Returns:
+        {'records', 'next_cursor', 'has_more', 'total'}
+    """
+    descending = order != 'asc'
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    start_key = start.strftime('%Y%m%d') if start else None
+    # 迄日當天的所有時間都要包含
+    end_key = (end + timedelta(days=1)).strftime('%Y%m%d') if end else None
+    position = decode_cursor(cursor)
+
+    indexes = [_log_indexes.get(title, rank) for rank, title in enumerate(partition_titles(start, end))]
+    iterators = []
+    total = 0
+    for index in indexes:
+        entries, count = index.scan(name, start_key, end_key, position, descending)
+        iterators.append(entries)
+        total += count
+    records_by_rank = {index.rank: index.records for index in indexes}
+
+    page: List[Entry] = []
+    for entry in heapq.merge(*iterators, reverse=descending):
+        page.append(entry)
+        if len(page) > limit:
+            break
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    return {
+        'records': [dict(records_by_rank[rank][i]) for _, rank, i in page],
+        'next_cursor': encode_cursor(page[-1]) if has_more else None,
+        'has_more': has_more,
+        'total': total,
+    }
@@ -0,0 +1,79 @@
+"""測試請購單匯入的逐列驗證：欄位整理、數量與需求日期的格式轉換、錯誤訊息"""
+
+from datetime import date, datetime
+
+import pytest
+
+from purchase_import import validate_import_row
+
+DEPARTMENTS = {'研發部', '製造部'}
+UNITS = {'支', '包'}
+
+
+def make_record(**overrides):
+    record = {
+        'department': '研發部',
+        'item_name': '原子筆',
+        'spec': '0.5mm',
+        'quantity': '3',
+        'unit': '支',
+        'need_date': '2025-08-01',
+        'purpose': '文具',
+        'note': '',
+    }
+    record.update(overrides)
+    return record
+
+
+def test_valid_row():
+    item, errors = validate_import_row(make_record(item_name='  原子筆 ', spec=None), DEPARTMENTS, UNITS)
+    assert errors == []
+    assert item['item_name'] == '原子筆'
+    assert item['spec'] == ''
+    assert item['quantity'] == '3'
+    assert item['need_date'] == '2025-08-01'
+
+
+@pytest.mark.parametrize('quantity, expected', [('3', '3'), ('3.0', '3'), (5, '5'), (2.0, '2'), (' 7 ', '7')])
+def test_quantity_is_normalised(quantity, expected):
+    item, errors = validate_import_row(make_record(quantity=quantity), DEPARTMENTS, UNITS)
+    assert errors == []
+    assert item['quantity'] == expected
+
+
+@pytest.mark.parametrize('quantity', ['0', '-1', '1.5', 'abc', '', None, 'inf', '-inf', 'nan', '1e400',
+                                      float('inf'), float('nan')])
+def test_invalid_quantity(quantity):
+    _, errors = validate_import_row(make_record(quantity=quantity), DEPARTMENTS, UNITS)
+    assert errors == ['數量需為正整數']
+
+
+@pytest.mark.parametrize('need_date', ['2025-08-01', '2025/08/01', '20250801',
+                                       date(2025, 8, 1), datetime(2025, 8, 1, 12, 0)])
+def test_need_date_formats(need_date):
+    item, errors = validate_import_row(make_record(need_date=need_date), DEPARTMENTS, UNITS)
+    assert errors == []
+    assert item['need_date'] == '2025-08-01'
+
+
+@pytest.mark.parametrize('need_date', ['2025-13-01', '08/01/2025', '', None])
+def test_invalid_need_date(need_date):
+    _, errors = validate_import_row(make_record(need_date=need_date), DEPARTMENTS, UNITS)
+    assert errors == ['需求日期格式錯誤']
+
+
+def test_all_errors_are_reported_together():
+    _, errors = validate_import_row(
+        make_record(item_name='', department='財務部', unit='箱', quantity='0', need_date='x'),
+        DEPARTMENTS, UNITS
+    )
+    assert errors == ['品名不可空白', '請購部門「財務部」不存在', '單位「箱」不存在',
+                      '數量需為正整數', '需求日期格式錯誤']
+
+
+def test_missing_optional_fields():
+    record = make_record()
+    del record['spec'], record['purpose'], record['note']
+    item, errors = validate_import_row(record, DEPARTMENTS, UNITS)
+    assert errors == []
+    assert (item['spec'], item['purpose'], item['note']) == ('', '', '')
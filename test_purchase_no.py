@@ -0,0 +1,91 @@
+"""測試請購單號配號器：流水號起算、連續配號、換日與多執行緒同時配號"""
+
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+import purchase_no
+from conftest import FakeCache
+from purchase_no import PurchaseNoAllocator, max_sequence_for_day, format_purchase_no
+from sheet_cache import SheetSnapshot
+
+TODAY = '20250718'
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 7, 18, 9, 30)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fake = FakeCache(SheetSnapshot('請購單', ['請購單號'], [
+        {'請購單號': f'{TODAY}-007'},
+        {'請購單號': f'{TODAY}-012'},
+        {'請購單號': '20000101-099'},
+        {'請購單號': f'{TODAY}-abc'},
+        {'請購單號': ''},
+    ], 1, 0))
+    monkeypatch.setattr(purchase_no, 'get_sheet_cache', lambda sheet_name: fake)
+    monkeypatch.setattr(purchase_no, 'datetime', FixedDatetime)
+    return fake
+
+
+@pytest.fixture
+def allocator(tmp_path):
+    return PurchaseNoAllocator(str(tmp_path / 'seq.json'))
+
+
+def test_max_sequence_ignores_other_days_and_bad_numbers():
+    records = [{'請購單號': '20250701-003'}, {'請購單號': '20250701-x'}, {'請購單號': '20250702-050'}, {}]
+    assert max_sequence_for_day(records, '20250701') == 3
+    assert max_sequence_for_day(records, '20250703') == 0
+
+
+def test_format_pads_to_three_digits():
+    assert format_purchase_no('20250718', 1) == '20250718-001'
+    assert format_purchase_no('20250718', 1234) == '20250718-1234'
+
+
+def test_first_allocation_continues_after_sheet_maximum(cache, allocator):
+    assert allocator.allocate(3) == [f'{TODAY}-013', f'{TODAY}-014', f'{TODAY}-015']
+    assert allocator.allocate_one() == f'{TODAY}-016'
+    # 只有當日第一次配號讀取快照
+    assert cache.reads == 1
+
+
+def test_day_change_restarts_from_snapshot(cache, allocator):
+    with open(allocator.path, 'w', encoding='utf-8') as f:
+        json.dump({'date': '20000101', 'seq': 500}, f)
+    assert allocator.allocate_one() == f'{TODAY}-013'
+    assert cache.reads == 1
+
+
+def test_peek_does_not_reserve(cache, allocator):
+    assert allocator.peek() == f'{TODAY}-013'
+    assert allocator.peek() == f'{TODAY}-013'
+    assert allocator.allocate_one() == f'{TODAY}-013'
+    assert allocator.peek() == f'{TODAY}-014'
+
+
+def test_concurrent_allocations_are_unique_and_consecutive(cache, allocator):
+    results = []
+    results_lock = threading.Lock()
+
+    def worker():
+        for _ in range(10):
+            numbers = allocator.allocate(2)
+            with results_lock:
+                results.extend(numbers)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == len(set(results)) == 160
+    assert sorted(results) == [format_purchase_no(TODAY, seq) for seq in range(13, 173)]
@@ -0,0 +1,188 @@
+"""測試跨 worker 共用快照：兩個 SheetCache 共用同一個 SnapshotStore，模擬 worker 之間的載入、修補、失效與版本衝突"""
+
+import os
+import stat
+
+import pytest
+
+import sheet_cache
+import snapshot_store
+from conftest import FakePool, FakeWorksheet
+from file_lock import FileLock
+from sheet_cache import SheetCache
+from snapshot_store import SnapshotStore
+
+SHEET = '請購單'
+HEADERS = ['請購單號', '品名', '簽核狀態']
+
+
+@pytest.fixture
+def worksheet(monkeypatch):
+    fake = FakeWorksheet(SHEET, [HEADERS, ['20250718-001', '原子筆', '待簽核'], ['20250718-002', '筆記本', '待簽核']])
+    pool = FakePool({SHEET: fake})
+    monkeypatch.setattr(sheet_cache, 'get_sheets_pool', lambda: pool)
+    return fake
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / 'snapshots' / 'snapshots.db'))
+
+
+def make_worker(store, share_records=True):
+    """每個 SheetCache 代表一個 worker 的快取，共用同一個 SQLite 檔案"""
+    cache = SheetCache(SHEET, ttl=60, key_column='請購單號', share_records=share_records)
+    cache.store = store
+    return cache
+
+
+def test_snapshot_saved_by_one_worker_is_adopted_by_another(worksheet, store):
+    worker_a, worker_b = make_worker(store), make_worker(store)
+    snapshot_a = worker_a.get_snapshot()
+    snapshot_b = worker_b.get_snapshot()
+
+    assert worksheet.reads == 1
+    assert snapshot_b.version == snapshot_a.version
+    assert snapshot_b.records == snapshot_a.records
+
+
+def test_patch_is_visible_to_other_worker(worksheet, store):
+    worker_a, worker_b = make_worker(store), make_worker(store)
+    worker_a.get_snapshot()
+    worker_b.get_snapshot()
+
+    assert worker_a.apply_cell_updates([(3, 3, '已核准')])
+    row, record = worker_b.find('20250718-002')
+    assert (row, record['簽核狀態']) == (3, '已核准')
+    assert worker_b.get_snapshot().version == worker_a.get_snapshot().version
+    assert worksheet.reads == 1
+
+
+def test_patch_stores_only_changed_rows(worksheet, store):
+    worker_a, worker_b = make_worker(store), make_worker(store)
+    base = worker_a.get_snapshot()
+    worker_b.get_snapshot()
+
+    assert worker_a.apply_cell_updates([(3, 3, '已核准')])
+    assert worker_a.append_records(4, [['20250718-003', '釘書機', '待簽核']])
+    patches = store.load_patches(SHEET, base.version)
+    assert [patch.rows for patch in patches] == [
+        [(1, {'請購單號': '20250718-002', '品名': '筆記本', '簽核狀態': '已核准'})],
+        [(2, {'請購單號': '20250718-003', '品名': '釘書機', '簽核狀態': '待簽核'})],
+    ]
+
+    # worker B 只套用變更的列，修補紀錄與主鍵索引同步更新
+    snapshot_b = worker_b.get_snapshot()
+    assert snapshot_b.version == worker_a.get_snapshot().version
+    assert snapshot_b.changed_since(base.version) == {1, 2}
+    assert worker_b.find('20250718-003')[0] == 4
+    assert store.load(SHEET).records == snapshot_b.records
+    assert worksheet.reads == 1
+
+
+def test_patches_are_compacted_at_limit(worksheet, store, monkeypatch):
+    monkeypatch.setattr(snapshot_store, 'SNAPSHOT_PATCH_LIMIT', 2)
+    worker_a = make_worker(store)
+    worker_a.get_snapshot()
+    for status in ('核准', '駁回', '已核准'):
+        assert worker_a.apply_cell_updates([(2, 3, status)])
+
+    # 第三次修補寫入完整快照並清除先前的修補紀錄
+    assert store._patches(SHEET) == []
+    assert store.load(SHEET).records[0]['簽核狀態'] == '已核准'
+
+
+def test_invalidate_reaches_other_worker(worksheet, store):
+    worker_a, worker_b = make_worker(store), make_worker(store)
+    worker_a.get_snapshot()
+    worker_b.get_snapshot()
+
+    worksheet.rows.append(['20250718-003', '釘書機', '待簽核'])
+    worker_a.invalidate()
+
+    assert worker_b.find('20250718-003')[0] == 4
+    assert worksheet.reads == 2
+    # worker B 重新讀取後寫回共用儲存，worker A 直接載入
+    assert worker_a.find('20250718-003')[0] == 4
+    assert worksheet.reads == 2
+
+
+def test_save_with_stale_expected_version_is_rejected(store):
+    version = store.save(SHEET, HEADERS, [], True, 0.0, expected_version=0)
+    assert version is not None
+    assert store.save(SHEET, HEADERS, [], True, 0.0, expected_version=0) is None
+
+    store.invalidate(SHEET)
+    assert store.save(SHEET, HEADERS, [], True, 0.0, expected_version=version) is None
+    assert store.load(SHEET) is None
+
+
+def test_load_overtaken_by_invalidate_is_not_saved(worksheet, store):
+    worker_a, worker_b = make_worker(store), make_worker(store)
+    # worker A 讀取期間，worker B 寫入工作表並使快照失效
+    worksheet.on_read = worker_b.invalidate
+    snapshot = worker_a.get_snapshot()
+    worksheet.on_read = None
+
+    assert snapshot.version < 0
+    assert store.load(SHEET) is None
+    assert worker_b.get_snapshot().version > 0
+    assert worksheet.reads == 2
+
+
+def test_patch_on_overwritten_snapshot_invalidates(worksheet, store):
+    worker_a = make_worker(store)
+    worker_a.get_snapshot()
+    # 其他 worker 在修補前的比對之後才寫入新版本
+    original_adopt = worker_a._adopt_stored
+
+    def adopt_then_overwrite():
+        original_adopt()
+        stored = store.load(SHEET)
+        store.save(SHEET, stored.headers, stored.records, stored.numericised, stored.fetched_at)
+
+    worker_a._adopt_stored = adopt_then_overwrite
+    assert worker_a.apply_cell_updates([(2, 3, '已核准')]) is False
+    assert store.load(SHEET) is None
+    assert worker_a._snapshot is None
+
+
+def test_other_worker_loading_serves_stale_snapshot(worksheet, store):
+    worker_a = make_worker(store)
+    stale = worker_a.get_snapshot()
+    worker_a.ttl = 0
+
+    lock = FileLock(f'snapshot_{SHEET}')
+    assert lock.acquire()
+    try:
+        # 其他 worker 正在從 Sheets 讀取，不等待，繼續使用舊快照
+        assert worker_a.get_snapshot() is stale
+        assert worksheet.reads == 1
+    finally:
+        lock.release()
+
+    assert worker_a.get_snapshot() is not stale
+    assert worksheet.reads == 2
+
+
+def test_private_sheet_shares_only_versions(worksheet, store):
+    worker_a, worker_b = make_worker(store, share_records=False), make_worker(store, share_records=False)
+    worker_a.get_snapshot()
+    worker_b.get_snapshot()
+    assert worksheet.reads == 2
+    assert store.load(SHEET) is None
+
+    worksheet.rows[2][2] = '已核准'
+    assert worker_a.apply_cell_updates([(3, 3, '已核准')])
+    assert store.load(SHEET) is None
+    # worker A 沿用修補後的快照，worker B 比對到版本改變後自行重新讀取
+    assert worker_a.find('20250718-002')[1]['簽核狀態'] == '已核准'
+    assert worksheet.reads == 2
+    assert worker_b.find('20250718-002')[1]['簽核狀態'] == '已核准'
+    assert worksheet.reads == 3
+
+
+def test_database_is_private(store):
+    store.state(SHEET)
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(store.path)).st_mode) & 0o077 == 0
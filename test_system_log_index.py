@@ -0,0 +1,124 @@
+"""測試系統日誌查詢索引：游標編碼、跨封存分區合併排序、分頁上限與修補後沿用索引"""
+
+from datetime import date, timedelta
+
+import pytest
+
+import system_log_index
+from conftest import FakeCache, FakePool, FakeWorksheet
+from sheet_cache import SheetSnapshot
+from system_log import LOG_SHEET, archive_sheet_name, hot_cutoff
+
+
+def make_snapshot(title, rows, version=1):
+    records = [{'姓名': name, '登入時間': login, '登出時間': '', '動作': ''} for name, login in rows]
+    return SheetSnapshot(title, ['姓名', '登入時間', '登出時間', '動作'], records, version, 0)
+
+
+@pytest.fixture
+def partitions(monkeypatch):
+    """熱分區加上兩個月的封存分區，同一登入時間出現在不同分區"""
+    old_month = hot_cutoff() - timedelta(days=40)
+    archive_a = archive_sheet_name(old_month.strftime('%Y%m'))
+    archive_b = archive_sheet_name((old_month.replace(day=1) + timedelta(days=32)).strftime('%Y%m'))
+    day_a = old_month.strftime('%Y%m%d')
+    day_hot = date.today().strftime('%Y%m%d')
+    snapshots = {
+        archive_a: make_snapshot(archive_a, [('王', f'{day_a} 08:00'), ('李', f'{day_a} 09:00'), ('王', f'{day_a} 10:00')]),
+        archive_b: make_snapshot(archive_b, [('李', f'{day_a} 09:00'), ('張', f'{day_a} 11:00')]),
+        LOG_SHEET: make_snapshot(LOG_SHEET, [('王', f'{day_hot} 08:00'), ('張', f'{day_hot} 07:00'),
+                                             ('王', f'{day_hot} 09:00')]),
+    }
+    caches = {title: FakeCache(snapshot) for title, snapshot in snapshots.items()}
+    monkeypatch.setattr(system_log_index, 'get_sheet_cache', lambda title: caches[title])
+    pool = FakePool({title: FakeWorksheet(title) for title in snapshots})
+    monkeypatch.setattr(system_log_index, 'get_sheets_pool', lambda: pool)
+    monkeypatch.setattr(system_log_index, '_log_indexes', system_log_index.SystemLogIndexCache())
+    return old_month, caches
+
+
+def collect_pages(limit, **kwargs):
+    records, cursor, pages = [], None, 0
+    while True:
+        result = system_log_index.query_system_log(limit=limit, cursor=cursor, **kwargs)
+        records.extend(result['records'])
+        pages += 1
+        if not result['has_more']:
+            assert result['next_cursor'] is None
+            return records, result['total'], pages
+        cursor = result['next_cursor']
+
+
+def test_cursor_round_trip():
+    entry = ('20250718 08:00', 2, 15)
+    assert system_log_index.decode_cursor(system_log_index.encode_cursor(entry)) == entry
+
+
+@pytest.mark.parametrize('cursor', [None, '', 'not-base64!', 'W10=', 'WyJhIiwgImIiXQ=='])
+def test_invalid_cursor_starts_from_first_page(cursor):
+    assert system_log_index.decode_cursor(cursor) is None
+
+
+def test_merge_across_archives_in_order(partitions):
+    old_month, _ = partitions
+    records, total, pages = collect_pages(2, start=old_month, order='asc')
+    logins = [record['登入時間'] for record in records]
+    assert total == 8
+    assert len(records) == 8
+    assert pages == 4
+    assert logins == sorted(logins)
+
+    records_desc, _, _ = collect_pages(3, start=old_month, order='desc')
+    assert [record['登入時間'] for record in records_desc] == sorted(logins, reverse=True)
+
+
+def test_same_login_time_in_two_partitions_is_not_skipped(partitions):
+    old_month, _ = partitions
+    # 每頁一筆，游標剛好停在兩個分區相同的登入時間之間
+    records, _, _ = collect_pages(1, start=old_month, order='asc')
+    names_at_nine = [record['姓名'] for record in records if record['登入時間'].endswith('09:00')
+                     and not record['登入時間'].startswith(date.today().strftime('%Y%m%d'))]
+    assert names_at_nine == ['李', '李']
+
+
+def test_hot_partition_only_without_old_start(partitions):
+    records, total, _ = collect_pages(10)
+    assert total == 3
+    assert [record['登入時間'][-5:] for record in records] == ['09:00', '08:00', '07:00']
+
+
+def test_name_and_date_filters(partitions):
+    old_month, _ = partitions
+    records, total, _ = collect_pages(10, name='王', start=old_month, end=old_month, order='asc')
+    assert total == 2
+    assert [record['登入時間'][-5:] for record in records] == ['08:00', '10:00']
+
+
+def test_page_size_limits(partitions):
+    old_month, _ = partitions
+    assert len(system_log_index.query_system_log(start=old_month, limit=0)['records']) == 1
+    big = system_log_index.query_system_log(start=old_month, limit=system_log_index.MAX_PAGE_SIZE + 100)
+    assert len(big['records']) == 8
+    assert big['has_more'] is False
+
+
+def test_patched_index_matches_rebuild(partitions):
+    _, caches = partitions
+    cache = caches[LOG_SHEET]
+    system_log_index.query_system_log()
+    before = system_log_index._log_indexes.get(LOG_SHEET, 0)
+
+    snapshot = cache.snapshot
+    records = list(snapshot.records)
+    records[0] = dict(records[0], 登出時間='20991231 18:00')
+    records.append({'姓名': '陳', '登入時間': '20000101 06:00', '登出時間': '', '動作': ''})
+    cache.snapshot = SheetSnapshot(LOG_SHEET, snapshot.headers, records, snapshot.version + 1, 0,
+                                   patch_log=((snapshot.version, frozenset({0, len(records) - 1})),))
+
+    patched = system_log_index._log_indexes.get(LOG_SHEET, 0)
+    rebuilt = system_log_index.SystemLogIndex(LOG_SHEET, 0, patched.version, records)
+    assert patched is not before
+    assert patched.entries == rebuilt.entries
+    assert patched.by_name == rebuilt.by_name
+    # 原索引不受影響
+    assert len(before.entries) == 3
@@ -0,0 +1,221 @@
+"""
+使用者目錄模組
+以使用者帳號工作表的快照建立帳號與姓名索引，登入驗證與使用者資料查詢都由記憶體完成；
+新增、修改、刪除使用者時依快取的列號直接寫入，並同步修補或使快照失效
+"""
+
+from typing import Dict, Any, Optional, List, Tuple
+
+from file_lock import FileLock
+from sheets_client import get_sheets_pool
+from sheet_cache import get_sheet_cache, SheetSnapshot
+
+USER_SHEET = '使用者帳號'
+
+# 使用者帳號工作表的欄位順序（A:E）
+USER_COLUMNS = ['姓名', '帳號', '密碼', '角色', 'mail']
+
+
+def user_profile(record: Dict[str, Any]) -> Dict[str, Any]:
+    """由使用者記錄取出姓名、mail與role"""
+    return {
+        'name': record.get('姓名', ''),
+        'mail': record.get('mail', ''),
+        'role': record.get('角色', '')
+    }
+
+
+def _build_index(records: List[Dict[str, Any]], column: str) -> Dict[str, int]:
+    # 重複值以第一筆為準（與原本逐筆搜尋的結果相同）
+    index = {}
+    for i, record in enumerate(records):
+        value = str(record.get(column, '')).strip()
+        if value:
+            index.setdefault(value, i)
+    return index
+
+
+class UserDirectory:
+    """使用者目錄
+
+    索引依快照版本建立，快照更新或修補後第一次查詢時重建；
+    快照存活時間由 USER_CACHE_TTL 設定（預設 300 秒）。
+    """
+
+    def __init__(self):
+        # (快照版本, 帳號索引, 姓名索引)，整組替換確保索引與快照一致
+        self._index = (None, {}, {})
+
+    def _snapshot(self, force: bool = False) -> Tuple[SheetSnapshot, Dict[str, int], Dict[str, int]]:
+        snapshot = get_sheet_cache(USER_SHEET).get_snapshot(force=force)
+        version, by_account, by_name = self._index
+        if version != snapshot.version:
+            by_account = _build_index(snapshot.records, '帳號')
+            by_name = _build_index(snapshot.records, '姓名')
+            self._index = (snapshot.version, by_account, by_name)
+        return snapshot, by_account, by_name
+
+    def get_users(self) -> List[Dict[str, Any]]:
+        """取得所有使用者記錄副本"""
+        return get_sheet_cache(USER_SHEET).get_records()
+
+    def find_account(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        依帳號取得使用者記錄
+
+        Args:
+            username: 帳號
+
+        Returns:
+            使用者記錄副本，找不到時為 None
+        """
+        snapshot, by_account, by_name = self._snapshot()
+        index = by_account.get(str(username or '').strip())
+        if index is None:
+            return None
+        return dict(snapshot.records[index])
+
+    def find_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        依姓名取得使用者記錄
+
+        Args:
+            name: 姓名
+
+        Returns:
+            使用者記錄副本，找不到時為 None
+        """
+        snapshot, by_account, by_name = self._snapshot()
+        index = by_name.get(str(name or '').strip())
+        if index is None:
+            return None
+        return dict(snapshot.records[index])
+
+    def get_profile(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        依帳號取得使用者資料
+
+        Args:
+            username: 帳號
+
+        Returns:
+            {'name', 'mail', 'role'}，找不到時為 None
+        """
+        record = self.find_account(username)
+        return user_profile(record) if record else None
+
+    def authenticate(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        """
+        驗證帳號密碼並同時取得使用者資料
+
+        Args:
+            username: 帳號
+            password: 密碼
+
+        Returns:
+            驗證成功時為使用者資料，否則為 None
+        """
+        record = self.find_account(username)
+        if record is None or str(record.get('密碼', '')) != str(password):
+            return None
+        return user_profile(record)
+
+    def _locate(self, worksheet, username: str) -> Optional[int]:
+        """
+        取得帳號所在的工作表列號（鎖內呼叫）
+
+        快取的列號只以該列的帳號儲存格確認一次；工作表在快取期間被直接修改而對不上時，
+        強制重新讀取快照後再定位
+        """
+        username = str(username or '').strip()
+        for force in (False, True):
+            snapshot, by_account, by_name = self._snapshot(force=force)
+            index = by_account.get(username)
+            if index is None:
+                if force:
+                    return None
+                continue
+            row = snapshot.row_number(index)
+            account_col = snapshot.headers.index('帳號') + 1
+            if str(worksheet.cell(row, account_col).value or '').strip() == username:
+                return row
+            print(f"DEBUG: 使用者目錄第 {row} 列已不是帳號 {username}，重新讀取")
+        return None
+
+    def add_user(self, values: List[Any]):
+        """
+        新增使用者
+
+        Args:
+            values: 依 USER_COLUMNS 順序的欄位值
+        """
+        worksheet = get_sheets_pool().get_worksheet(USER_SHEET)
+        with FileLock('user_directory'):
+            worksheet.append_row(values)
+        # 新增列改變了快照結構，下次查詢重新載入
+        self.invalidate()
+
+    def update_user(self, username: str, values: List[Any]) -> bool:
+        """
+        依快取的列號更新使用者資料，並同步修補快照
+
+        Args:
+            username: 要更新的帳號
+            values: 依 USER_COLUMNS 順序的欄位值
+
+        Returns:
+            是否找到並更新該帳號
+        """
+        worksheet = get_sheets_pool().get_worksheet(USER_SHEET)
+        with FileLock('user_directory'):
+            row = self._locate(worksheet, username)
+            if row is None:
+                return False
+            worksheet.update([values], f'A{row}:E{row}')
+        get_sheet_cache(USER_SHEET).apply_cell_updates(
+            [(row, col, value) for col, value in enumerate(values, 1)]
+        )
+        return True
+
+    def delete_user(self, username: str) -> bool:
+        """
+        依快取的列號刪除使用者
+
+        Args:
+            username: 要刪除的帳號
+
+        Returns:
+            是否找到並刪除該帳號
+        """
+        worksheet = get_sheets_pool().get_worksheet(USER_SHEET)
+        with FileLock('user_directory'):
+            row = self._locate(worksheet, username)
+            if row is None:
+                return False
+            worksheet.delete_rows(row)
+            # 刪除列後其下各列列號改變，快照需重新載入
+            self.invalidate()
+        return True
+
+    def invalidate(self):
+        """使用者帳號工作表被修改後呼叫，下次查詢時重新載入"""
+        get_sheet_cache(USER_SHEET).invalidate()
+
+
+# 全域使用者目錄實例
+_user_directory = None
+
+
+def get_user_directory() -> UserDirectory:
+    """
+    取得全域使用者目錄實例
+
+    Returns:
+        UserDirectory 實例
+    """
+    global _user_directory
+
+    if _user_directory is None:
+        _user_directory = UserDirectory()
+
+    return _user_directory